@@ -1,19 +1,724 @@
 import streamlit as st
-from g4f.client import Client
-import base64
-from io import BytesIO
-import requests
-from datetime import datetime
+import functools
+from collections import Counter
+from concurrent.futures import FIRST_COMPLETED, wait
+from dataclasses import replace
 import os
+import re
+import time
+import uuid
+import metrics
+from async_generator import AsyncPlanGenerator, wait_all
+from city_data import format_inr, load_city_data
+from cost_estimator import cost_spec, estimate_costs
+from image_utils import image_extension, make_thumbnail
+from layout_engine import plan_layout, render_png
+from layout_search import make_pool, search_layouts
+from plan_cache import PlanCache, SQLitePlanCache
+from plan_generator import (
+    EDIT, GENERATE, IMAGE_MODELS, REUSE, VARIANT_AXES, PlanSpec, floor_label, floor_specs, preview_spec,
+    regeneration_steps, spec_diff, variant_label, variant_specs,
+)
+from plan_jobs import DONE, QUEUED, RUNNING, JobManager, SQLiteJobQueue
+from pdf_export import export_plan_pdf
+from plan_store import SQLitePlanStore
+from provider_router import ProviderRouter
+from rate_limiter import AdmissionQueue, SQLiteAdmissionQueue
+
+
+SAVED_PLANS_PAGE_SIZE = 10
+# Point several app processes (or machines sharing a volume) at one directory to share
+# the plan cache, job queue, saved plans and rate limit
+SHARED_STATE_DIR = os.environ.get("SHARED_STATE_DIR")
+PROFILE_DIR = os.environ.get("PROFILE_DIR", "profiles")
+GENERATION_TIMEOUT = float(os.environ.get("GENERATION_TIMEOUT", "180"))  # seconds
+PROVIDER_TIMEOUT = float(os.environ.get("PROVIDER_TIMEOUT", "60"))  # seconds per model attempt before failing over
+VARIANT_CONCURRENCY = int(os.environ.get("VARIANT_CONCURRENCY", "6"))
+LAYOUT_CANDIDATES = int(os.environ.get("LAYOUT_CANDIDATES", "4000"))  # per floor
+LAYOUT_TOP_K = 3
+HOUSE_STYLES = ["Modern", "Traditional", "Contemporary", "Farmhouse", "Minimalist", "Mediterranean", "Custom"]
+LAYOUT_PREFERENCES = ["Open Floor Plan", "Compartmentalized", "Mixed"]
+RENDER_STYLES = ["Blueprint (2D)", "Detailed Floor Plan (2D)", "3D Floor Plan", "Isometric View"]
+COLOR_SCHEMES = ["Blueprint (Blue/White)", "Grayscale", "Colored"]
+
+
+@st.cache_resource
+def start_metrics():
+    # Exporters are process-wide; each is enabled by its environment variable
+    if os.environ.get("METRICS_PORT"):
+        metrics.start_http_server(int(os.environ["METRICS_PORT"]))
+    if os.environ.get("METRICS_FILE"):
+        metrics.start_file_exporter(os.environ["METRICS_FILE"])
+    if os.environ.get("TIMING_LOG"):
+        metrics.log_to_file(os.environ["TIMING_LOG"])
+
+
+def state_path(env, name, default):
+    # An explicit setting wins; otherwise shared state lives under SHARED_STATE_DIR
+    return os.environ.get(env) or (os.path.join(SHARED_STATE_DIR, name) if SHARED_STATE_DIR else default)
+
+
+@st.cache_resource
+def get_plan_cache():
+    # One cache per process, shared by every session (and every process with SHARED_STATE_DIR)
+    ttl = os.environ.get("PLAN_CACHE_TTL")
+    cache_class = SQLitePlanCache if SHARED_STATE_DIR else PlanCache
+    return cache_class(
+        state_path("PLAN_CACHE_DIR", "cache", ".plan_cache"),
+        max_bytes=int(os.environ.get("PLAN_CACHE_MAX_MB", "512")) * 1024 * 1024,
+        ttl=float(ttl) if ttl else None,
+    )
+
+
+@st.cache_resource
+def get_plan_store():
+    # Saved plans outlive sessions and restarts
+    return SQLitePlanStore(state_path("PLAN_STORE_DIR", "plans", ".plan_store"))
+
+
+@st.cache_resource
+def get_router():
+    # Shared so latency/error stats from every session steer the next request
+    models = [m.strip() for m in os.environ.get("IMAGE_MODELS", ",".join(IMAGE_MODELS)).split(",") if m.strip()]
+    return ProviderRouter(models, race=int(os.environ.get("PROVIDER_RACE", "2")), timeout=PROVIDER_TIMEOUT)
+
+
+@st.cache_resource
+def get_generator():
+    # One event loop, g4f client and connection pool per process, so
+    # generations from every session overlap instead of queuing
+    router = get_router()
+    return AsyncPlanGenerator(
+        model=router.primary, cache=get_plan_cache(), router=router, generate_timeout=PROVIDER_TIMEOUT,
+    )
+
+
+@st.cache_resource
+def get_city_data():
+    # Loaded once per process from data/cities.json
+    return load_city_data()
+
+
+@st.cache_data
+def city_tables(city):
+    # Display tables per city, built once and reused on every rerun
+    city_data = get_city_data()
+    materials = city_data.material_rows(city)
+    builders = city_data.builder_rows(city)
+    solar = city_data.solar_rows(city)
+    return {
+        "materials": {
+            "Material": [row[0] for row in materials],
+            "Approx. Cost": [row[1] for row in materials],
+            "Supplier/Contact": [row[2] for row in materials]
+        },
+        "builders": {
+            "Builder": [row[0] for row in builders],
+            "Approx. Budget": [row[1] for row in builders],
+            "Contact": [row[2] for row in builders]
+        },
+        "solar": {
+            "Company": [row[0] for row in solar],
+            "Approx. Cost": [row[1] for row in solar],
+            "Contact": [row[2] for row in solar]
+        },
+    }
+
+
+@st.cache_resource
+def get_admission_queue():
+    # Keeps upstream calls at the provider's sustainable rate; set
+    # RATE_LIMIT_DB to share one limit between several app processes
+    rate = float(os.environ.get("GENERATIONS_PER_MINUTE", "30")) / 60
+    burst = int(os.environ.get("GENERATION_BURST", "6"))
+    path = state_path("RATE_LIMIT_DB", "rate_limit.db", None)
+    return SQLiteAdmissionQueue(path, rate, burst) if path else AdmissionQueue(rate, burst)
+
+
+def admit_parts(parts):
+    # Parts that will reach the provider wait their turn in the admission queue,
+    # paying for every model the router races them on
+    plan_cache = get_plan_cache()
+    router = get_router()
+    misses = sum(1 for part in parts if part.cache_key(router.primary) not in plan_cache)
+    status = st.empty()
+    get_admission_queue().admit(
+        misses * router.calls_per_request, timeout=GENERATION_TIMEOUT,
+        on_wait=lambda position, eta: status.info(f"⏳ You are #{position} in the queue, starting in about {eta:.0f}s"),
+    )
+    status.empty()
+
+
+def generate_parts(parts):
+    admit_parts(parts)
+    
+    # Fan out one request per part and wait for all of them together
+    generator = get_generator()
+    return wait_all([generator.submit(part) for part in parts], GENERATION_TIMEOUT)
+
+
+def generate_each(parts, on_done, limit=VARIANT_CONCURRENCY):
+    # Reports each part as soon as it finishes. Cache hits are sent first and
+    # fill in at once; only the misses wait in the admission queue, with at
+    # most `limit` of them in flight
+    plan_cache = get_plan_cache()
+    model = get_router().primary
+    cached = [part.cache_key(model) in plan_cache for part in parts]
+    generator = get_generator()
+    for hits in (True, False):
+        waiting = [(n, part) for n, part in enumerate(parts) if cached[n] == hits]
+        if not waiting:
+            continue
+        if not hits:
+            admit_parts([part for _, part in waiting])
+        running = {}
+        deadline = time.monotonic() + GENERATION_TIMEOUT
+        while waiting or running:
+            while waiting and (hits or len(running) < limit):
+                n, part = waiting.pop(0)
+                running[generator.submit(part)] = n
+            done, _ = wait(running, timeout=max(0.0, deadline - time.monotonic()), return_when=FIRST_COMPLETED)
+            if not done:
+                for future in running:
+                    future.cancel()
+                raise TimeoutError(f"The image provider did not respond within {GENERATION_TIMEOUT:.0f}s")
+            for future in done:
+                on_done(running.pop(future), future)
+
+
+@st.cache_resource
+def get_job_manager():
+    # One worker pool for every session; jobs keep running across reruns. With
+    # SHARED_STATE_DIR the queue is shared and any process may run a job
+    queue = SQLiteJobQueue(os.path.join(SHARED_STATE_DIR, "jobs.db")) if SHARED_STATE_DIR else None
+    return JobManager(
+        get_generator(), get_plan_store(), admission=get_admission_queue(),
+        workers=int(os.environ.get("JOB_WORKERS", "8")), timeout=GENERATION_TIMEOUT, queue=queue,
+    )
+
+
+def session_owner():
+    # Plans and jobs belong to the token in the URL rather than to the session, so
+    # they follow the user to whichever process serves them; bookmark the URL to keep them
+    owner = st.query_params.get("user", "")
+    if not re.fullmatch(r"[0-9a-f]{32}", owner):
+        owner = uuid.uuid4().hex
+        st.query_params["user"] = owner
+    return owner
+
+
+def collect_finished_jobs():
+    # The newest finished plan becomes this session's current plan, whichever tab
+    # is open; failed jobs stay listed until dismissed
+    manager = get_job_manager()
+    jobs = manager.jobs_for(st.session_state.owner)
+    for job in jobs:
+        if job.status == DONE:
+            st.session_state.current_plan = job.plan_id
+            manager.dismiss(job.id)
+    st.session_state.jobs = [job.id for job in jobs if job.status != DONE]
+
+
+def dismiss_job(job_id):
+    get_job_manager().dismiss(job_id)
+    st.session_state.jobs.remove(job_id)
+
+
+def session_jobs():
+    manager = get_job_manager()
+    return [job for job in map(manager.get, st.session_state.jobs) if job is not None]
+
+
+def job_status():
+    # Polls this session's jobs every 2s without rerunning the whole page, but
+    # only while one of them is still queued or running
+    polling = any(not job.done for job in session_jobs())
+    st.fragment(job_list, run_every=2 if polling else None)(polling)
+
+
+def job_list(polling):
+    jobs = session_jobs()
+    # A full rerun shows finished plans, and stops polling once nothing is left to wait for
+    if any(job.status == DONE for job in jobs) or (polling and all(job.done for job in jobs)):
+        st.rerun()
+    for job in jobs:
+        name = f"{job.spec.length}' x {job.spec.width}' {job.spec.style}, {job.spec.bedrooms} bedrooms"
+        if job.status == QUEUED:
+            place = f"#{job.position} in the queue, starting in about {job.eta:.0f}s" if job.position else "starting"
+            st.info(f"⏳ {name}: {place}")
+        elif job.status == RUNNING:
+            st.info(f"🔄 {name}: generating ({time.time() - job.submitted:.0f}s)")
+        else:
+            st.error(f"❌ Failed to generate the house plan ({name}).")
+            st.code(job.error)
+            with st.expander("Schematic layout generated locally"):
+                for label, png in layout_preview(job.spec):
+                    st.image(png, caption=label, width="stretch")
+            st.button("Dismiss", key=f"dismiss_{job.id}", on_click=dismiss_job, args=(job.id,))
+
+
+@st.cache_data
+def cost_estimate(spec):
+    # Called with cost_spec(...), so edits that don't change quantities reuse the estimate
+    return estimate_costs(spec, get_city_data())
+
+
+@st.cache_data
+def layout_preview(spec):
+    # Local schematic per floor; takes milliseconds and needs no network
+    return [(layout.label, render_png(layout, spec)) for layout in plan_layout(spec)]
+
+
+@st.cache_resource
+def get_layout_pool():
+    # Worker processes are started once and shared by every session
+    workers = os.environ.get("LAYOUT_WORKERS")
+    return make_pool(int(workers) if workers else None)
+
+
+@st.cache_data(show_spinner=False)
+def layout_search(spec):
+    # Deterministic for a given spec, so repeated searches are free
+    results = search_layouts(spec, candidates=LAYOUT_CANDIDATES, top_k=LAYOUT_TOP_K, executor=get_layout_pool())
+    return [
+        (result, [(layout.label, render_png(layout, spec)) for layout in result.floors])
+        for result in results
+    ]
+
+
+@st.fragment
+def plan_panel(base_spec):
+    # Rendering options, previews and results rerun on their own, without the
+    # form, the city tables or the other tabs
+    st.header("🏗️ Preview & Generate")
+
+    # Visualization style options
+    render_style = st.selectbox(
+        "Rendering Style",
+        options=RENDER_STYLES
+    )
+
+    furniture_detail = st.slider("Furniture Detail Level", min_value=0, max_value=3, value=2, 
+                                help="0: No furniture, 3: Highly detailed furniture")
+
+    # Color scheme
+    color_scheme = st.radio(
+        "Color Scheme",
+        options=COLOR_SCHEMES,
+        horizontal=True
+    )
+
+    # Resolution settings
+    resolution = st.select_slider(
+        "Image Resolution",
+        options=["Standard", "High", "Ultra High"],
+        value="High"
+    )
+
+    # Separate images read far better than one crowded multi-floor render
+    per_floor = False
+    if base_spec.num_floors > 1:
+        per_floor = st.checkbox(
+            "Generate each floor as a separate plan", value=True,
+            help="All floors are generated at the same time, so this takes about as long as a single floor"
+        )
+
+    # The submitted form plus this panel's rendering options
+    spec = replace(
+        base_spec,
+        render_style=render_style,
+        furniture_detail=furniture_detail,
+        color_scheme=color_scheme,
+        resolution=resolution,
+    )
+
+    with st.expander("⚡ Instant layout preview"):
+        st.caption("A quick schematic with true room dimensions, generated locally.")
+        for label, png in layout_preview(spec):
+            st.image(png, caption=label, width="stretch")
+
+    # Layout search: score thousands of local arrangements and pass the winner's room sizes to the prompt
+    with st.expander("🧮 Optimize room layout"):
+        st.caption(
+            f"Scores {LAYOUT_CANDIDATES:,} arrangements per floor on space use, room adjacency, circulation "
+            "and orientation hints in your special instructions (e.g. \"east-facing bedrooms\")."
+        )
+        if st.button("Search layouts 🧮"):
+            with st.spinner("🔄 Searching layouts..."):
+                layout_search(spec)
+                st.session_state.layout_search = {"spec": spec, "choice": 0}
+        searched = st.session_state.get("layout_search")
+        if searched and searched["spec"] == spec:
+            results = layout_search(spec)
+            choice = st.radio(
+                "Room dimensions to use in the prompt",
+                range(len(results) + 1),
+                index=searched["choice"],
+                format_func=lambda n: "Let the image model decide" if n == 0 else f"Layout {n} (score {results[n - 1][0].score:.2f})",
+                horizontal=True,
+            )
+            searched["choice"] = choice
+            columns = st.columns(len(results))
+            for column, (n, (result, pages)) in zip(columns, enumerate(results, 1)):
+                with column:
+                    for label, png in pages:
+                        st.image(png, caption=f"Layout {n}: {label}", width="stretch")
+                    st.caption(" · ".join(f"{name} {value:.2f}" for name, value in result.breakdown.items()))
+            if choice:
+                spec = replace(spec, room_dimensions=results[choice - 1][0].room_dimensions())
+    # What "Regenerate" in My Saved Plans applies to a saved plan
+    st.session_state.current_spec, st.session_state.current_per_floor = spec, per_floor
+
+    # Two stages: a cheap draft first, the full-resolution render only once confirmed
+    plan_cache = get_plan_cache()
+    if st.button("Preview Plan ⚡", type="primary",
+                 help="A quick low-resolution draft; the full-resolution plan is generated once you confirm"):
+        with st.spinner("🔄 Drafting a quick preview..."):
+            try:
+                draft = preview_spec(spec)
+                results = generate_parts(floor_specs(draft) if per_floor else [draft])
+                st.session_state.preview = {
+                    "spec": spec,
+                    "per_floor": per_floor,
+                    "pages": [(floor_label(r.spec.floor) if per_floor else None, r.image_data) for r in results],
+                }
+            except Exception as e:
+                st.error("❌ Failed to generate a preview.")
+                st.code(str(e))
+                st.warning("Here is a schematic layout generated locally in the meantime.")
+                for label, png in layout_preview(spec):
+                    st.image(png, caption=label, width="stretch")
+
+    preview = st.session_state.get("preview")
+    if preview and (preview["spec"], preview["per_floor"]) != (spec, per_floor):
+        st.info("The specifications changed since the last preview. Preview again before generating the full plan.")
+    elif preview:
+        st.subheader("Draft Preview")
+        for label, image_data in preview["pages"]:
+            st.image(image_data, caption=f"{label or 'Your Custom House Plan'} (draft)", width="stretch")
+
+        if st.button(f"Looks good, generate in {spec.resolution} resolution 🚀"):
+            # Runs in the background, so the form stays usable and more variants can be queued
+            job_id = get_job_manager().submit(
+                spec, per_floor, thumbnail=make_thumbnail(preview["pages"][0][1]), owner=st.session_state.owner,
+            )
+            st.session_state.jobs.append(job_id)
+            st.toast("Your plan is queued and will appear here when it's ready.")
+
+    job_status()
+
+    # Compare variants: quick drafts of the current design across several styles at once
+    with st.expander("🔀 Compare variants"):
+        axes = {
+            "render_style": st.multiselect("Rendering styles", RENDER_STYLES, default=[render_style]),
+            "color_scheme": st.multiselect("Color schemes", COLOR_SCHEMES, default=[color_scheme]),
+            "layout_preference": st.multiselect("Layouts", LAYOUT_PREFERENCES, default=[spec.layout_preference]),
+            "house_style": st.multiselect(
+                "House styles", [s for s in HOUSE_STYLES if s != "Custom"],
+                default=[spec.house_style] if spec.house_style != "Custom" else [],
+            ),
+        }
+        variants = variant_specs(preview_spec(spec), axes)
+        varied = [name for name in VARIANT_AXES if len(axes[name]) > 1]
+        st.caption(f"{len(variants)} variant(s); drafts are generated {VARIANT_CONCURRENCY} at a time and appear as they finish.")
+
+        if st.button(f"Generate {len(variants)} variants 🔀", disabled=len(variants) < 2):
+            columns = st.columns(3)
+            cells = [columns[n % 3].empty() for n in range(len(variants))]
+            labels = [variant_label(variant, varied) for variant in variants]
+            for cell, label in zip(cells, labels):
+                cell.info(f"⏳ {label}")
+            results = [None] * len(variants)
+
+            def show_variant(n, future):
+                if future.exception() is not None:
+                    results[n] = (labels[n], None, str(future.exception()))
+                    cells[n].error(f"❌ {labels[n]}: {future.exception()}")
+                else:
+                    results[n] = (labels[n], future.result().image_data, None)
+                    cells[n].image(results[n][1], caption=labels[n], width="stretch")
+
+            try:
+                generate_each(variants, show_variant)
+            except Exception as e:
+                st.error("❌ Failed to generate all variants.")
+                st.code(str(e))
+            st.session_state.variants = {"spec": spec, "results": [r for r in results if r is not None]}
+
+        elif st.session_state.get("variants", {}).get("spec") == spec:
+            # Results of the last comparison stay visible across reruns
+            columns = st.columns(3)
+            for n, (label, image_data, error) in enumerate(st.session_state.variants["results"]):
+                if image_data is None:
+                    columns[n % 3].error(f"❌ {label}: {error}")
+                else:
+                    columns[n % 3].image(image_data, caption=label, width="stretch")
+
+    # The most recently finished plan of this session
+    render_started = time.perf_counter()
+    plan_store = get_plan_store()
+    current = plan_store.get(st.session_state.current_plan) if st.session_state.get("current_plan") else None
+    if current:
+        st.success("🎉 Your house plan has been generated successfully!")
+        timestamp = current["timestamp"]
+        # Served from the stored files, display-sized where one was made;
+        # the full-size bytes are only read when downloaded
+        pages = [
+            {**page, "path": plan_store.image_path(page["display_hash"] or page["image_hash"])}
+            for page in current["pages"]
+        ]
+
+        # Display the image(s)
+        for page in pages:
+            st.image(page["path"], caption=page["label"] or "Your Custom House Plan", width="stretch")
+        source_bytes = sum(page["source_bytes"] or 0 for page in pages)
+        if source_bytes:
+            stored_bytes = sum(
+                os.path.getsize(plan_store.image_path(page["image_hash"])) for page in pages if page["source_bytes"]
+            )
+            st.caption(
+                f"🗜️ Images optimized: {source_bytes / 1024:,.0f} KB → {stored_bytes / 1024:,.0f} KB"
+                f" ({1 - stored_bytes / source_bytes:.0%} smaller)"
+            )
+
+        # Download options
+        col_down1, col_down2 = st.columns(2)
+
+        with col_down1:
+            for page in pages:
+                extension = image_extension(page["mime"])
+                kind = extension[1:].upper()
+                label = f"📥 Download {page['label']} {kind}" if page["label"] else f"📥 Download {kind}"
+                suffix = f"_{page['label'].lower().replace(' ', '_')}" if page["label"] else ""
+                st.download_button(
+                    label=label,
+                    data=functools.partial(plan_store.load_image, page["image_hash"]),
+                    file_name=f"house_plan_{timestamp.replace(':', '-').replace(' ', '_')}{suffix}{extension}",
+                    mime=page["mime"] or "image/jpeg"
+                )
+
+        with col_down2:
+            st.download_button(
+                label="📄 Download as PDF",
+                data=functools.partial(plan_pdf, current["id"]),
+                file_name=f"house_plan_{timestamp.replace(':', '-').replace(' ', '_')}.pdf",
+                mime="application/pdf"
+            )
+
+        # Display house specs
+        with st.expander("House Plan Specifications", expanded=True):
+            st.markdown(f"""
+            **House Dimensions:** {current['specs']['dimensions']}  
+            **Number of Floors:** {current['specs']['floors']}  
+            **Bedrooms:** {current['specs']['bedrooms']}  
+            **Bathrooms:** {current['specs']['bathrooms']}  
+            **Style:** {current['specs']['style']}  
+            **Layout:** {current['specs'].get('layout', '')}  
+            **Features:** {current['specs'].get('features', '')}  
+            """)
+        metrics.record("render", time.perf_counter() - render_started,
+                       model="", render_style=current["specs"].get("render_style", ""), resolution="")
+
+    if current or st.session_state.jobs:
+        cache_stats = plan_cache.stats()
+        generator_stats = get_generator().stats()
+        st.caption(
+            f"Plan cache: {cache_stats['hits']} hits / {cache_stats['misses']} misses, "
+            f"{cache_stats['entries']} plans ({cache_stats['bytes'] / (1024 * 1024):.1f} MB); "
+            f"{generator_stats['coalesced']} of {generator_stats['requests']} requests shared an in-flight generation"
+        )
+        st.caption("Image models: " + " · ".join(
+            f"{p['model']} {p['p50']:.1f}s, {p['error_rate']:.0%} errors" if p["p50"] is not None
+            else f"{p['model']} (no data yet)"
+            for p in get_router().stats()
+        ))
+
+
+def regenerate(plan):
+    # Applies the Generate Plan tab's current specifications to a saved plan; the job
+    # copies floors whose image inputs are unchanged and edits those where only the look changed
+    old_spec = PlanSpec.from_dict(plan["spec"])
+    old_per_floor = plan["pages"][0]["label"] is not None
+    spec = st.session_state.get("current_spec", old_spec)
+    per_floor = st.session_state.get("current_per_floor", old_per_floor)
+    changes = spec_diff(old_spec, spec)
+    if not changes and per_floor == old_per_floor:
+        st.toast("This plan already matches the current specifications. Change them in the Generate Plan tab first.")
+        return
+    steps = Counter(action for _, action, _ in regeneration_steps(old_spec, old_per_floor, spec, per_floor))
+    job_id = get_job_manager().submit(spec, per_floor, owner=st.session_state.owner, base_plan=plan["id"])
+    st.session_state.jobs.append(job_id)
+    changed = ", ".join(name.replace("_", " ") for name in changes) or "floor split"
+    st.session_state.notice = (
+        f"Regenerating with new {changed}: {steps[REUSE]} image(s) reused, {steps[EDIT]} edited "
+        f"and {steps[GENERATE]} generated. It will appear in the Generate Plan tab when it's ready."
+    )
+    # A full rerun so the Generate Plan tab starts polling for the new job
+    st.rerun()
+
+
+def show_more_plans():
+    st.session_state.saved_plans_shown += SAVED_PLANS_PAGE_SIZE
+
+
+@st.fragment
+def saved_plans_list():
+    # Paging and deleting rerun only this list
+
+    if 'saved_plans' not in st.session_state or not st.session_state.saved_plans:
+        st.info("You haven't generated any plans yet. Go to the 'Generate Plan' tab to create one!")
+    else:
+        st.caption("Your plans are tied to this page's address; bookmark it to come back to them.")
+        render_started = time.perf_counter()
+        plan_store = get_plan_store()
+        if "saved_plans_shown" not in st.session_state:
+            st.session_state.saved_plans_shown = SAVED_PLANS_PAGE_SIZE
+        shown_ids = st.session_state.saved_plans[:st.session_state.saved_plans_shown]
+
+        # Display saved plans; only thumbnails are sent to the browser
+        for i, plan in enumerate(plan_store.get_many(shown_ids)):
+            first_page = plan["pages"][0]
+            image_hash = first_page["image_hash"]
+            col1, col2 = st.columns([1, 3])
+
+            with col1:
+                # Thumbnail served from the local blob file
+                st.image(plan_store.image_path(plan["thumbnail_hash"] or image_hash), width=200)
+
+            with col2:
+                st.markdown(f"**Plan #{i+1}** - Generated on {plan['timestamp']}")
+                if len(plan["pages"]) > 1:
+                    st.caption(" · ".join(page["label"] for page in plan["pages"]))
+                st.markdown(f"""
+                - **Dimensions:** {plan['specs']['dimensions']}
+                - **Floors:** {plan['specs']['floors']}
+                - **Bedrooms:** {plan['specs']['bedrooms']}
+                - **Bathrooms:** {plan['specs']['bathrooms']}
+                - **Style:** {plan['specs']['style']}
+                """)
+
+                # Action buttons
+                btn_col1, btn_col2, btn_col3 = st.columns(3)
+
+                with btn_col1:
+                    st.download_button(
+                        "📥 Download",
+                        data=functools.partial(plan_store.load_image, image_hash),
+                        file_name=f"house_plan_{plan['timestamp'].replace(':', '-').replace(' ', '_')}"
+                                  f"{image_extension(first_page['mime'])}",
+                        mime=first_page["mime"] or "image/jpeg",
+                        key=f"download_{i}"
+                    )
+                    st.download_button(
+                        "📄 PDF",
+                        data=functools.partial(plan_pdf, plan["id"]),
+                        file_name=f"house_plan_{plan['timestamp'].replace(':', '-').replace(' ', '_')}.pdf",
+                        mime="application/pdf",
+                        key=f"download_pdf_{i}"
+                    )
+
+                with btn_col2:
+                    if st.button(
+                        f"🔄 Regenerate #{i+1}", key=f"regen_{i}", disabled=not plan["spec"],
+                        help="Apply the current specifications from the Generate Plan tab, reusing whatever hasn't changed"
+                        if plan["spec"] else "This plan was saved before full specifications were recorded",
+                    ):
+                        regenerate(plan)
+
+                with btn_col3:
+                    if st.button(f"🗑️ Delete #{i+1}", key=f"del_{i}"):
+                        # Add confirmation
+                        st.session_state.delete_plan = i
+                        st.warning(f"Are you sure you want to delete Plan #{i+1}?")
+
+                        conf_col1, conf_col2 = st.columns(2)
+                        with conf_col1:
+                            if st.button("✓ Yes, Delete", key=f"confirm_del_{i}"):
+                                plan_store.delete(st.session_state.saved_plans.pop(i))
+                                st.rerun(scope="fragment")
+                        with conf_col2:
+                            if st.button("✗ Cancel", key=f"cancel_del_{i}"):
+                                del st.session_state.delete_plan
+                                st.rerun(scope="fragment")
+
+            st.markdown("---")
+
+        metrics.record("render", time.perf_counter() - render_started, **metrics.spec_labels(None))
+
+        remaining = len(st.session_state.saved_plans) - len(shown_ids)
+        if remaining > 0:
+            st.button(f"Load more ({remaining} older)", key="load_more_plans", on_click=show_more_plans)
+
+        # Clear all button
+        if st.button("🗑️ Clear All Plans"):
+            st.warning("Are you sure you want to delete all your saved plans? This cannot be undone.")
+
+            conf_col1, conf_col2 = st.columns(2)
+            with conf_col1:
+                if st.button("✓ Yes, Delete All", key="confirm_del_all"):
+                    for plan_id in st.session_state.saved_plans:
+                        plan_store.delete(plan_id)
+                    st.session_state.saved_plans = []
+                    st.rerun(scope="fragment")
+            with conf_col2:
+                if st.button("✗ Cancel", key="cancel_del_all"):
+                    st.rerun(scope="fragment")
+
+
+def plan_pdf(plan_id):
+    # Built on first download, then served from the export cache
+    plan_store = get_plan_store()
+    path = plan_store.export_path(plan_id, "pdf")
+    if not os.path.exists(path):
+        plan = plan_store.get(plan_id)
+        specs = plan["specs"]
+        city = specs.get("city", get_city_data().default_city)
+        spec_rows = [
+            ("House Dimensions", specs["dimensions"]),
+            ("Number of Floors", specs["floors"]),
+            ("Bedrooms", specs["bedrooms"]),
+            ("Bathrooms", specs["bathrooms"]),
+            ("Style", specs["style"]),
+            ("Layout", specs.get("layout", "")),
+            ("Features", specs.get("features", "")),
+        ]
+        city_data = get_city_data()
+        sections = [
+            ("House Plan Specifications", ("Item", "Value"), spec_rows),
+            (f"Material Cost Estimate & Supplier Contacts ({city})", ("Material", "Approx. Cost", "Supplier/Contact"),
+             city_data.material_rows(city)),
+            (f"Top 5 Builders & House Model Budget Estimate ({city})", ("Builder", "Approx. Budget", "Contact"),
+             city_data.builder_rows(city)),
+        ]
+        images = ((page["label"], plan_store.load_image(page["image_hash"])) for page in plan["pages"])
+        pages = ((label, data) for label, data in images if data is not None)
+        export_plan_pdf(path, f"House Plan ({plan['timestamp']})", pages, sections)
+    with open(path, "rb") as f:
+        return f.read()
 
-# Initialize the client
-client = Client()
 
 # App title and layout
 st.set_page_config(page_title="AI House Plan Generator", layout="wide")
 st.title("🏡 Ai Architectural Assistant")
 st.write("Describe your ideal home and get a professional-style floor plan with labeled dimensions.")
 
+start_metrics()
+
+# Append ?profile=1 to the URL to profile this session's script runs
+profiler = st.session_state.pop("profiler", None)
+if profiler is not None:
+    profiler.disable()  # left running by a run that was interrupted by a rerun
+profiler = metrics.start_profile() if st.query_params.get("profile") == "1" else None
+if profiler is not None:
+    st.session_state.profiler = profiler
+
+# Per-session state only holds IDs, reloaded from the shared stores on every run
+st.session_state.owner = session_owner()
+collect_finished_jobs()
+st.session_state.saved_plans = get_plan_store().plan_ids(st.session_state.owner)
+if "notice" in st.session_state:
+    st.toast(st.session_state.pop("notice"))  # left by a fragment that forced a full rerun
+
 # Create tabs for different sections
 tab1, tab2, tab3 = st.tabs(["Generate Plan", "My Saved Plans", "Help & Tips"])
 
@@ -24,404 +729,138 @@ with tab1:
     with col1:
         st.header("📐 House Specifications")
         
-        # City selection
-        tamilnadu_cities = [
-            "Chennai", "Coimbatore", "Madurai", "Tiruchirappalli", "Salem", "Tirunelveli", "Tiruppur", "Vellore", "Thoothukudi", "Erode"
-        ]
-        selected_city = st.selectbox("Choose Location (Top 10 Cities in Tamil Nadu)", tamilnadu_cities)
-        
-        # Basic specifications
-        with st.expander("Basic Dimensions", expanded=True):
-            length = st.number_input("Total Length (feet)", min_value=10, step=1, value=50)
-            width = st.number_input("Total Width (feet)", min_value=10, step=1, value=30)
-            num_floors = st.radio("Number of Floors", options=[1, 2, 3], horizontal=True)
-        
-        # Room requirements
-        with st.expander("Room Requirements", expanded=True):
-            bedrooms = st.number_input("Number of Bedrooms", min_value=1, step=1, value=3)
-            bathrooms = st.number_input("Number of Bathrooms", min_value=1, step=1, value=2)
+        # A form: editing a field doesn't rerun the app until the changes are applied
+        with st.form("house_spec", border=False):
+            # City selection
+            tamilnadu_cities = get_city_data().city_names
+            selected_city = st.selectbox("Choose Location (Top 10 Cities in Tamil Nadu)", tamilnadu_cities)
             
-            # Room types with checkboxes
-            st.subheader("Essential Rooms")
-            kitchen = st.checkbox("Kitchen", value=True)
-            living_room = st.checkbox("Living Room", value=True)
-            dining_room = st.checkbox("Dining Room", value=True)
+            # Basic specifications
+            with st.expander("Basic Dimensions", expanded=True):
+                length = st.number_input("Total Length (feet)", min_value=10, step=1, value=50)
+                width = st.number_input("Total Width (feet)", min_value=10, step=1, value=30)
+                num_floors = st.radio("Number of Floors", options=[1, 2, 3], horizontal=True)
             
-            st.subheader("Additional Rooms")
-            office = st.checkbox("Home Office")
-            laundry = st.checkbox("Laundry Room", value=True)
-            pantry = st.checkbox("Pantry")
-            mudroom = st.checkbox("Mudroom")
-            basement = st.checkbox("Basement")
+            # Room requirements
+            with st.expander("Room Requirements", expanded=True):
+                bedrooms = st.number_input("Number of Bedrooms", min_value=1, step=1, value=3)
+                bathrooms = st.number_input("Number of Bathrooms", min_value=1, step=1, value=2)
             
-        # Design preferences
-        with st.expander("Design Preferences"):
-            house_style = st.selectbox(
-                "House Style",
-                options=["Modern", "Traditional", "Contemporary", "Farmhouse", "Minimalist", "Mediterranean", "Custom"]
-            )
+                # Room types with checkboxes
+                st.subheader("Essential Rooms")
+                kitchen = st.checkbox("Kitchen", value=True)
+                living_room = st.checkbox("Living Room", value=True)
+                dining_room = st.checkbox("Dining Room", value=True)
             
-            if house_style == "Custom":
-                custom_style = st.text_input("Describe your custom style")
+                st.subheader("Additional Rooms")
+                office = st.checkbox("Home Office")
+                laundry = st.checkbox("Laundry Room", value=True)
+                pantry = st.checkbox("Pantry")
+                mudroom = st.checkbox("Mudroom")
+                basement = st.checkbox("Basement")
             
-            layout_preference = st.selectbox(
-                "Layout Preference",
-                options=["Open Floor Plan", "Compartmentalized", "Mixed"]
-            )
+            # Design preferences
+            with st.expander("Design Preferences"):
+                house_style = st.selectbox(
+                    "House Style",
+                    options=HOUSE_STYLES
+                )
             
-            accessibility = st.checkbox("Include Accessibility Features")
-            if accessibility:
+                custom_style = st.text_input("Describe your custom style", help="Used when the house style is Custom")
+            
+                layout_preference = st.selectbox(
+                    "Layout Preference",
+                    options=LAYOUT_PREFERENCES
+                )
+            
+                accessibility = st.checkbox("Include Accessibility Features")
                 accessibility_features = st.multiselect(
                     "Select Accessibility Features",
                     options=["Wider Doorways", "Ramps", "No Steps", "Accessible Bathroom", "Lower Countertops"]
                 )
-        
-        # Outdoor features
-        with st.expander("Outdoor Features"):
-            garage_options = st.radio("Garage", options=["None", "1-Car", "2-Car", "3-Car"], horizontal=True)
-            
-            outdoor_spaces = st.multiselect(
-                "Outdoor Spaces",
-                options=["Patio", "Deck", "Balcony", "Porch", "Garden", "Pool", "Outdoor Kitchen"],
-                default=["Patio"]
-            )
-            
-        # Additional details
-        with st.expander("Additional Details"):
-            features = st.text_area(
-                "Other Features or Requirements (comma-separated)",
-                value="walk-in closet, pantry, large windows"
-            )
-            
-            special_instructions = st.text_area(
-                "Special Instructions for the AI",
-                placeholder="E.g., 'Make the master bedroom face east for morning sunlight'"
-            )
-    
-    with col2:
-        st.header("🏗️ Preview & Generate")
-        
-        # Visualization style options
-        render_style = st.selectbox(
-            "Rendering Style",
-            options=[
-                "Blueprint (2D)",
-                "Detailed Floor Plan (2D)",
-                "3D Floor Plan",
-                "Isometric View"
-            ]
-        )
-        
-        furniture_detail = st.slider("Furniture Detail Level", min_value=0, max_value=3, value=2, 
-                                    help="0: No furniture, 3: Highly detailed furniture")
-        
-        # Color scheme
-        color_scheme = st.radio(
-            "Color Scheme",
-            options=["Blueprint (Blue/White)", "Grayscale", "Colored"],
-            horizontal=True
-        )
-        
-        # Resolution settings
-        resolution = st.select_slider(
-            "Image Resolution",
-            options=["Standard", "High", "Ultra High"],
-            value="High"
-        )
-        
-        # Generate button with loading animation
-        if st.button("Generate Plan 🚀", type="primary"):
-            # Build list of selected rooms
-            selected_rooms = []
-            if kitchen: selected_rooms.append("kitchen")
-            if living_room: selected_rooms.append("living room")
-            if dining_room: selected_rooms.append("dining room")
-            if office: selected_rooms.append("home office")
-            if laundry: selected_rooms.append("laundry room")
-            if pantry: selected_rooms.append("pantry")
-            if mudroom: selected_rooms.append("mudroom")
-            if basement: selected_rooms.append("basement")
             
-            # Add garage if selected
-            if garage_options != "None":
-                selected_rooms.append(garage_options + " garage")
+            # Outdoor features
+            with st.expander("Outdoor Features"):
+                garage_options = st.radio("Garage", options=["None", "1-Car", "2-Car", "3-Car"], horizontal=True)
             
-            # Add outdoor spaces
-            for space in outdoor_spaces:
-                selected_rooms.append(space.lower())
-            
-            # Add bedrooms and bathrooms
-            selected_rooms.append(f"{bedrooms} bedrooms")
-            selected_rooms.append(f"{bathrooms} bathrooms")
-            
-            # Additional features
-            if features.strip():
-                selected_rooms.extend([f.strip() for f in features.split(",")])
-            
-            # Accessibility features if selected
-            if accessibility and accessibility_features:
-                for feature in accessibility_features:
-                    selected_rooms.append(feature.lower())
-            
-            # Style specifications
-            style_specs = []
-            style_specs.append(f"{house_style if house_style != 'Custom' else custom_style} style")
-            style_specs.append(f"{layout_preference} layout")
-            
-            # Build detailed image generation prompt
-            prompt = f"""
-            Generate a high-quality {render_style.lower()} of a {house_style.lower() if house_style != 'Custom' else custom_style.lower()} house with {num_floors} floor(s) and the following specifications:
-            - Total house size: {length} feet long and {width} feet wide
-            - Include all these spaces: {', '.join(selected_rooms)}
-            - Layout style: {layout_preference}
-            
-            Rendering Requirements:
-            - Show **room names clearly labeled inside each room**
-            - Include **room-by-room dimensions** written inside each room
-            - Display **total house dimensions** on the outer boundary (length and width)
-            - Add **window and door placements** with appropriate symbols
-            - Show **walls and partitions** clearly with solid lines
-            - Include furniture at detail level {furniture_detail}/3
-            - Use a **{color_scheme}** color scheme
-            - Maintain **{resolution.lower()} resolution and clarity**
-            - Use **dimension annotations** in feet (ft)
-            - Each floor should be clearly labeled if multiple floors
+                outdoor_spaces = st.multiselect(
+                    "Outdoor Spaces",
+                    options=["Patio", "Deck", "Balcony", "Porch", "Garden", "Pool", "Outdoor Kitchen"],
+                    default=["Patio"]
+                )
             
-            {special_instructions if special_instructions else ""}
+            # Additional details
+            with st.expander("Additional Details"):
+                features = st.text_area(
+                    "Other Features or Requirements (comma-separated)",
+                    value="walk-in closet, pantry, large windows"
+                )
             
-            Make it easy to understand for architects and homeowners alike.
-            """
+                special_instructions = st.text_area(
+                    "Special Instructions for the AI",
+                    placeholder="E.g., 'Make the master bedroom face east for morning sunlight'"
+                )
             
-            with st.spinner("🔄 Generating your house plan..."):
-                try:
-                    # Generate image
-                    response = client.images.generate(
-                        model="flux",  # or "g4f/image" or preferred image model
-                        prompt=prompt,
-                        response_format="url"
-                    )
-                    
-                    # Display results
-                    image_url = response.data[0].url
-                    
-                    # Store image data and timestamp in session state
-                    # Get image data
-                    img_data = requests.get(image_url).content
-                    
-                    # Store in session state
-                    if 'saved_plans' not in st.session_state:
-                        st.session_state.saved_plans = []
-                    
-                    # Create a timestamp
-                    timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-                    
-                    plan_data = {
-                        "timestamp": timestamp,
-                        "image_data": img_data,
-                        "specs": {
-                            "dimensions": f"{length}' x {width}'",
-                            "floors": num_floors,
-                            "bedrooms": bedrooms,
-                            "bathrooms": bathrooms,
-                            "style": house_style if house_style != "Custom" else custom_style,
-                            "render_style": render_style
-                        }
-                    }
-                    
-                    st.session_state.saved_plans.append(plan_data)
-                    st.session_state.current_plan = plan_data
-                    
-                    # Show success message
-                    st.success("🎉 Your house plan has been generated successfully!")
-                    
-                    # Display the image
-                    st.image(image_url, caption="Your Custom House Plan", use_column_width=True)
-                    
-                    # Download options
-                    col_down1, col_down2 = st.columns(2)
-                    
-                    with col_down1:
-                        st.markdown(f"[📥 Download JPG]({image_url})", unsafe_allow_html=True)
-                    
-                    with col_down2:
-                        # Create a download button for PDF (simulated)
-                        st.download_button(
-                            label="📄 Download as PDF",
-                            data=img_data,
-                            file_name=f"house_plan_{timestamp.replace(':', '-').replace(' ', '_')}.pdf",
-                            mime="application/pdf"
-                        )
-                    
-                    # Display house specs
-                    with st.expander("House Plan Specifications", expanded=True):
-                        st.markdown(f"""
-                        **House Dimensions:** {length}' x {width}'  
-                        **Number of Floors:** {num_floors}  
-                        **Bedrooms:** {bedrooms}  
-                        **Bathrooms:** {bathrooms}  
-                        **Style:** {house_style if house_style != "Custom" else custom_style}  
-                        **Layout:** {layout_preference}  
-                        **Features:** {', '.join(selected_rooms)}  
-                        """)
-                    
-                except Exception as e:
-                    st.error("❌ Failed to generate the house plan.")
-                    st.code(str(e))
+            st.form_submit_button("Apply Specifications ✅", type="primary", width="stretch")
+        
+        # Everything the form describes; rendering options are added in the panel
+        base_spec = PlanSpec(
+            city=selected_city,
+            length=length,
+            width=width,
+            num_floors=num_floors,
+            bedrooms=bedrooms,
+            bathrooms=bathrooms,
+            kitchen=kitchen,
+            living_room=living_room,
+            dining_room=dining_room,
+            office=office,
+            laundry=laundry,
+            pantry=pantry,
+            mudroom=mudroom,
+            basement=basement,
+            house_style=house_style,
+            custom_style=custom_style if house_style == "Custom" else "",
+            layout_preference=layout_preference,
+            accessibility_features=tuple(accessibility_features) if accessibility else (),
+            garage=garage_options,
+            outdoor_spaces=tuple(outdoor_spaces),
+            features=features,
+            special_instructions=special_instructions,
+        )
+    
+    with col2:
+        plan_panel(base_spec)
 
     # --- New Section: City-based Info ---
     st.header(f"🏙️ City-Specific Info for {selected_city}")
     
     # 1. Material Cost Table (Mock Data)
     st.subheader("Material Cost Estimate & Supplier Contacts")
-    material_data = {
-        "Chennai": [
-            ("Steel (per ton)", "₹60,000", "ABC Steel Traders, 9876543210"),
-            ("Bricks (per 1000)", "₹7,000", "Chennai Bricks, 9123456780"),
-            ("Cement (per bag)", "₹400", "UltraCem, 9988776655"),
-            ("Sand (per unit)", "₹2,500", "River Sand Co, 9090909090")
-        ],
-        "Coimbatore": [
-            ("Steel (per ton)", "₹59,000", "Coimbatore Steel Mart, 9876501234"),
-            ("Bricks (per 1000)", "₹6,800", "Kovai Bricks, 9123409876"),
-            ("Cement (per bag)", "₹395", "BuildCem, 9988701234"),
-            ("Sand (per unit)", "₹2,400", "Kovai Sand Supply, 9090912345")
-        ],
-        "Madurai": [
-            ("Steel (per ton)", "₹58,500", "Madurai Steel, 9876512345"),
-            ("Bricks (per 1000)", "₹6,700", "Madurai Bricks, 9123412345"),
-            ("Cement (per bag)", "₹390", "Madurai Cement, 9988712345"),
-            ("Sand (per unit)", "₹2,350", "Vaigai Sand, 9090923456")
-        ],
-        "Tiruchirappalli": [
-            ("Steel (per ton)", "₹58,000", "Trichy Steel, 9876523456"),
-            ("Bricks (per 1000)", "₹6,600", "Trichy Bricks, 9123423456"),
-            ("Cement (per bag)", "₹388", "Trichy Cement, 9988723456"),
-            ("Sand (per unit)", "₹2,300", "Cauvery Sand, 9090934567")
-        ],
-        "Salem": [
-            ("Steel (per ton)", "₹57,500", "Salem Steel, 9876534567"),
-            ("Bricks (per 1000)", "₹6,500", "Salem Bricks, 9123434567"),
-            ("Cement (per bag)", "₹385", "Salem Cement, 9988734567"),
-            ("Sand (per unit)", "₹2,250", "Salem Sand, 9090945678")
-        ],
-        "Tirunelveli": [
-            ("Steel (per ton)", "₹57,000", "Tirunelveli Steel, 9876545678"),
-            ("Bricks (per 1000)", "₹6,400", "Tirunelveli Bricks, 9123445678"),
-            ("Cement (per bag)", "₹382", "Tirunelveli Cement, 9988745678"),
-            ("Sand (per unit)", "₹2,200", "Tamirabarani Sand, 9090956789")
-        ],
-        "Tiruppur": [
-            ("Steel (per ton)", "₹56,500", "Tiruppur Steel, 9876556789"),
-            ("Bricks (per 1000)", "₹6,300", "Tiruppur Bricks, 9123456789"),
-            ("Cement (per bag)", "₹380", "Tiruppur Cement, 9988756789"),
-            ("Sand (per unit)", "₹2,150", "Noyyal Sand, 9090967890")
-        ],
-        "Vellore": [
-            ("Steel (per ton)", "₹56,000", "Vellore Steel, 9876567890"),
-            ("Bricks (per 1000)", "₹6,200", "Vellore Bricks, 9123467890"),
-            ("Cement (per bag)", "₹378", "Vellore Cement, 9988767890"),
-            ("Sand (per unit)", "₹2,100", "Palar Sand, 9090978901")
-        ],
-        "Thoothukudi": [
-            ("Steel (per ton)", "₹55,500", "Tuticorin Steel, 9876578901"),
-            ("Bricks (per 1000)", "₹6,100", "Tuticorin Bricks, 9123478901"),
-            ("Cement (per bag)", "₹375", "Tuticorin Cement, 9988778901"),
-            ("Sand (per unit)", "₹2,050", "Tuticorin Sand, 9090989012")
-        ],
-        "Erode": [
-            ("Steel (per ton)", "₹55,000", "Erode Steel, 9876589012"),
-            ("Bricks (per 1000)", "₹6,000", "Erode Bricks, 9123489012"),
-            ("Cement (per bag)", "₹372", "Erode Cement, 9988789012"),
-            ("Sand (per unit)", "₹2,000", "Bhavani Sand, 9090990123")
-        ],
-    }
-    city_materials = material_data.get(selected_city, material_data["Chennai"])
+    tables = city_tables(selected_city)
+    st.table(tables["materials"])
+    
+    # Quantities and cost for the plan described in the form
+    city_data = get_city_data()
+    estimate = cost_estimate(cost_spec(base_spec))
+    city_index = estimate.cities.index(city_data.city(selected_city)["name"])
+    st.markdown(f"**Estimated materials for {estimate.built_up_area[0]:,.0f} sq ft built-up area**")
     st.table({
-        "Material": [row[0] for row in city_materials],
-        "Approx. Cost": [row[1] for row in city_materials],
-        "Supplier/Contact": [row[2] for row in city_materials]
+        "Material": tables["materials"]["Material"],
+        "Quantity": [f"{q:,.1f}" for q in estimate.quantities[0]],
+        "Estimated Cost": [format_inr(c) for c in estimate.costs[0, city_index]]
     })
+    st.caption(f"Total material cost in {estimate.cities[city_index]}: {format_inr(estimate.totals[0, city_index])}")
+    with st.expander("Compare material cost across cities"):
+        order = estimate.totals[0].argsort()
+        st.table({
+            "City": [estimate.cities[n] for n in order],
+            "Total Material Cost": [format_inr(estimate.totals[0, n]) for n in order]
+        })
 
     # 2. Top 5 Builders & Budget (Mock Data)
     st.subheader("Top 5 Builders & House Model Budget Estimate")
-    builder_data = {
-        "Chennai": [
-            ("L&T Construction", "₹45-60 Lakhs", "044-12345678"),
-            ("Prestige Group", "₹50-70 Lakhs", "044-87654321"),
-            ("Casa Grande", "₹40-55 Lakhs", "044-23456789"),
-            ("Appaswamy Real Estates", "₹48-65 Lakhs", "044-34567890"),
-            ("Radiance Realty", "₹42-58 Lakhs", "044-45678901")
-        ],
-        "Coimbatore": [
-            ("Srivari Infrastructure", "₹38-52 Lakhs", "0422-123456"),
-            ("VKC Developers", "₹40-54 Lakhs", "0422-654321"),
-            ("Sreevatsa Real Estates", "₹36-50 Lakhs", "0422-234567"),
-            ("Lancor Holdings", "₹39-53 Lakhs", "0422-345678"),
-            ("Chathamkulam Builders", "₹37-51 Lakhs", "0422-456789")
-        ],
-        "Madurai": [
-            ("Madurai Builders", "₹35-48 Lakhs", "0452-123456"),
-            ("Vaigai Constructions", "₹36-50 Lakhs", "0452-654321"),
-            ("Sree Builders", "₹34-47 Lakhs", "0452-234567"),
-            ("Meenakshi Estates", "₹37-49 Lakhs", "0452-345678"),
-            ("Pandiyan Realty", "₹33-46 Lakhs", "0452-456789")
-        ],
-        "Tiruchirappalli": [
-            ("Trichy Builders", "₹34-47 Lakhs", "0431-123456"),
-            ("Cauvery Estates", "₹35-48 Lakhs", "0431-654321"),
-            ("Rockfort Realty", "₹33-46 Lakhs", "0431-234567"),
-            ("Srirangam Constructions", "₹36-49 Lakhs", "0431-345678"),
-            ("Golden City Builders", "₹32-45 Lakhs", "0431-456789")
-        ],
-        "Salem": [
-            ("Salem Estates", "₹33-46 Lakhs", "0427-123456"),
-            ("Steel City Builders", "₹34-47 Lakhs", "0427-654321"),
-            ("Shevaroy Realty", "₹32-45 Lakhs", "0427-234567"),
-            ("Yercaud Constructions", "₹35-48 Lakhs", "0427-345678"),
-            ("Salem Dream Homes", "₹31-44 Lakhs", "0427-456789")
-        ],
-        "Tirunelveli": [
-            ("Nellai Builders", "₹32-45 Lakhs", "0462-123456"),
-            ("Tamirabarani Estates", "₹33-46 Lakhs", "0462-654321"),
-            ("Pearl City Realty", "₹31-44 Lakhs", "0462-234567"),
-            ("Nellai Dream Homes", "₹34-47 Lakhs", "0462-345678"),
-            ("Tirunelveli Constructions", "₹30-43 Lakhs", "0462-456789")
-        ],
-        "Tiruppur": [
-            ("Tiruppur Builders", "₹31-44 Lakhs", "0421-123456"),
-            ("Noyyal Estates", "₹32-45 Lakhs", "0421-654321"),
-            ("Cotton City Realty", "₹30-43 Lakhs", "0421-234567"),
-            ("Tiruppur Dream Homes", "₹33-46 Lakhs", "0421-345678"),
-            ("Tiruppur Constructions", "₹29-42 Lakhs", "0421-456789")
-        ],
-        "Vellore": [
-            ("Vellore Builders", "₹30-43 Lakhs", "0416-123456"),
-            ("Palar Estates", "₹31-44 Lakhs", "0416-654321"),
-            ("Fort City Realty", "₹29-42 Lakhs", "0416-234567"),
-            ("Vellore Dream Homes", "₹32-45 Lakhs", "0416-345678"),
-            ("Vellore Constructions", "₹28-41 Lakhs", "0416-456789")
-        ],
-        "Thoothukudi": [
-            ("Tuticorin Builders", "₹29-42 Lakhs", "0461-123456"),
-            ("Pearl City Estates", "₹30-43 Lakhs", "0461-654321"),
-            ("Harbour Realty", "₹28-41 Lakhs", "0461-234567"),
-            ("Tuticorin Dream Homes", "₹31-44 Lakhs", "0461-345678"),
-            ("Tuticorin Constructions", "₹27-40 Lakhs", "0461-456789")
-        ],
-        "Erode": [
-            ("Erode Builders", "₹28-41 Lakhs", "0424-123456"),
-            ("Bhavani Estates", "₹29-42 Lakhs", "0424-654321"),
-            ("Textile City Realty", "₹27-40 Lakhs", "0424-234567"),
-            ("Erode Dream Homes", "₹30-43 Lakhs", "0424-345678"),
-            ("Erode Constructions", "₹26-39 Lakhs", "0424-456789")
-        ],
-    }
-    city_builders = builder_data.get(selected_city, builder_data["Chennai"])
-    st.table({
-        "Builder": [row[0] for row in city_builders],
-        "Approx. Budget": [row[1] for row in city_builders],
-        "Contact": [row[2] for row in city_builders]
-    })
+    st.table(tables["builders"])
 
     # 3. Project Timeline Estimation (Mock Data)
     st.subheader("Project Timeline Estimation")
@@ -441,55 +880,7 @@ with tab1:
 
     # 4. Solar Panel Companies & Cost (Mock Data)
     st.subheader("Energy Efficiency: Solar Panel Companies & Cost Estimate")
-    solar_data = {
-        "Chennai": [
-            ("Tata Power Solar", "₹80,000 - ₹1,20,000 (3kW)", "1800-419-8777"),
-            ("Vikram Solar", "₹78,000 - ₹1,15,000 (3kW)", "1800-212-8200"),
-            ("Waaree Energies", "₹75,000 - ₹1,10,000 (3kW)", "1800-2121-321"),
-        ],
-        "Coimbatore": [
-            ("RenewSys Solar", "₹77,000 - ₹1,12,000 (3kW)", "1800-102-3775"),
-            ("Adani Solar", "₹79,000 - ₹1,18,000 (3kW)", "1800-123-5555"),
-        ],
-        "Madurai": [
-            ("Luminous Solar", "₹76,000 - ₹1,10,000 (3kW)", "1800-300-2945"),
-            ("Havells Solar", "₹78,000 - ₹1,13,000 (3kW)", "1800-103-1313"),
-        ],
-        "Tiruchirappalli": [
-            ("Microtek Solar", "₹75,000 - ₹1,09,000 (3kW)", "1800-102-4447"),
-            ("Goldi Solar", "₹77,000 - ₹1,12,000 (3kW)", "1800-258-5555"),
-        ],
-        "Salem": [
-            ("Exide Solar", "₹74,000 - ₹1,08,000 (3kW)", "1800-103-5454"),
-            ("Jakson Solar", "₹76,000 - ₹1,11,000 (3kW)", "1800-103-2600"),
-        ],
-        "Tirunelveli": [
-            ("Emmvee Solar", "₹73,000 - ₹1,07,000 (3kW)", "1800-425-4455"),
-            ("Navitas Solar", "₹75,000 - ₹1,10,000 (3kW)", "1800-233-2303"),
-        ],
-        "Tiruppur": [
-            ("Solex Solar", "₹72,000 - ₹1,06,000 (3kW)", "1800-200-6006"),
-            ("Surana Solar", "₹74,000 - ₹1,09,000 (3kW)", "1800-425-0111"),
-        ],
-        "Vellore": [
-            ("Photon Energy", "₹71,000 - ₹1,05,000 (3kW)", "1800-200-0101"),
-            ("Sunshot Solar", "₹73,000 - ₹1,08,000 (3kW)", "1800-200-1234"),
-        ],
-        "Thoothukudi": [
-            ("SunEdison", "₹70,000 - ₹1,04,000 (3kW)", "1800-200-5005"),
-            ("Swelect Solar", "₹72,000 - ₹1,07,000 (3kW)", "1800-200-5555"),
-        ],
-        "Erode": [
-            ("Insolation Energy", "₹69,000 - ₹1,03,000 (3kW)", "1800-200-7007"),
-            ("Ujaas Solar", "₹71,000 - ₹1,06,000 (3kW)", "1800-233-2303"),
-        ],
-    }
-    city_solar = solar_data.get(selected_city, solar_data["Chennai"])
-    st.table({
-        "Company": [row[0] for row in city_solar],
-        "Approx. Cost": [row[1] for row in city_solar],
-        "Contact": [row[2] for row in city_solar]
-    })
+    st.table(tables["solar"])
 
     # 5. Legal & Permit Guidance (Mock Data)
     st.subheader("Legal & Permit Guidance")
@@ -522,75 +913,7 @@ with tab1:
 
 with tab2:
     st.header("💾 My Saved Plans")
-    
-    if 'saved_plans' not in st.session_state or not st.session_state.saved_plans:
-        st.info("You haven't generated any plans yet. Go to the 'Generate Plan' tab to create one!")
-    else:
-        # Display saved plans
-        for i, plan in enumerate(st.session_state.saved_plans):
-            col1, col2 = st.columns([1, 3])
-            
-            with col1:
-                # Convert image data to display
-                image_bytes = BytesIO(plan["image_data"])
-                st.image(image_bytes, width=200)
-            
-            with col2:
-                st.markdown(f"**Plan #{i+1}** - Generated on {plan['timestamp']}")
-                st.markdown(f"""
-                - **Dimensions:** {plan['specs']['dimensions']}
-                - **Floors:** {plan['specs']['floors']}
-                - **Bedrooms:** {plan['specs']['bedrooms']}
-                - **Bathrooms:** {plan['specs']['bathrooms']}
-                - **Style:** {plan['specs']['style']}
-                """)
-                
-                # Action buttons
-                btn_col1, btn_col2, btn_col3 = st.columns(3)
-                
-                with btn_col1:
-                    st.download_button(
-                        "📥 Download",
-                        data=plan["image_data"],
-                        file_name=f"house_plan_{plan['timestamp'].replace(':', '-').replace(' ', '_')}.jpg",
-                        mime="image/jpeg"
-                    )
-                
-                with btn_col2:
-                    if st.button(f"🔄 Regenerate #{i+1}", key=f"regen_{i}"):
-                        st.session_state.regenerate_plan = i
-                        st.experimental_rerun()
-                
-                with btn_col3:
-                    if st.button(f"🗑️ Delete #{i+1}", key=f"del_{i}"):
-                        # Add confirmation
-                        st.session_state.delete_plan = i
-                        st.warning(f"Are you sure you want to delete Plan #{i+1}?")
-                        
-                        conf_col1, conf_col2 = st.columns(2)
-                        with conf_col1:
-                            if st.button("✓ Yes, Delete", key=f"confirm_del_{i}"):
-                                st.session_state.saved_plans.pop(i)
-                                st.experimental_rerun()
-                        with conf_col2:
-                            if st.button("✗ Cancel", key=f"cancel_del_{i}"):
-                                del st.session_state.delete_plan
-                                st.experimental_rerun()
-            
-            st.markdown("---")
-        
-        # Clear all button
-        if st.button("🗑️ Clear All Plans"):
-            st.warning("Are you sure you want to delete all your saved plans? This cannot be undone.")
-            
-            conf_col1, conf_col2 = st.columns(2)
-            with conf_col1:
-                if st.button("✓ Yes, Delete All", key="confirm_del_all"):
-                    st.session_state.saved_plans = []
-                    st.experimental_rerun()
-            with conf_col2:
-                if st.button("✗ Cancel", key="cancel_del_all"):
-                    st.experimental_rerun()
+    saved_plans_list()
 
 with tab3:
     st.header("ℹ️ Help & Tips")
@@ -601,6 +924,7 @@ with tab3:
         - Set the overall dimensions
         - Specify the number of bedrooms and bathrooms
         - Select additional rooms and features
+        - Click "Apply Specifications" once you're done editing the form
         
         **Step 2:** Set your design preferences
         - Choose a house style
@@ -613,8 +937,12 @@ with tab3:
         - Choose a color scheme
         
         **Step 4:** Generate your plan
-        - Click the "Generate Plan" button
-        - Wait for the AI to create your custom blueprint
+        - Optionally open "Optimize room layout" and pick a searched layout; its room sizes go into the prompt
+        - Click the "Preview Plan" button for a quick low-resolution draft
+        - Adjust and preview again until the layout looks right
+        - Confirm to generate the full-resolution blueprint in the background
+        - Keep editing and queue more variants while it runs; finished plans appear in My Saved Plans
+        - Use "Compare variants" to see drafts of several styles, color schemes or layouts side by side
         - Download or save your plan
         """)
     
@@ -624,7 +952,7 @@ with tab3:
         2. **Balance features and space** - Don't try to fit too many rooms in a small footprint
         3. **Include special instructions** - Guide the AI with specific requirements about layout or room placement
         4. **Try different styles** - Each rendering style offers a different perspective on your design
-        5. **Start simple, then add details** - Create a basic plan first, then regenerate with more specific requirements
+        5. **Start simple, then add details** - Create a basic plan first, then change the specifications and use "Regenerate" on the saved plan; unchanged floors are reused and style-only changes edit the existing image
         """)
     
     with st.expander("Example Feature Combinations"):
@@ -681,6 +1009,12 @@ with tab3:
 st.markdown("---")
 st.markdown("© 2025 AI House Plan Generator | Made with ❤️ using Streamlit and AI")
 
+if profiler is not None:
+    del st.session_state.profiler
+    report = metrics.finish_profile(profiler, os.path.join(PROFILE_DIR, f"run-{time.time_ns()}.prof"))
+    with st.expander("⏱️ Profile of this run"):
+        st.code(report)
+
 # Configure page theme
 st.markdown("""
 <style>
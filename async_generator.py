@@ -0,0 +1,122 @@
+"""Shared asyncio event loop for overlapping plan generations.
+
+A single AsyncPlanGenerator serves the whole process: every caller submits
+specs to the same background loop, which owns one g4f AsyncClient and one
+pooled aiohttp session. Many generations and downloads can then be in
+flight at once while each caller only waits on its own future. With a
+ProviderRouter, requests that don't name a model are raced across the
+router's models.
+
+Identical requests are coalesced: while a generation for a cache key is in
+flight, later requests for the same key wait on it and share its result
+instead of calling the provider again. A generation is cancelled once every
+caller waiting on it has given up, so timed-out requests don't keep
+provider calls running.
+"""
+import asyncio
+import dataclasses
+import threading
+from concurrent.futures import wait
+
+from plan_generator import DOWNLOAD_TIMEOUT, HTTP_POOL_SIZE, IMAGE_MODEL, generate_plan_async
+
+
+class AsyncPlanGenerator:
+    def __init__(self, model=IMAGE_MODEL, cache=None, client=None, max_in_flight=16,
+                 timeout=DOWNLOAD_TIMEOUT, generate_timeout=None, router=None):
+        self.model = model
+        self.router = router
+        self.cache = cache
+        self.timeout = timeout
+        self.generate_timeout = generate_timeout
+        self._client = client
+        self._session = None
+        self._max_in_flight = max_in_flight
+        self._semaphore = None
+        self._in_flight = {}  # cache key -> task; only touched on the loop thread
+        self._waiters = {}  # task -> callers still waiting on it
+        self.requests = 0
+        self.coalesced = 0
+        self._loop = asyncio.new_event_loop()
+        self._thread = threading.Thread(target=self._loop.run_forever, name="plan-generator", daemon=True)
+        self._thread.start()
+
+    async def _ensure_started(self):
+        # Loop-bound resources must be created on the loop thread
+        if self._session is None:
+            import aiohttp
+
+            if self._client is None:
+                from g4f.client import AsyncClient
+                self._client = AsyncClient()
+            connector = aiohttp.TCPConnector(limit=HTTP_POOL_SIZE, keepalive_timeout=60)
+            self._session = aiohttp.ClientSession(connector=connector)
+            self._semaphore = asyncio.Semaphore(self._max_in_flight)
+
+    async def _generate(self, spec, model, reference):
+        self.requests += 1
+        key = spec.cache_key(model or self.model)
+        task = self._in_flight.get(key)
+        shared = task is not None
+        if shared:
+            self.coalesced += 1
+        else:
+            task = asyncio.ensure_future(self._generate_once(spec, model, reference))
+            self._in_flight[key] = task
+            task.add_done_callback(lambda _: self._in_flight.pop(key, None))
+        self._waiters[task] = self._waiters.get(task, 0) + 1
+        try:
+            # Shielded so one caller giving up doesn't cancel a generation others still wait on
+            result = await asyncio.shield(task)
+        finally:
+            self._waiters[task] -= 1
+            if not self._waiters[task]:
+                del self._waiters[task]
+                task.cancel()  # only does something when the last caller gave up early
+        # Same image, but keep this caller's spec (e.g. city is not part of the key)
+        return dataclasses.replace(result, spec=spec) if shared else result
+
+    async def _generate_once(self, spec, model, reference):
+        await self._ensure_started()
+        async with self._semaphore:
+            return await generate_plan_async(
+                spec, self._client, self._session,
+                model=model or self.model, cache=self.cache,
+                timeout=self.timeout, generate_timeout=self.generate_timeout,
+                router=self.router if model is None else None, reference=reference,
+            )
+
+    def submit(self, spec, model=None, reference=None):
+        """Schedule a generation, optionally as an edit of an EditReference; returns a concurrent.futures.Future."""
+        return asyncio.run_coroutine_threadsafe(self._generate(spec, model, reference), self._loop)
+
+    def stats(self):
+        return {"requests": self.requests, "coalesced": self.coalesced, "in_flight": len(self._in_flight)}
+
+    def generate(self, spec, model=None, timeout=None):
+        """Blocking convenience wrapper around submit()."""
+        return wait_all([self.submit(spec, model)], timeout)[0]
+
+    def close(self):
+        async def shutdown():
+            if self._session is not None:
+                await self._session.close()
+
+        asyncio.run_coroutine_threadsafe(shutdown(), self._loop).result()
+        self._loop.call_soon_threadsafe(self._loop.stop)
+        self._thread.join()
+
+
+def wait_all(futures, timeout):
+    """Results of futures from AsyncPlanGenerator.submit, in order.
+
+    If they aren't all done within `timeout` seconds, the unfinished ones are
+    cancelled and TimeoutError is raised.
+    """
+    futures = list(futures)
+    _, not_done = wait(futures, timeout=timeout)
+    if not_done:
+        for future in not_done:
+            future.cancel()
+        raise TimeoutError(f"The image provider did not respond within {timeout:g}s")
+    return [future.result() for future in futures]
@@ -0,0 +1,200 @@
+"""Generate house plans headlessly from a JSONL or CSV file of specs.
+
+Each input row holds PlanSpec fields (see plan_generator.PlanSpec); missing
+fields take the form defaults. Images are written to the output directory as
+they finish and every outcome is appended to `manifest.jsonl`, so an
+interrupted run can be restarted with the same arguments and only the
+unfinished specs are generated again.
+
+    python batch_generate.py specs.jsonl --out plans/ --concurrency 8
+"""
+import argparse
+import csv
+import json
+import os
+import random
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+from async_generator import AsyncPlanGenerator
+from city_data import load_city_data
+from cost_estimator import estimate_costs
+from image_utils import image_extension, image_mime
+from metrics import write_metrics_file
+from plan_cache import PlanCache
+from plan_generator import IMAGE_MODEL, PlanSpec
+from storage_utils import write_atomic
+
+MANIFEST = "manifest.jsonl"
+
+
+def load_specs(path):
+    """Read PlanSpecs from a .jsonl/.json-lines or .csv file."""
+    specs = []
+    with open(path, newline="", encoding="utf-8") as f:
+        if path.lower().endswith(".csv"):
+            for row in csv.DictReader(f):
+                specs.append(PlanSpec.from_dict({k: v for k, v in row.items() if v != ""}))
+        else:
+            for line in f:
+                line = line.strip()
+                if line:
+                    specs.append(PlanSpec.from_dict(json.loads(line)))
+    return specs
+
+
+def load_done(out_dir):
+    """Keys that already completed successfully in a previous run."""
+    done = set()
+    path = os.path.join(out_dir, MANIFEST)
+    if os.path.exists(path):
+        with open(path, encoding="utf-8") as f:
+            for line in f:
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    continue  # torn last line from an interrupted run
+                if record.get("status") == "ok":
+                    done.add(record["key"])
+    return done
+
+
+def run_one(spec, generator, out_dir, retries, backoff):
+    """Generate one spec with retries; returns a manifest record.
+
+    The generator enforces its own timeouts, so a failed attempt has been
+    cancelled before the next one starts.
+    """
+    key = spec.cache_key(generator.model)
+    started = time.perf_counter()
+    error = None
+    for attempt in range(1, retries + 2):
+        try:
+            result = generator.generate(spec)
+        except Exception as e:
+            error = e
+            if attempt <= retries:
+                # Exponential backoff with jitter so workers don't retry in lockstep
+                time.sleep(backoff * (2 ** (attempt - 1)) * (0.5 + random.random()))
+            continue
+
+        file_name = key + image_extension(image_mime(result.image_data))
+        write_atomic(os.path.join(out_dir, file_name), result.image_data)
+        return {
+            "key": key,
+            "status": "ok",
+            "file": file_name,
+            "cached": result.cached,
+            "attempts": attempt,
+            "seconds": round(time.perf_counter() - started, 3),
+            "spec": spec.to_dict(),
+        }
+
+    return {
+        "key": key,
+        "status": "failed",
+        "error": f"{type(error).__name__}: {error}",
+        "attempts": retries + 1,
+        "seconds": round(time.perf_counter() - started, 3),
+        "spec": spec.to_dict(),
+    }
+
+
+def run_batch(specs, out_dir, generator, concurrency=4, retries=2, backoff=2.0, log=print):
+    """Generate every spec not already in the manifest with an AsyncPlanGenerator; returns (ok, failed)."""
+    model = generator.model
+    os.makedirs(out_dir, exist_ok=True)
+    done = load_done(out_dir)
+
+    # Drop duplicates and anything finished by an earlier run
+    pending = {}
+    for spec in specs:
+        key = spec.cache_key(model)
+        if key not in done:
+            pending.setdefault(key, spec)
+    skipped = len(specs) - len(pending)
+    if skipped:
+        log(f"Skipping {skipped} spec(s) already generated or duplicated")
+
+    ok = failed = 0
+    total = len(pending)
+    with open(os.path.join(out_dir, MANIFEST), "a", encoding="utf-8") as manifest, \
+            ThreadPoolExecutor(max_workers=concurrency) as pool:
+        futures = [
+            pool.submit(run_one, spec, generator, out_dir, retries, backoff)
+            for spec in pending.values()
+        ]
+        for n, future in enumerate(as_completed(futures), 1):
+            record = future.result()
+            manifest.write(json.dumps(record, ensure_ascii=False) + "\n")
+            manifest.flush()
+            if record["status"] == "ok":
+                ok += 1
+                log(f"[{n}/{total}] ok {record['file']} ({record['seconds']}s)")
+            else:
+                failed += 1
+                log(f"[{n}/{total}] failed {record['key'][:12]}: {record['error']}")
+    return ok, failed
+
+
+def write_estimates(specs, path, model=IMAGE_MODEL):
+    """Price every spec in its own city in one vectorized pass and write a CSV."""
+    city_data = load_city_data()
+    estimate = estimate_costs(specs, city_data)
+    city_index = [estimate.cities.index(city_data.city(spec.city)["name"]) for spec in specs]
+    costs = estimate.costs[range(len(specs)), city_index]  # (specs, materials)
+    with open(path, "w", newline="", encoding="utf-8") as f:
+        writer = csv.writer(f)
+        writer.writerow(["key", "city", "built_up_sqft"] + [f"{m}_cost" for m in estimate.materials] + ["total_cost"])
+        for n, spec in enumerate(specs):
+            writer.writerow(
+                [spec.cache_key(model), estimate.cities[city_index[n]], round(estimate.built_up_area[n])]
+                + [round(c) for c in costs[n]] + [round(costs[n].sum())]
+            )
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Batch-generate house plans from a spec file.")
+    parser.add_argument("specs", help="JSONL or CSV file with one PlanSpec per row")
+    parser.add_argument("--out", default="batch_output", help="output directory (default: batch_output)")
+    parser.add_argument("--concurrency", type=int, default=4, help="parallel generations (default: 4)")
+    parser.add_argument("--timeout", type=float, default=120,
+                        help="seconds allowed for each provider call and each download (default: 120)")
+    parser.add_argument("--retries", type=int, default=2, help="retries after a failed attempt (default: 2)")
+    parser.add_argument("--backoff", type=float, default=2.0, help="base retry delay in seconds (default: 2)")
+    parser.add_argument("--model", default=IMAGE_MODEL, help=f"image model (default: {IMAGE_MODEL})")
+    parser.add_argument("--cache-dir", help="reuse a plan image cache directory")
+    parser.add_argument("--estimate", action="store_true",
+                        help="also write material cost estimates to estimates.csv")
+    parser.add_argument("--metrics-file", help="write per-stage timing metrics (Prometheus text format) here")
+    args = parser.parse_args(argv)
+
+    specs = load_specs(args.specs)
+    if args.estimate:
+        os.makedirs(args.out, exist_ok=True)
+        write_estimates(specs, os.path.join(args.out, "estimates.csv"), model=args.model)
+    cache = PlanCache(args.cache_dir) if args.cache_dir else None
+    started = time.perf_counter()
+    # Timeouts cancel the request on the generator's loop, so a timed-out attempt
+    # stops before its retry and never counts against --concurrency twice
+    generator = AsyncPlanGenerator(
+        model=args.model, cache=cache, max_in_flight=args.concurrency,
+        timeout=args.timeout, generate_timeout=args.timeout,
+    )
+    try:
+        ok, failed = run_batch(
+            specs, args.out, generator,
+            concurrency=args.concurrency, retries=args.retries, backoff=args.backoff,
+        )
+    finally:
+        generator.close()
+    elapsed = time.perf_counter() - started
+    print(f"Done: {ok} generated, {failed} failed in {elapsed:.1f}s")
+    if args.metrics_file:
+        write_metrics_file(args.metrics_file)
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
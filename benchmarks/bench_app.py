@@ -0,0 +1,79 @@
+"""Benchmark Streamlit rerun cost as a session's saved plans grow.
+
+Pre-populates a temporary plan store, then uses Streamlit's AppTest to time
+full script reruns of app.py with a session holding N saved plans:
+
+    python -m benchmarks.bench_app --sizes 0 10 100 500 --runs 5 \\
+        --output benchmarks/results/app.json
+"""
+import argparse
+import os
+import tempfile
+import uuid
+
+from benchmarks.common import Timer, latency_summary, peak_rss_mb, write_results
+from benchmarks.stub_provider import make_image
+
+APP_PATH = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "app.py")
+
+
+def populate(store, sizes, image):
+    """One owner per size, holding that many saved plans; returns the owner tokens."""
+    from plan_generator import PlanSpec
+
+    summary = PlanSpec().summary()
+    owners = {}
+    for size in sizes:
+        owners[size] = uuid.uuid4().hex
+        for n in range(size):
+            store.save(summary, [(None, image + n.to_bytes(4, "big"))], owner=owners[size])
+    return owners
+
+
+def bench_reruns(owner, size, runs, timeout):
+    from streamlit.testing.v1 import AppTest
+
+    at = AppTest.from_file(APP_PATH, default_timeout=timeout)
+    at.query_params["user"] = owner
+    with Timer() as first:
+        at.run()
+    if at.exception:
+        raise RuntimeError(f"app raised: {at.exception[0].message}")
+    latencies = []
+    for _ in range(runs):
+        with Timer() as timer:
+            at.run()
+        latencies.append(timer.seconds)
+    return {
+        "name": "rerun",
+        "saved_plans": size,
+        "runs": runs,
+        "first_run": first.seconds,
+        **latency_summary(latencies),
+        "peak_rss_mb": peak_rss_mb(),
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark app reruns with growing saved plans.")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[0, 10, 100, 500], help="saved plan counts (default: 0 10 100 500)")
+    parser.add_argument("--runs", type=int, default=5, help="timed reruns per size (default: 5)")
+    parser.add_argument("--image-size", default="1024x768", help="stored plan image WxH (default: 1024x768)")
+    parser.add_argument("--timeout", type=float, default=120, help="seconds allowed per rerun (default: 120)")
+    parser.add_argument("--output", default="-", help="JSON results file (default: stdout)")
+    args = parser.parse_args(argv)
+
+    with tempfile.TemporaryDirectory() as directory:
+        # Must be set before the app first creates its cached store and cache
+        os.environ["PLAN_STORE_DIR"] = os.path.join(directory, "store")
+        os.environ["PLAN_CACHE_DIR"] = os.path.join(directory, "cache")
+        from plan_store import SQLitePlanStore
+
+        width, height = (int(n) for n in args.image_size.lower().split("x"))
+        owners = populate(SQLitePlanStore(os.environ["PLAN_STORE_DIR"]), args.sizes, make_image(width, height))
+        results = [bench_reruns(owners[size], size, args.runs, args.timeout) for size in sorted(args.sizes)]
+    write_results(args.output, "app_reruns", args, results)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,132 @@
+"""Benchmark the generation pipeline against the local stub provider.
+
+Measures prompt building and plan persistence on their own. It then drives
+full generations (provider call, download, cache) through the async
+generator the app uses and through the synchronous batch path, at each
+concurrency level:
+
+    python -m benchmarks.bench_pipeline --concurrency 1 4 16 --requests 64 \\
+        --latency 0.2 --error-rate 0.05 --output benchmarks/results/pipeline.json
+"""
+import argparse
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from async_generator import AsyncPlanGenerator
+from benchmarks.common import Timer, latency_summary, peak_rss_mb, write_results
+from benchmarks.stub_provider import StubAsyncClient, StubClient, StubImageServer
+from plan_cache import PlanCache
+from plan_generator import PlanSpec, build_prompt, generate_plan
+from plan_store import SQLitePlanStore
+
+
+def make_specs(count):
+    """Distinct specs, so every request misses the cache."""
+    return [PlanSpec(length=30 + n % 50, width=20 + n // 50, bedrooms=1 + n % 5) for n in range(count)]
+
+
+def bench_prompt(iterations):
+    specs = make_specs(iterations)
+    with Timer() as timer:
+        for spec in specs:
+            build_prompt(spec)
+    return {"name": "build_prompt", "iterations": iterations, "us_per_call": timer.seconds / iterations * 1e6}
+
+
+def bench_persist(image, iterations):
+    latencies = []
+    with tempfile.TemporaryDirectory() as directory:
+        store = SQLitePlanStore(directory)
+        summary = PlanSpec().summary()
+        for n in range(iterations):
+            data = image + n.to_bytes(4, "big")  # distinct blobs, like distinct plans
+            with Timer() as timer:
+                store.save(summary, [(None, data)])
+            latencies.append(timer.seconds)
+    return {"name": "persist", "iterations": iterations, **latency_summary(latencies)}
+
+
+def drive(call, specs, concurrency):
+    """Run `call(spec)` from `concurrency` threads; returns (latencies, errors, wall seconds)."""
+    latencies = []
+    errors = 0
+
+    def one(spec):
+        started = time.perf_counter()
+        try:
+            call(spec)
+        except Exception:
+            return None
+        return time.perf_counter() - started
+
+    with Timer() as wall, ThreadPoolExecutor(max_workers=concurrency) as pool:
+        for seconds in pool.map(one, specs):
+            if seconds is None:
+                errors += 1
+            else:
+                latencies.append(seconds)
+    return latencies, errors, wall.seconds
+
+
+def pipeline_result(name, concurrency, latencies, errors, wall):
+    return {
+        "name": name,
+        "concurrency": concurrency,
+        "requests": len(latencies) + errors,
+        "ok": len(latencies),
+        "errors": errors,
+        "seconds": wall,
+        "throughput": len(latencies) / wall if wall else None,
+        **latency_summary(latencies),
+        "peak_rss_mb": peak_rss_mb(),
+    }
+
+
+def bench_async(server, specs, concurrency, args):
+    with tempfile.TemporaryDirectory() as directory:
+        client = StubAsyncClient(server.url, latency=args.latency, error_rate=args.error_rate)
+        generator = AsyncPlanGenerator(client=client, cache=PlanCache(directory), max_in_flight=concurrency)
+        try:
+            latencies, errors, wall = drive(generator.generate, specs, concurrency)
+        finally:
+            generator.close()
+    return pipeline_result("async_generator", concurrency, latencies, errors, wall)
+
+
+def bench_sync(server, specs, concurrency, args):
+    with tempfile.TemporaryDirectory() as directory:
+        client = StubClient(server.url, latency=args.latency, error_rate=args.error_rate)
+        cache = PlanCache(directory)
+        latencies, errors, wall = drive(lambda spec: generate_plan(spec, client, cache=cache), specs, concurrency)
+    return pipeline_result("sync_generate_plan", concurrency, latencies, errors, wall)
+
+
+def parse_size(text):
+    width, height = text.lower().split("x")
+    return int(width), int(height)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark plan generation against a local stub provider.")
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 4, 16], help="levels to test (default: 1 4 16)")
+    parser.add_argument("--requests", type=int, default=64, help="generations per level (default: 64)")
+    parser.add_argument("--latency", type=float, default=0.2, help="stub generate() latency in seconds (default: 0.2)")
+    parser.add_argument("--download-latency", type=float, default=0.0, help="stub image server delay in seconds")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="fraction of stub calls that fail (default: 0)")
+    parser.add_argument("--image-size", type=parse_size, default=(1024, 768), help="stub image WxH (default: 1024x768)")
+    parser.add_argument("--output", default="-", help="JSON results file (default: stdout)")
+    args = parser.parse_args(argv)
+
+    results = [bench_prompt(2000)]
+    with StubImageServer(args.image_size, args.download_latency) as server:
+        results.append(bench_persist(server.image, 50))
+        for concurrency in args.concurrency:
+            specs = make_specs(args.requests)
+            results.append(bench_async(server, specs, concurrency, args))
+            results.append(bench_sync(server, specs, concurrency, args))
+    write_results(args.output, "pipeline", args, results)
+
+
+if __name__ == "__main__":
+    main()
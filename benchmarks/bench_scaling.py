@@ -0,0 +1,136 @@
+"""Load test several app processes sharing one state directory.
+
+For each process count N, this starts N processes over a fresh directory.
+Each process builds the backends the app uses with SHARED_STATE_DIR set:
+SQLitePlanStore, SQLitePlanCache and SQLiteJobQueue. It also gets an async
+generator that talks to the stub provider. Every process submits the same
+number of jobs for its own users and waits for them; any process may run
+any job. The parent then reopens the store and checks that every user sees
+all of their plans. With a fixed load per process, throughput should grow
+almost linearly with N:
+
+    python -m benchmarks.bench_scaling --processes 1 2 4 8 --jobs-per-process 32 \\
+        --workers 4 --latency 0.5 --output benchmarks/results/scaling.json
+"""
+import argparse
+import multiprocessing
+import os
+import tempfile
+import time
+import uuid
+
+from benchmarks.common import latency_summary, write_results
+from benchmarks.stub_provider import StubImageServer
+
+USERS_PER_PROCESS = 4
+
+
+def make_specs(start, count):
+    """Distinct specs across every process, so each job misses the cache."""
+    from plan_generator import PlanSpec
+
+    return [PlanSpec(length=30 + n % 50, width=20 + n // 50 % 50, bedrooms=1 + n // 2500 % 5) for n in range(start, start + count)]
+
+
+def app_process(directory, url, index, jobs, workers, latency, timeout, barrier, results):
+    from async_generator import AsyncPlanGenerator
+    from benchmarks.stub_provider import StubAsyncClient
+    from plan_cache import SQLitePlanCache
+    from plan_jobs import JobManager, SQLiteJobQueue
+    from plan_store import SQLitePlanStore
+
+    generator = AsyncPlanGenerator(
+        client=StubAsyncClient(url, latency=latency),
+        cache=SQLitePlanCache(os.path.join(directory, "cache")),
+        max_in_flight=workers,
+    )
+    manager = JobManager(
+        generator, SQLitePlanStore(os.path.join(directory, "plans")), workers=workers,
+        timeout=timeout, queue=SQLiteJobQueue(os.path.join(directory, "jobs.db")),
+    )
+    owners = [uuid.uuid4().hex for _ in range(USERS_PER_PROCESS)]
+    specs = make_specs(index * jobs, jobs)
+
+    barrier.wait()  # every process starts submitting at the same time
+    job_ids = [manager.submit(spec, owner=owners[n % len(owners)]) for n, spec in enumerate(specs)]
+    deadline = time.monotonic() + timeout
+    pending = set(job_ids)
+    while pending and time.monotonic() < deadline:
+        pending = {job_id for job_id in pending if not manager.get(job_id).done}
+        time.sleep(0.05)
+    finished = [manager.get(job_id) for job_id in job_ids]
+    results.put({
+        "owners": {owner: sum(1 for n in range(jobs) if n % len(owners) == k) for k, owner in enumerate(owners)},
+        "latencies": [job.finished - job.submitted for job in finished if job.status == "done"],
+        "failed": sum(1 for job in finished if job.status != "done"),
+    })
+    barrier.wait()  # keep working on other processes' jobs until everyone is done
+    generator.close()
+
+
+def bench_processes(count, server, args):
+    from plan_store import SQLitePlanStore
+
+    context = multiprocessing.get_context("spawn")
+    barrier = context.Barrier(count + 1)
+    results = context.Queue()
+    with tempfile.TemporaryDirectory() as directory:
+        processes = [
+            context.Process(target=app_process, args=(
+                directory, server.url, n, args.jobs_per_process, args.workers, args.latency, args.timeout,
+                barrier, results,
+            ))
+            for n in range(count)
+        ]
+        for process in processes:
+            process.start()
+        barrier.wait()
+        started = time.perf_counter()
+        reports = [results.get(timeout=args.timeout + 60) for _ in processes]
+        seconds = time.perf_counter() - started
+        barrier.wait()
+        for process in processes:
+            process.join()
+
+        # Every user must see all of their plans, whichever process ran the jobs
+        store = SQLitePlanStore(os.path.join(directory, "plans"))
+        expected = {owner: n for report in reports for owner, n in report["owners"].items()}
+        consistent = all(len(store.plan_ids(owner)) == n for owner, n in expected.items())
+
+    latencies = [seconds for report in reports for seconds in report["latencies"]]
+    return {
+        "name": "shared_state",
+        "processes": count,
+        "jobs": count * args.jobs_per_process,
+        "ok": len(latencies),
+        "failed": sum(report["failed"] for report in reports),
+        "seconds": seconds,
+        "throughput": len(latencies) / seconds if seconds else None,
+        "consistent": consistent,
+        **latency_summary(latencies),
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Load test app processes sharing SQLite state.")
+    parser.add_argument("--processes", type=int, nargs="+", default=[1, 2, 4], help="process counts (default: 1 2 4)")
+    parser.add_argument("--jobs-per-process", type=int, default=32, help="jobs each process submits (default: 32)")
+    parser.add_argument("--workers", type=int, default=4, help="job workers per process (default: 4)")
+    parser.add_argument("--latency", type=float, default=0.5, help="stub generate() latency in seconds (default: 0.5)")
+    parser.add_argument("--timeout", type=float, default=300, help="seconds allowed per run (default: 300)")
+    parser.add_argument("--output", default="-", help="JSON results file (default: stdout)")
+    args = parser.parse_args(argv)
+
+    results = []
+    with StubImageServer((512, 384)) as server:
+        for count in sorted(args.processes):
+            results.append(bench_processes(count, server, args))
+    base = results[0]["throughput"] / results[0]["processes"] if results and results[0]["throughput"] else None
+    for result in results:
+        # Throughput relative to perfect scaling from the smallest run
+        result["efficiency"] = result["throughput"] / (base * result["processes"]) if base and result["throughput"] else None
+    write_results(args.output, "shared_state_scaling", args, results)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,125 @@
+"""A local stand-in for the g4f image provider.
+
+StubImageServer serves a JPEG of a configurable size over HTTP with an
+optional per-request delay. StubClient and StubAsyncClient mimic the parts
+of g4f's Client/AsyncClient the pipeline uses (`images.generate(...)` and
+`images.create_variation(...)`, both returning `data[0].url`). Their latency
+and error rate are configurable, so benchmarks measure the app's own
+overhead without touching the network.
+"""
+import asyncio
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from io import BytesIO
+from types import SimpleNamespace
+
+import numpy as np
+from PIL import Image
+
+
+def make_image(width, height, quality=85, seed=0):
+    """JPEG bytes of noisy line art, roughly the size of a real plan render."""
+    rng = np.random.default_rng(seed)
+    pixels = np.full((height, width, 3), 245, dtype=np.uint8)
+    for _ in range(max(8, (width + height) // 40)):
+        # Random wall-like strokes keep the JPEG from compressing to nothing
+        if rng.random() < 0.5:
+            y = rng.integers(0, height)
+            pixels[y:y + 3, rng.integers(0, width // 2):rng.integers(width // 2, width)] = 30
+        else:
+            x = rng.integers(0, width)
+            pixels[rng.integers(0, height // 2):rng.integers(height // 2, height), x:x + 3] = 30
+    pixels = np.clip(pixels.astype(np.int16) + rng.integers(-12, 12, pixels.shape), 0, 255).astype(np.uint8)
+    out = BytesIO()
+    Image.fromarray(pixels).save(out, format="JPEG", quality=quality)
+    return out.getvalue()
+
+
+class StubImageServer:
+    """Threaded HTTP server returning the same image for every GET."""
+
+    def __init__(self, image_size=(1024, 768), download_latency=0.0):
+        self.image = make_image(*image_size)
+        self.download_latency = download_latency
+        self.requests = 0
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def do_GET(self):
+                server.requests += 1
+                if server.download_latency:
+                    time.sleep(server.download_latency)
+                self.send_response(200)
+                self.send_header("Content-Type", "image/jpeg")
+                self.send_header("Content-Length", str(len(server.image)))
+                self.end_headers()
+                self.wfile.write(server.image)
+
+            def log_message(self, *args):
+                pass
+
+        self._httpd = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self._httpd.daemon_threads = True
+        self._thread = threading.Thread(target=self._httpd.serve_forever, daemon=True)
+
+    @property
+    def url(self):
+        return "http://127.0.0.1:%d/plan.jpg" % self._httpd.server_address[1]
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._httpd.shutdown()
+        self._httpd.server_close()
+
+
+def _response(url):
+    return SimpleNamespace(data=[SimpleNamespace(url=url, b64_json=None)])
+
+
+class _StubImages:
+    def __init__(self, url, latency, error_rate):
+        self.url = url
+        self.latency = latency
+        self.error_rate = error_rate
+        self.calls = 0
+
+    def _outcome(self):
+        self.calls += 1
+        if random.random() < self.error_rate:
+            raise RuntimeError("stub provider error")
+        return _response(self.url)
+
+
+class _SyncImages(_StubImages):
+    def generate(self, prompt, model=None, response_format=None, **kwargs):
+        time.sleep(self.latency)
+        return self._outcome()
+
+    def create_variation(self, image, model=None, prompt=None, response_format=None, **kwargs):
+        return self.generate(prompt, model, response_format)
+
+
+class _AsyncImages(_StubImages):
+    async def generate(self, prompt, model=None, response_format=None, **kwargs):
+        await asyncio.sleep(self.latency)
+        return self._outcome()
+
+    async def create_variation(self, image, model=None, prompt=None, response_format=None, **kwargs):
+        return await self.generate(prompt, model, response_format)
+
+
+class StubClient:
+    def __init__(self, url, latency=0.0, error_rate=0.0):
+        self.images = _SyncImages(url, latency, error_rate)
+
+
+class StubAsyncClient:
+    def __init__(self, url, latency=0.0, error_rate=0.0):
+        self.images = _AsyncImages(url, latency, error_rate)
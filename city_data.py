@@ -0,0 +1,74 @@
+"""City reference data: material prices, builders and solar installers.
+
+The data lives in data/cities.json with numeric prices; display strings
+are produced here. Adding a city is a data change only.
+"""
+import json
+import os
+
+DATA_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "data", "cities.json")
+SCHEMA_VERSION = 1
+
+
+def format_inr(amount):
+    """Format a rupee amount with Indian digit grouping, e.g. ₹1,20,000."""
+    digits = str(int(amount))
+    if len(digits) > 3:
+        head, tail = digits[:-3], digits[-3:]
+        groups = []
+        while len(head) > 2:
+            groups.insert(0, head[-2:])
+            head = head[:-2]
+        if head:
+            groups.insert(0, head)
+        digits = ",".join(groups) + "," + tail
+    return "₹" + digits
+
+
+class CityData:
+    def __init__(self, raw):
+        if raw.get("version") != SCHEMA_VERSION:
+            raise ValueError(f"unsupported city data version {raw.get('version')!r}, expected {SCHEMA_VERSION}")
+        self.version = raw["version"]
+        self.materials = raw["materials"]
+        self.cities = {city["name"]: city for city in raw["cities"]}
+        self.city_names = list(self.cities)
+        self.default_city = self.city_names[0]
+
+    def city(self, name):
+        # Unknown cities fall back to the first listed one
+        return self.cities.get(name) or self.cities[self.default_city]
+
+    def material_rows(self, name):
+        city = self.city(name)
+        rows = []
+        for material in self.materials:
+            entry = city["materials"][material["key"]]
+            rows.append((
+                f"{material['name']} (per {material['unit']})",
+                format_inr(entry["price"]),
+                f"{entry['supplier']}, {entry['contact']}",
+            ))
+        return rows
+
+    def builder_rows(self, name):
+        return [
+            (b["name"], f"₹{b['budget_lakhs'][0]}-{b['budget_lakhs'][1]} Lakhs", b["contact"])
+            for b in self.city(name)["builders"]
+        ]
+
+    def solar_rows(self, name):
+        return [
+            (s["company"], f"{format_inr(s['price'][0])} - {format_inr(s['price'][1])} ({s['capacity_kw']}kW)", s["contact"])
+            for s in self.city(name)["solar"]
+        ]
+
+    def material_prices(self, name):
+        """Numeric unit prices keyed by material, in the order of `materials`."""
+        city = self.city(name)
+        return {m["key"]: city["materials"][m["key"]]["price"] for m in self.materials}
+
+
+def load_city_data(path=DATA_PATH):
+    with open(path, encoding="utf-8") as f:
+        return CityData(json.load(f))
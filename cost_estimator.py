@@ -0,0 +1,98 @@
+"""Construction material cost estimates from a plan spec.
+
+Quantities come from thumb-rule rates per square foot of built-up area
+plus allowances for partitioned rooms and bathrooms. They are priced
+against the city unit-price table. Everything is done on NumPy arrays,
+so one call can price many specs against many cities:
+
+    costs[spec, city, material] = quantities[spec, material] * prices[city, material]
+"""
+from dataclasses import dataclass, fields, replace
+
+import numpy as np
+
+# Quantity per square foot of built-up area, in each material's price unit:
+# steel in tonnes, bricks in thousands, cement in 50 kg bags, sand in units of 100 cft
+PER_SQFT = {"steel": 0.004, "bricks": 0.008, "cement": 0.4, "sand": 0.018}
+# Partition walls, lintels and plastering for every enclosed room
+PER_ROOM = {"steel": 0.05, "bricks": 1.0, "cement": 5.0, "sand": 0.2}
+# Waterproofing, tiling beds and plumbing chases for every bathroom
+PER_BATHROOM = {"steel": 0.0, "bricks": 0.5, "cement": 8.0, "sand": 0.3}
+# The only spec fields an estimate depends on
+COST_FIELDS = (
+    "length", "width", "num_floors", "basement", "bedrooms", "bathrooms",
+    "kitchen", "living_room", "dining_room", "office", "laundry", "pantry", "mudroom",
+)
+
+
+@dataclass
+class CostEstimate:
+    materials: list      # material keys, last axis
+    cities: list         # city names, middle axis of `costs`
+    built_up_area: np.ndarray  # (specs,) square feet
+    quantities: np.ndarray     # (specs, materials)
+    prices: np.ndarray         # (cities, materials)
+    costs: np.ndarray          # (specs, cities, materials)
+
+    @property
+    def totals(self):
+        """Total material cost, shape (specs, cities)."""
+        return self.costs.sum(axis=-1)
+
+
+def cost_spec(spec):
+    """`spec` with every field outside COST_FIELDS reset to its default.
+
+    Specs that only differ in style, rendering or city map to the same value,
+    so it makes a good cache key for estimates.
+    """
+    defaults = {f.name: f.default for f in fields(spec) if f.name not in COST_FIELDS}
+    return replace(spec, **defaults)
+
+
+def _enclosed_rooms(spec):
+    return (spec.bedrooms + spec.kitchen + spec.living_room + spec.dining_room + spec.office
+            + spec.laundry + spec.pantry + spec.mudroom)
+
+
+def spec_arrays(specs):
+    """Return (built_up_area, rooms, bathrooms) arrays for a list of specs."""
+    footprint = np.array([s.length * s.width for s in specs], dtype=float)
+    floors = np.array([s.num_floors + s.basement for s in specs], dtype=float)
+    rooms = np.array([_enclosed_rooms(s) for s in specs], dtype=float)
+    bathrooms = np.array([s.bathrooms for s in specs], dtype=float)
+    return footprint * floors, rooms, bathrooms
+
+
+def material_quantities(specs, materials):
+    """Quantities of each material for each spec, shape (specs, materials)."""
+    area, rooms, bathrooms = spec_arrays(specs)
+    rates = np.array([[PER_SQFT[m], PER_ROOM[m], PER_BATHROOM[m]] for m in materials], dtype=float)
+    drivers = np.stack([area, rooms, bathrooms], axis=1)  # (specs, 3)
+    return drivers @ rates.T
+
+
+def price_matrix(city_data, cities):
+    """Unit prices, shape (cities, materials), in `city_data.materials` order."""
+    return np.array(
+        [list(city_data.material_prices(city).values()) for city in cities], dtype=float
+    )
+
+
+def estimate_costs(specs, city_data, cities=None):
+    """Price one spec or a list of specs against `cities` (default: all)."""
+    if not isinstance(specs, (list, tuple)):
+        specs = [specs]
+    cities = list(cities) if cities is not None else city_data.city_names
+    materials = [m["key"] for m in city_data.materials]
+    quantities = material_quantities(specs, materials)
+    prices = price_matrix(city_data, cities)
+    area = spec_arrays(specs)[0]
+    return CostEstimate(
+        materials=materials,
+        cities=cities,
+        built_up_area=area,
+        quantities=quantities,
+        prices=prices,
+        costs=quantities[:, None, :] * prices[None, :, :],
+    )
@@ -0,0 +1,115 @@
+"""Image helpers built on Pillow.
+
+`optimize_image` re-encodes provider images by content: rendered plans
+become WebP (JPEG without WebP support), and line-art blueprints become
+palette PNGs, which are usually far smaller for them. Metadata is dropped
+on re-encode. The work is CPU-bound, so callers run it on IMAGE_POOL.
+"""
+import os
+from concurrent.futures import ThreadPoolExecutor
+from io import BytesIO
+
+from PIL import Image, features
+
+THUMBNAIL_SIZE = (400, 400)  # 2x the 200px preview width for high-DPI screens
+DISPLAY_SIZE = (1600, 1600)  # roughly 2x the plan column width
+PHOTO_QUALITY = 85
+PALETTE_COLORS = 32  # line art plus its anti-aliased edges
+LINE_ART_COLORS = 16  # at most this many colours cover...
+LINE_ART_SHARE = 0.9  # ...this share of pixels in a line drawing
+# Pillow releases the GIL while encoding and decoding, so threads scale
+IMAGE_POOL = ThreadPoolExecutor(max_workers=min(8, os.cpu_count() or 1), thread_name_prefix="image")
+IMAGE_SIGNATURES = [
+    (b"\xff\xd8\xff", "image/jpeg"),
+    (b"\x89PNG\r\n\x1a\n", "image/png"),
+    (b"GIF87a", "image/gif"),
+    (b"GIF89a", "image/gif"),
+]
+EXTENSIONS = {"image/jpeg": ".jpg", "image/png": ".png", "image/gif": ".gif", "image/webp": ".webp"}
+
+
+def image_mime(data):
+    """MIME type from the leading bytes of `data`, or None if it isn't a known image."""
+    head = bytes(data[:16])
+    if head[:4] == b"RIFF" and head[8:12] == b"WEBP":
+        return "image/webp"
+    for signature, mime in IMAGE_SIGNATURES:
+        if head.startswith(signature):
+            return mime
+    return None
+
+
+def make_thumbnail(image_data, size=THUMBNAIL_SIZE, quality=80):
+    """Return JPEG bytes of `image_data` scaled to fit within `size`."""
+    with Image.open(BytesIO(image_data)) as img:
+        img.draft("RGB", size)  # lets JPEG decode at reduced scale
+        img = img.convert("RGB")
+        img.thumbnail(size, Image.LANCZOS)
+        out = BytesIO()
+        img.save(out, format="JPEG", quality=quality, optimize=True)
+    return out.getvalue()
+
+
+def image_extension(mime):
+    """File extension for `mime`, defaulting to .jpg."""
+    return EXTENSIONS.get(mime, ".jpg")
+
+
+def is_line_art(img):
+    """True if a few flat colours cover nearly all of `img`, as in a blueprint."""
+    small = img.convert("RGB")
+    small.thumbnail((256, 256))
+    # Bucket to 5 bits per channel so JPEG noise doesn't split flat areas
+    small = small.point(lambda v: v & 0xF8)
+    colors = small.getcolors(maxcolors=small.width * small.height)
+    top = sorted((count for count, _ in colors), reverse=True)[:LINE_ART_COLORS]
+    return sum(top) >= LINE_ART_SHARE * small.width * small.height
+
+
+def _encode_photo(img):
+    out = BytesIO()
+    has_alpha = img.mode in ("RGBA", "LA") or "transparency" in img.info
+    if features.check("webp"):
+        img.convert("RGBA" if has_alpha else "RGB").save(out, format="WEBP", quality=PHOTO_QUALITY, method=4)
+        return out, "image/webp"
+    img.convert("RGB").save(out, format="JPEG", quality=PHOTO_QUALITY, optimize=True, progressive=True)
+    return out, "image/jpeg"
+
+
+def optimize_image(data, max_size=None):
+    """Re-encode `data` for storage; returns `(bytes, mime)`.
+
+    With `max_size` the image is also scaled to fit within it. Without one,
+    the original bytes are kept if re-encoding doesn't make them smaller.
+    Data Pillow can't decode is returned as is.
+    """
+    try:
+        with Image.open(BytesIO(data)) as img:
+            if max_size:
+                img.draft("RGB", max_size)
+            img.load()
+            if max_size:
+                img.thumbnail(max_size, Image.LANCZOS)
+            out, mime = _encode_photo(img)
+            if is_line_art(img):
+                # Noisy renders can pass as line art; keep whichever is smaller
+                palette = BytesIO()
+                img.convert("RGB").quantize(PALETTE_COLORS, dither=Image.Dither.NONE).save(palette, format="PNG", optimize=True)
+                if palette.tell() < out.tell():
+                    out, mime = palette, "image/png"
+    except (OSError, ValueError, Image.DecompressionBombError):
+        return data, image_mime(data)
+    if max_size is None and out.tell() >= len(data):
+        return data, image_mime(data)
+    return out.getvalue(), mime
+
+
+def display_variant(data, size=DISPLAY_SIZE):
+    """Optimized copy of `data` scaled to fit `size`, or None if it already fits."""
+    try:
+        with Image.open(BytesIO(data)) as img:
+            if img.width <= size[0] and img.height <= size[1]:
+                return None
+    except (OSError, ValueError):
+        return None
+    return optimize_image(data, max_size=size)[0]
@@ -0,0 +1,255 @@
+"""Deterministic local floor-plan layouts.
+
+Rooms from a PlanSpec are packed into the length x width footprint with a
+squarified treemap. Public rooms and private rooms go in separate zones.
+The result has true room dimensions and renders to SVG or PNG in
+milliseconds. The app uses it as an instant preview and as a fallback when
+the image provider fails.
+"""
+from dataclasses import dataclass, field
+from io import BytesIO
+
+from PIL import Image, ImageDraw, ImageFont
+
+from plan_generator import floor_label
+
+# Nominal room sizes in square feet; the packer scales them to the footprint
+ROOM_AREAS = {
+    "Living Room": 260,
+    "Kitchen": 130,
+    "Dining Room": 150,
+    "Home Office": 100,
+    "Laundry Room": 50,
+    "Pantry": 35,
+    "Mudroom": 40,
+    "Staircase": 80,
+    "Master Bedroom": 190,
+    "Bedroom": 140,
+    "Bathroom": 50,
+    "1-Car Garage": 260,
+    "2-Car Garage": 460,
+    "3-Car Garage": 680,
+}
+PUBLIC, PRIVATE = "public", "private"
+MIN_ZONE = 10  # feet; thinner zones make unusable strip-shaped rooms
+SLACK_FACTOR = 1.3  # rooms may grow 30% over nominal before the rest becomes circulation
+
+
+@dataclass
+class Room:
+    name: str
+    x: float      # feet from the west wall
+    y: float      # feet from the north wall
+    width: float  # east-west extent in feet
+    depth: float  # north-south extent in feet
+    zone: str = PUBLIC
+
+    @property
+    def area(self):
+        return self.width * self.depth
+
+    @property
+    def dimensions(self):
+        return f"{self.width:.1f}' x {self.depth:.1f}'".replace(".0'", "'")
+
+
+@dataclass
+class FloorLayout:
+    label: str
+    length: float
+    width: float
+    rooms: list = field(default_factory=list)
+
+
+def room_program(spec, floor=1):
+    """(name, nominal area, zone) for each room on `floor` of `spec`."""
+    program = []
+    for name, count in spec.rooms(floor):
+        if name not in ROOM_AREAS:
+            continue
+        if count is None:
+            program.append((name, ROOM_AREAS[name], PUBLIC))
+            continue
+        # Numbering continues across floors; the master suite is the first bedroom
+        first = 1 + sum(dict(spec.rooms(f)).get(name) or 0 for f in range(1, floor))
+        for n in range(first, first + count):
+            if name == "Bedroom" and n == 1:
+                program.append(("Master Bedroom", ROOM_AREAS["Master Bedroom"], PRIVATE))
+            else:
+                program.append((f"{name} {n}", ROOM_AREAS[name], PRIVATE))
+    return program
+
+
+def with_circulation(program, length, width, floor=1):
+    """`program` plus a circulation room for the space the rooms don't need.
+
+    Leftover space becomes circulation rather than oversized rooms.
+    """
+    program = list(program)
+    slack = length * width - SLACK_FACTOR * sum(room[1] for room in program)
+    if slack > 0:
+        program.append((circulation_name(floor), slack, PUBLIC))
+    return program
+
+
+def circulation_name(floor=1):
+    return "Foyer" if floor == 1 else "Open Terrace"
+
+
+def _worst(row, side):
+    total = sum(row)
+    return max(max(side * side * a / (total * total), total * total / (side * side * a)) for a in row)
+
+
+def squarify(areas, x, y, width, depth):
+    """Split the rectangle into cells with the given areas (sorted descending).
+
+    Returns (x, y, width, depth) tuples in input order. Cells are kept as
+    close to square as the areas allow (Bruls, Huizing & van Wijk).
+    """
+    rects = []
+    remaining = list(areas)
+    while remaining:
+        side = min(width, depth)
+        row = [remaining[0]]
+        n = 1
+        while n < len(remaining) and _worst(row + [remaining[n]], side) <= _worst(row, side):
+            row.append(remaining[n])
+            n += 1
+        remaining = remaining[n:]
+        total = sum(row)
+        if width >= depth:
+            # Lay the row as a column along the west edge of the free space
+            thickness = total / depth if depth else 0
+            cy = y
+            for area in row:
+                d = area / thickness if thickness else 0
+                rects.append((x, cy, thickness, d))
+                cy += d
+            x += thickness
+            width -= thickness
+        else:
+            thickness = total / width if width else 0
+            cx = x
+            for area in row:
+                w = area / thickness if thickness else 0
+                rects.append((cx, y, w, thickness))
+                cx += w
+            y += thickness
+            depth -= thickness
+    return rects
+
+
+def _pack(program, x, y, width, depth):
+    program = sorted(program, key=lambda room: -room[1])
+    scale = width * depth / sum(room[1] for room in program)
+    rects = squarify([room[1] * scale for room in program], x, y, width, depth)
+    return [Room(name, *rect, zone=zone) for (name, _, zone), rect in zip(program, rects)]
+
+
+def layout_floor(spec, floor=1, program=None):
+    """Pack one floor, keeping bedrooms and bathrooms apart from living areas.
+
+    The private zone takes the west (or north, on deep plots) end of the
+    footprint when both zones stay at least MIN_ZONE feet thick; otherwise all
+    rooms are packed together.
+    """
+    program = list(program if program is not None else room_program(spec, floor))
+    label = floor_label(floor) if spec.num_floors > 1 else "Floor Plan"
+    layout = FloorLayout(label, float(spec.length), float(spec.width))
+    if not program:
+        return layout
+
+    program = with_circulation(program, layout.length, layout.width, floor)
+    public = [room for room in program if room[2] == PUBLIC]
+    private = [room for room in program if room[2] == PRIVATE]
+    share = sum(room[1] for room in private) / sum(room[1] for room in program)
+    long_side = max(layout.length, layout.width)
+    split = long_side * share
+    if not public or not private or min(split, long_side - split) < MIN_ZONE:
+        layout.rooms = _pack(program, 0.0, 0.0, layout.length, layout.width)
+    elif layout.length >= layout.width:
+        layout.rooms = (
+            _pack(private, 0.0, 0.0, split, layout.width)
+            + _pack(public, split, 0.0, layout.length - split, layout.width)
+        )
+    else:
+        layout.rooms = (
+            _pack(private, 0.0, 0.0, layout.length, split)
+            + _pack(public, 0.0, split, layout.length, layout.width - split)
+        )
+    return layout
+
+
+def plan_layout(spec):
+    """One FloorLayout per floor of `spec`."""
+    return [layout_floor(spec, floor) for floor in range(1, spec.num_floors + 1)]
+
+
+def _colors(spec):
+    if spec is not None and spec.color_scheme.startswith("Blueprint"):
+        return "#1f4e8c", "#ffffff", "#ffffff"
+    if spec is not None and spec.color_scheme == "Colored":
+        return "#ffffff", "#333333", "#222222"
+    return "#ffffff", "#222222", "#222222"
+
+
+ZONE_FILL = {PUBLIC: "#fdf3d8", PRIVATE: "#dceefc"}
+
+
+def render_svg(layout, spec=None, scale=10, margin=40):
+    """SVG markup for a floor layout; `scale` is pixels per foot."""
+    background, line, text = _colors(spec)
+    colored = spec is not None and spec.color_scheme == "Colored"
+    w = layout.length * scale + 2 * margin
+    h = layout.width * scale + 2 * margin
+    parts = [
+        f'<svg xmlns="http://www.w3.org/2000/svg" width="{w:.0f}" height="{h:.0f}" viewBox="0 0 {w:.0f} {h:.0f}" font-family="sans-serif">',
+        f'<rect width="100%" height="100%" fill="{background}"/>',
+    ]
+    for room in layout.rooms:
+        x, y = margin + room.x * scale, margin + room.y * scale
+        fill = ZONE_FILL[room.zone] if colored else "none"
+        parts.append(f'<rect x="{x:.1f}" y="{y:.1f}" width="{room.width * scale:.1f}" height="{room.depth * scale:.1f}" fill="{fill}" stroke="{line}" stroke-width="2"/>')
+        cx, cy = x + room.width * scale / 2, y + room.depth * scale / 2
+        parts.append(f'<text x="{cx:.1f}" y="{cy - 3:.1f}" font-size="12" text-anchor="middle" fill="{text}">{room.name}</text>')
+        parts.append(f'<text x="{cx:.1f}" y="{cy + 12:.1f}" font-size="11" text-anchor="middle" fill="{text}">{room.dimensions}</text>')
+    parts.append(f'<rect x="{margin}" y="{margin}" width="{layout.length * scale:.1f}" height="{layout.width * scale:.1f}" fill="none" stroke="{line}" stroke-width="4"/>')
+    parts.append(f'<text x="{w / 2:.1f}" y="{margin - 12}" font-size="14" text-anchor="middle" fill="{text}">{layout.length:g}\'</text>')
+    parts.append(f'<text x="{margin - 12}" y="{h / 2:.1f}" font-size="14" text-anchor="middle" fill="{text}" transform="rotate(-90 {margin - 12} {h / 2:.1f})">{layout.width:g}\'</text>')
+    parts.append(f'<text x="{margin}" y="{h - 12:.1f}" font-size="14" fill="{text}">{layout.label}</text>')
+    parts.append("</svg>")
+    return "\n".join(parts)
+
+
+def _font(size):
+    try:
+        return ImageFont.load_default(size=size)
+    except TypeError:  # Pillow < 10.1
+        return ImageFont.load_default()
+
+
+def render_png(layout, spec=None, max_px=1200, margin=40):
+    """PNG bytes for a floor layout, scaled to at most `max_px` wide."""
+    background, line, text = _colors(spec)
+    colored = spec is not None and spec.color_scheme == "Colored"
+    scale = max(4.0, min(20.0, (max_px - 2 * margin) / max(layout.length, 1)))
+    w = int(layout.length * scale + 2 * margin)
+    h = int(layout.width * scale + 2 * margin)
+    img = Image.new("RGB", (w, h), background)
+    draw = ImageDraw.Draw(img)
+    label_font, dim_font, title_font = _font(13), _font(11), _font(15)
+    for room in layout.rooms:
+        x0, y0 = margin + room.x * scale, margin + room.y * scale
+        x1, y1 = x0 + room.width * scale, y0 + room.depth * scale
+        draw.rectangle([x0, y0, x1, y1], fill=ZONE_FILL[room.zone] if colored else None, outline=line, width=2)
+        cx, cy = (x0 + x1) / 2, (y0 + y1) / 2
+        draw.text((cx, cy - 8), room.name, fill=text, font=label_font, anchor="mm")
+        draw.text((cx, cy + 8), room.dimensions, fill=text, font=dim_font, anchor="mm")
+    draw.rectangle([margin, margin, w - margin, h - margin], outline=line, width=4)
+    draw.text((w / 2, margin / 2), f"{layout.length:g}'", fill=text, font=title_font, anchor="mm")
+    draw.text((margin / 2, h / 2), f"{layout.width:g}'", fill=text, font=title_font, anchor="mm")
+    draw.text((margin, h - margin / 2), layout.label, fill=text, font=title_font, anchor="lm")
+    out = BytesIO()
+    img.save(out, format="PNG", optimize=True)
+    return out.getvalue()
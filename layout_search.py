@@ -0,0 +1,280 @@
+"""Search many candidate room arrangements and keep the best few.
+
+Each candidate is a randomized variant of the layout_engine treemap:
+- room order is shuffled by a noisy area sort;
+- the private/public zone split is moved;
+- zones are sometimes merged;
+- the plan is mirrored.
+
+Candidates are scored in batches with NumPy on four criteria:
+- utilization: floor area left usable by well-proportioned rooms;
+- adjacency: kitchen next to dining, bedrooms next to a bathroom, and so on;
+- circulation: rooms are close to and open onto the entry;
+- orientation: hints such as "east-facing bedrooms" in the special
+  instructions.
+
+Chunks of candidates are evaluated across a process pool. The top layouts
+carry real room dimensions, which are written into the image prompt.
+"""
+import multiprocessing
+import re
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass, field
+
+import numpy as np
+
+from layout_engine import (
+    MIN_ZONE, PRIVATE, FloorLayout, Room, circulation_name, room_program, squarify, with_circulation,
+)
+from metrics import spec_labels, timed
+from plan_generator import floor_label
+
+DEFAULT_CANDIDATES = 4000  # per floor
+CHUNK_SIZE = 500           # candidates scored per batch / per worker task
+MIN_DOOR = 3.0             # feet of shared wall needed for a doorway
+MIN_ROOM_WIDTH = 7.0       # feet; narrower rooms count as partly unusable
+MIN_ASPECT = 0.5           # rooms thinner than 1:2 count as partly unusable
+EDGE = 0.01                # feet; tolerance when testing whether walls touch
+WEIGHTS = {"utilization": 0.35, "adjacency": 0.3, "circulation": 0.15, "orientation": 0.2}
+
+ROOM_KEYWORDS = (
+    "master bedroom", "bedroom", "bathroom", "kitchen", "living room", "dining room",
+    "office", "garage", "laundry", "pantry", "staircase",
+)
+_DIRECTION = re.compile(
+    r"\b(?:(north|south|east|west)(?:[- ]facing|[- ]side)"
+    r"|(?:fac(?:e|es|ing)|on the|to the|towards?)\s+(?:the\s+)?(north|south|east|west))\b"
+)
+
+
+@dataclass
+class ScoredLayout:
+    floors: list  # one FloorLayout per floor
+    score: float
+    breakdown: dict = field(default_factory=dict)
+
+    def room_dimensions(self):
+        """One "Room W' x D', ..." string per floor, for PlanSpec.room_dimensions."""
+        return tuple(
+            ", ".join(f"{room.name} {room.dimensions}" for room in layout.rooms)
+            for layout in self.floors
+        )
+
+
+def orientation_hints(text):
+    """(room keyword, side) pairs found in free text, e.g. ("bedroom", "east")."""
+    hints = []
+    for clause in re.split(r"[.,;:\n]+", (text or "").lower()):
+        directions = [(m.start(), m.group(1) or m.group(2)) for m in _DIRECTION.finditer(clause)]
+        if not directions:
+            continue
+        taken = []
+        for keyword in ROOM_KEYWORDS:
+            for m in re.finditer(r"\b%ss?\b" % keyword, clause):
+                if any(start <= m.start() < end for start, end in taken):
+                    continue  # "bedroom" inside an already matched "master bedroom"
+                taken.append((m.start(), m.end()))
+                # Pair each room with the closest direction in the same clause
+                side = min(directions, key=lambda d: abs(d[0] - m.start()))[1]
+                if (keyword, side) not in hints:
+                    hints.append((keyword, side))
+    return hints
+
+
+def _candidate(program, length, width, rng):
+    """(rooms, 4) array of x, y, width, depth in program order for one random arrangement."""
+    n = len(program)
+    areas = np.array([room[1] for room in program], dtype=float)
+    private = np.array([room[2] == PRIVATE for room in program])
+    # Sigma 0 reproduces the sorted treemap; larger sigmas shuffle more
+    keys = -areas * np.exp(rng.normal(0.0, rng.uniform(0.0, 0.8), n))
+
+    long_side = max(length, width)
+    split = long_side * areas[private].sum() / areas.sum() * rng.uniform(0.85, 1.15)
+    if private.all() or not private.any() or min(split, long_side - split) < MIN_ZONE or rng.random() < 0.1:
+        zones = [(np.arange(n), 0.0, 0.0, length, width)]
+    elif length >= width:
+        zones = [(np.flatnonzero(private), 0.0, 0.0, split, width),
+                 (np.flatnonzero(~private), split, 0.0, length - split, width)]
+    else:
+        zones = [(np.flatnonzero(private), 0.0, 0.0, length, split),
+                 (np.flatnonzero(~private), 0.0, split, length, width - split)]
+
+    rects = np.zeros((n, 4))
+    for members, x, y, w, d in zones:
+        members = members[np.argsort(keys[members], kind="stable")]
+        scale = w * d / areas[members].sum()
+        rects[members] = squarify(list(areas[members] * scale), x, y, w, d)
+    if rng.random() < 0.5:
+        rects[:, 0] = length - rects[:, 0] - rects[:, 2]  # mirror east-west
+    if rng.random() < 0.5:
+        rects[:, 1] = width - rects[:, 1] - rects[:, 3]   # mirror north-south
+    return rects
+
+
+def shared_walls(rects):
+    """(N, rooms, rooms) length of wall each pair of rooms shares."""
+    x, y, w, d = np.moveaxis(rects, -1, 0)
+    x0, x1, y0, y1 = x[:, :, None], (x + w)[:, :, None], y[:, :, None], (y + d)[:, :, None]
+    X0, X1, Y0, Y1 = x[:, None, :], (x + w)[:, None, :], y[:, None, :], (y + d)[:, None, :]
+    overlap_x = np.minimum(x1, X1) - np.maximum(x0, X0)
+    overlap_y = np.minimum(y1, Y1) - np.maximum(y0, Y0)
+    stacked = (np.abs(y1 - Y0) < EDGE) | (np.abs(Y1 - y0) < EDGE)
+    beside = (np.abs(x1 - X0) < EDGE) | (np.abs(X1 - x0) < EDGE)
+    return np.maximum(np.where(stacked, overlap_x, 0.0), np.where(beside, overlap_y, 0.0)).clip(min=0.0)
+
+
+def _wanted_neighbours(names):
+    """(room index, partner indices, weight): the room should share a wall with any partner."""
+    def find(*prefixes):
+        return [i for i, name in enumerate(names) if name.startswith(prefixes)]
+
+    wants = []
+    for rooms, partners, weight in [
+        (find("Kitchen"), find("Dining Room"), 2.0),
+        (find("Kitchen"), find("Pantry"), 1.0),
+        (find("Dining Room"), find("Living Room"), 1.0),
+        (find("Master Bedroom"), find("Bathroom"), 2.0),
+        (find("Bedroom"), find("Bathroom"), 1.0),
+        (find("1-Car", "2-Car", "3-Car"), find("Mudroom", "Laundry Room", "Kitchen"), 1.0),
+        (find("Staircase"), find(circulation_name(1), circulation_name(2), "Living Room"), 1.0),
+    ]:
+        if partners:
+            wants.extend((room, partners, weight) for room in rooms)
+    return wants
+
+
+def score_batch(rects, program, length, width, hints=()):
+    """Score N candidate arrangements at once.
+
+    `rects` is an (N, rooms, 4) array of x, y, width, depth in program
+    order. Returns the (N,) total and a dict of (N,) per-criterion scores,
+    all between 0 and 1.
+    """
+    names = [room[0] for room in program]
+    x, y, w, d = np.moveaxis(rects, -1, 0)
+    walls = shared_walls(rects)
+    circulation = np.array([name in (circulation_name(1), circulation_name(2)) for name in names])
+    scores = {}
+
+    # Utilization: area in rooms that are wide enough and not strip-shaped
+    short, long = np.minimum(w, d), np.maximum(w, d)
+    usable = w * d * np.clip(short / np.maximum(long, EDGE) / MIN_ASPECT, 0, 1) * np.clip(short / MIN_ROOM_WIDTH, 0, 1)
+    rooms = ~circulation if (~circulation).any() else np.ones(len(names), dtype=bool)
+    scores["utilization"] = usable[:, rooms].sum(axis=1) / (w * d)[:, rooms].sum(axis=1)
+
+    # Adjacency: weighted share of wanted neighbours that have room for a door between them
+    wants = _wanted_neighbours(names)
+    if wants:
+        met = sum(weight * np.clip(walls[:, room, partners].max(axis=1) / MIN_DOOR, 0, 1) for room, partners, weight in wants)
+        scores["adjacency"] = met / sum(weight for _, _, weight in wants)
+    else:
+        scores["adjacency"] = np.ones(len(rects))
+
+    # Circulation: rooms close to the entry, and opening onto it directly
+    entry = int(np.flatnonzero(circulation)[0]) if circulation.any() else (names.index("Living Room") if "Living Room" in names else 0)
+    others = np.arange(len(names)) != entry
+    if others.any():
+        cx, cy = x + w / 2, y + d / 2
+        distance = (np.abs(cx - cx[:, entry:entry + 1]) + np.abs(cy - cy[:, entry:entry + 1]))[:, others]
+        reach = 1 - distance.mean(axis=1) / ((length + width) / 2)
+        opens = (walls[:, entry, others] >= MIN_DOOR).mean(axis=1)
+        scores["circulation"] = np.clip(0.5 * reach + 0.5 * opens, 0, 1)
+    else:
+        scores["circulation"] = np.ones(len(rects))
+
+    # Orientation: hinted rooms touching the requested exterior wall (x runs west to east, y north to south)
+    on_side = {
+        "north": y < EDGE, "south": y + d > width - EDGE,
+        "west": x < EDGE, "east": x + w > length - EDGE,
+    }
+    matched = [(i, side) for keyword, side in hints for i, name in enumerate(names) if keyword in name.lower()]
+    if matched:
+        scores["orientation"] = np.mean([on_side[side][:, i] for i, side in matched], axis=0)
+
+    total = sum(WEIGHTS[name] * value for name, value in scores.items()) / sum(WEIGHTS[name] for name in scores)
+    return total, scores
+
+
+def _fingerprint(rects):
+    return tuple(np.round(rects * 2).astype(int).ravel())  # half-foot grid
+
+
+def _search_chunk(program, length, width, hints, seed, count, keep):
+    """Generate and score `count` candidates; returns the best `keep` as (score, breakdown, rects)."""
+    rng = np.random.default_rng(seed)
+    rects = np.stack([_candidate(program, length, width, rng) for _ in range(count)])
+    total, scores = score_batch(rects, program, length, width, hints)
+    best, seen = [], set()
+    for i in np.argsort(-total, kind="stable"):
+        key = _fingerprint(rects[i])
+        if key in seen:
+            continue
+        seen.add(key)
+        best.append((float(total[i]), {name: float(value[i]) for name, value in scores.items()}, rects[i]))
+        if len(best) == keep:
+            break
+    return best
+
+
+def make_pool(workers=None):
+    """A process pool for search chunks; spawned, so it is safe to create from threaded servers."""
+    return ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn"))
+
+
+def search_layouts(spec, candidates=DEFAULT_CANDIDATES, top_k=3, executor=None, seed=0):
+    """The `top_k` best ScoredLayouts for `spec`, best first.
+
+    Each floor is searched separately over `candidates` arrangements. The
+    n-th result combines the n-th best layout of every floor and is scored by
+    their mean. Chunks run on `executor` (e.g. `make_pool()`) when given,
+    otherwise in this process. Results are deterministic for a given `seed`.
+    """
+    length, width = float(spec.length), float(spec.width)
+    hints = orientation_hints(spec.special_instructions)
+    floors = list(range(1, spec.num_floors + 1))
+    programs = {floor: with_circulation(room_program(spec, floor), length, width, floor) for floor in floors}
+    chunks = [
+        (floor, (programs[floor], length, width, hints, [seed, floor, n], min(CHUNK_SIZE, candidates - start), top_k))
+        for floor in floors if programs[floor]
+        for n, start in enumerate(range(0, candidates, CHUNK_SIZE))
+    ]
+
+    with timed("layout_search", **spec_labels(spec)):
+        if executor is None:
+            results = [_search_chunk(*args) for _, args in chunks]
+        else:
+            results = list(executor.map(_search_chunk, *zip(*(args for _, args in chunks))))
+
+    ranked = {floor: [] for floor in floors}
+    for (floor, _), best in zip(chunks, results):
+        ranked[floor].extend(best)
+    label = (lambda floor: floor_label(floor)) if spec.num_floors > 1 else (lambda floor: "Floor Plan")
+    per_floor = []
+    for floor in floors:
+        layouts, seen = [], set()
+        for score, breakdown, rects in sorted(ranked[floor], key=lambda item: -item[0]):
+            key = _fingerprint(rects)
+            if key in seen:
+                continue
+            seen.add(key)
+            layout = FloorLayout(label(floor), length, width, [
+                Room(name, *map(float, rect), zone=zone) for (name, _, zone), rect in zip(programs[floor], rects)
+            ])
+            layouts.append((score, breakdown, layout))
+            if len(layouts) == top_k:
+                break
+        if not layouts:  # nothing to place on this floor
+            layouts = [(1.0, {}, FloorLayout(label(floor), length, width))]
+        per_floor.append(layouts)
+
+    scored = []
+    for n in range(max(len(layouts) for layouts in per_floor)):
+        picks = [layouts[min(n, len(layouts) - 1)] for layouts in per_floor]
+        names = {name for _, breakdown, _ in picks for name in breakdown}
+        scored.append(ScoredLayout(
+            floors=[layout for _, _, layout in picks],
+            score=float(np.mean([score for score, _, _ in picks])),
+            breakdown={name: float(np.mean([b[name] for _, b, _ in picks if name in b])) for name in sorted(names)},
+        ))
+    return scored
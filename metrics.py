@@ -0,0 +1,219 @@
+"""Counters, histograms and per-stage timing for the generation pipeline.
+
+Every pipeline stage (prompt, generate, download, optimize, persist, render)
+is wrapped in `timed(stage, ...)`. That records a histogram observation
+tagged with model, render_style and resolution and emits one JSON line on the
+"house_plans.timing" logger. The registry renders in the Prometheus text
+format and can be served over HTTP (`start_http_server`) or written to a
+file periodically (`start_file_exporter`).
+"""
+import bisect
+import cProfile
+import io
+import json
+import logging
+import os
+import pstats
+import threading
+import time
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from storage_utils import write_atomic
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120)
+STAGE_LABELS = ("stage", "model", "render_style", "resolution")
+
+timing_log = logging.getLogger("house_plans.timing")
+
+
+def _label_text(names, values):
+    if not names:
+        return ""
+    pairs = ",".join('%s="%s"' % (n, str(v).replace("\\", "\\\\").replace('"', '\\"')) for n, v in zip(names, values))
+    return "{" + pairs + "}"
+
+
+class Counter:
+    def __init__(self, name, help, labels=()):
+        self.name = name
+        self.help = help
+        self.labels = tuple(labels)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount=1, **labels):
+        key = tuple(str(labels.get(n, "")) for n in self.labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            for key, value in sorted(self._values.items()):
+                lines.append(f"{self.name}{_label_text(self.labels, key)} {value}")
+        return lines
+
+
+class Histogram:
+    def __init__(self, name, help, labels=(), buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.help = help
+        self.labels = tuple(labels)
+        self.buckets = tuple(sorted(buckets))
+        self._series = {}  # label values -> [bucket counts..., sum, count]
+        self._lock = threading.Lock()
+
+    def observe(self, value, **labels):
+        key = tuple(str(labels.get(n, "")) for n in self.labels)
+        with self._lock:
+            series = self._series.setdefault(key, [0] * len(self.buckets) + [0.0, 0])
+            index = bisect.bisect_left(self.buckets, value)
+            if index < len(self.buckets):
+                series[index] += 1
+            series[-2] += value
+            series[-1] += 1
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            for key, series in sorted(self._series.items()):
+                cumulative = 0
+                for bound, count in zip(self.buckets, series):
+                    cumulative += count
+                    lines.append(f"{self.name}_bucket{_label_text(self.labels + ('le',), key + (f'{bound:g}',))} {cumulative}")
+                lines.append(f"{self.name}_bucket{_label_text(self.labels + ('le',), key + ('+Inf',))} {series[-1]}")
+                lines.append(f"{self.name}_sum{_label_text(self.labels, key)} {series[-2]:.6f}")
+                lines.append(f"{self.name}_count{_label_text(self.labels, key)} {series[-1]}")
+        return lines
+
+
+class Registry:
+    def __init__(self):
+        self._metrics = []
+
+    def register(self, metric):
+        self._metrics.append(metric)
+        return metric
+
+    def render(self):
+        """All metrics in the Prometheus text exposition format."""
+        lines = []
+        for metric in self._metrics:
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = Registry()
+STAGE_SECONDS = REGISTRY.register(Histogram(
+    "house_plan_stage_seconds", "Time spent in each pipeline stage.", STAGE_LABELS,
+))
+GENERATIONS = REGISTRY.register(Counter(
+    "house_plan_generations_total", "Plan generations by outcome.", ("model", "render_style", "resolution", "outcome"),
+))
+CACHE_LOOKUPS = REGISTRY.register(Counter(
+    "house_plan_cache_lookups_total", "Plan cache lookups by result.", ("result",),
+))
+IMAGE_BYTES = REGISTRY.register(Counter(
+    "house_plan_image_bytes_total", "Generated image bytes as downloaded (source) and as stored (optimized).", ("stage",),
+))
+
+
+def spec_labels(spec, model=""):
+    """Metric labels for a PlanSpec (or empty labels for None)."""
+    if spec is None:
+        return {"model": model, "render_style": "", "resolution": ""}
+    return {"model": model, "render_style": spec.render_style, "resolution": spec.resolution}
+
+
+def record(stage, seconds, ok=True, **labels):
+    """Record one timing of `stage` in the histogram and the timing log."""
+    STAGE_SECONDS.observe(seconds, stage=stage, **labels)
+    if timing_log.isEnabledFor(logging.INFO):
+        timing_log.info(json.dumps({"stage": stage, "seconds": round(seconds, 6), "ok": ok, **labels}))
+
+
+@contextmanager
+def timed(stage, **labels):
+    """Time the block as `stage`; recorded even if the block raises."""
+    started = time.perf_counter()
+    ok = True
+    try:
+        yield
+    except BaseException:
+        ok = False
+        raise
+    finally:
+        record(stage, time.perf_counter() - started, ok=ok, **labels)
+
+
+def log_to_file(path):
+    """Append structured timing lines to `path`."""
+    handler = logging.FileHandler(path, encoding="utf-8")
+    handler.setFormatter(logging.Formatter("%(message)s"))
+    timing_log.addHandler(handler)
+    timing_log.setLevel(logging.INFO)
+    timing_log.propagate = False
+
+
+def start_http_server(port, host="127.0.0.1", registry=REGISTRY):
+    """Serve `registry` at http://host:port/metrics from a daemon thread."""
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path.split("?")[0] != "/metrics":
+                self.send_error(404)
+                return
+            body = registry.render().encode("utf-8")
+            self.send_response(200)
+            self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer((host, port), Handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name="metrics-http", daemon=True).start()
+    return server
+
+
+def write_metrics_file(path, registry=REGISTRY):
+    """Atomically write the registry to `path`, e.g. for node_exporter's textfile collector."""
+    write_atomic(path, registry.render().encode("utf-8"))
+
+
+def start_file_exporter(path, interval=15, registry=REGISTRY):
+    """Rewrite `path` every `interval` seconds from a daemon thread."""
+
+    def loop():
+        while True:
+            write_metrics_file(path, registry)
+            time.sleep(interval)
+
+    thread = threading.Thread(target=loop, name="metrics-file", daemon=True)
+    thread.start()
+    return thread
+
+
+def start_profile():
+    """Start a cProfile profiler for the current thread, or None if one is already active."""
+    profiler = cProfile.Profile()
+    try:
+        profiler.enable()
+    except ValueError:  # Python 3.12+ allows one active profiler per process
+        return None
+    return profiler
+
+
+def finish_profile(profiler, path=None, limit=25):
+    """Stop `profiler`, optionally dump it to `path`, and return a top-N report."""
+    profiler.disable()
+    if path:
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        profiler.dump_stats(path)
+    out = io.StringIO()
+    pstats.Stats(profiler, stream=out).sort_stats("cumulative").print_stats(limit)
+    return out.getvalue()
@@ -0,0 +1,193 @@
+"""PDF export for saved house plans.
+
+PdfWriter streams objects to the output file as pages are added. Only byte
+offsets are kept in memory, so a multi-floor plan is written one page at a
+time. JPEG images are embedded as-is and other formats are converted to
+JPEG with Pillow.
+"""
+import os
+import tempfile
+import textwrap
+from io import BytesIO
+
+from PIL import Image
+
+PAGE_SIZE = (842, 595)  # A4 landscape, in points
+MARGIN = 36
+
+
+def _pdf_text(text):
+    # Standard PDF fonts only cover Latin-1
+    text = str(text).replace("₹", "Rs. ").replace("–", "-")
+    text = text.encode("latin-1", "replace").decode("latin-1")
+    return text.replace("\\", "\\\\").replace("(", "\\(").replace(")", "\\)")
+
+
+def _jpeg(image_data):
+    """Return (jpeg_bytes, width, height, colorspace) for any Pillow image."""
+    with Image.open(BytesIO(image_data)) as img:
+        if img.format == "JPEG" and img.mode in ("RGB", "L"):
+            colorspace = "/DeviceRGB" if img.mode == "RGB" else "/DeviceGray"
+            return image_data, img.width, img.height, colorspace
+        if img.mode in ("RGBA", "LA", "P"):
+            img = img.convert("RGBA")
+            background = Image.new("RGB", img.size, "white")
+            background.paste(img, mask=img.split()[-1])
+            img = background
+        else:
+            img = img.convert("RGB")
+        out = BytesIO()
+        img.save(out, format="JPEG", quality=90)
+        return out.getvalue(), img.width, img.height, "/DeviceRGB"
+
+
+class PdfWriter:
+    def __init__(self, stream, page_size=PAGE_SIZE):
+        self.stream = stream
+        self.page_size = page_size
+        self._offsets = {}
+        self._next_id = 1
+        self._page_ids = []
+        self._catalog_id = self._reserve()
+        self._pages_id = self._reserve()
+        self._font_id = self._reserve()
+        self._bold_id = self._reserve()
+        self._pos = 0
+        self._write(b"%PDF-1.4\n%\xe2\xe3\xcf\xd3\n")
+        self._object(self._font_id, b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica /Encoding /WinAnsiEncoding >>")
+        self._object(self._bold_id, b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica-Bold /Encoding /WinAnsiEncoding >>")
+
+    def _reserve(self):
+        obj_id = self._next_id
+        self._next_id += 1
+        return obj_id
+
+    def _write(self, data):
+        self.stream.write(data)
+        self._pos += len(data)
+
+    def _object(self, obj_id, body, stream=None):
+        self._offsets[obj_id] = self._pos
+        self._write(b"%d 0 obj\n" % obj_id + body)
+        if stream is not None:
+            self._write(b"\nstream\n" + stream + b"\nendstream")
+        self._write(b"\nendobj\n")
+
+    def _page(self, content, xobjects=None):
+        content_id = self._reserve()
+        self._object(content_id, b"<< /Length %d >>" % len(content), content)
+        resources = b"/Font << /F1 %d 0 R /F2 %d 0 R >>" % (self._font_id, self._bold_id)
+        if xobjects:
+            resources += b" /XObject << " + b" ".join(
+                b"/%s %d 0 R" % (name.encode(), obj_id) for name, obj_id in xobjects.items()
+            ) + b" >>"
+        page_id = self._reserve()
+        self._object(page_id, b"<< /Type /Page /Parent %d 0 R /MediaBox [0 0 %d %d] /Resources << %s >> /Contents %d 0 R >>" % (
+            self._pages_id, self.page_size[0], self.page_size[1], resources, content_id,
+        ))
+        self._page_ids.append(page_id)
+
+    def add_image_page(self, image_data, title=None):
+        """Add a page with `image_data` scaled to fit, under an optional title."""
+        jpeg, width, height, colorspace = _jpeg(image_data)
+        image_id = self._reserve()
+        self._object(image_id, (
+            b"<< /Type /XObject /Subtype /Image /Width %d /Height %d /ColorSpace %s "
+            b"/BitsPerComponent 8 /Filter /DCTDecode /Length %d >>"
+        ) % (width, height, colorspace.encode(), len(jpeg)), jpeg)
+        del jpeg
+
+        page_w, page_h = self.page_size
+        top = page_h - MARGIN
+        ops = []
+        if title:
+            ops.append("BT /F2 16 Tf %d %d Td (%s) Tj ET" % (MARGIN, top - 16, _pdf_text(title)))
+            top -= 28
+        scale = min((page_w - 2 * MARGIN) / width, (top - MARGIN) / height)
+        draw_w, draw_h = width * scale, height * scale
+        x = (page_w - draw_w) / 2
+        y = top - draw_h
+        ops.append("q %.2f 0 0 %.2f %.2f %.2f cm /Im0 Do Q" % (draw_w, draw_h, x, y))
+        self._page("\n".join(ops).encode("latin-1"), {"Im0": image_id})
+
+    def add_table_pages(self, title, sections):
+        """Add text pages; `sections` is a list of `(heading, headers, rows)`."""
+        page_w, page_h = self.page_size
+        ops = []
+        y = page_h - MARGIN
+
+        def flush():
+            if ops:
+                self._page("\n".join(ops).encode("latin-1"))
+                ops.clear()
+
+        def line(text, x, size, bold=False):
+            ops.append("BT /%s %d Tf %.2f %.2f Td (%s) Tj ET" % ("F2" if bold else "F1", size, x, y, _pdf_text(text)))
+
+        y -= 16
+        line(title, MARGIN, 16, bold=True)
+        y -= 14
+        for heading, headers, rows in sections:
+            if y < MARGIN + 60:
+                flush()
+                y = page_h - MARGIN - 12
+            y -= 22
+            line(heading, MARGIN, 12, bold=True)
+            col_w = (page_w - 2 * MARGIN) / max(len(headers), 1)
+            max_chars = int(col_w / 5.2)  # ~average Helvetica glyph width at 10pt
+            for row, bold in [(headers, True)] + [(r, False) for r in rows]:
+                cells = [textwrap.wrap(str(cell), max_chars) or [""] for cell in row]
+                for n in range(max(len(cell) for cell in cells)):
+                    y -= 13 if n else 15
+                    if y < MARGIN:
+                        flush()
+                        y = page_h - MARGIN - 12
+                    for col, cell in enumerate(cells):
+                        if n < len(cell):
+                            line(cell[n], MARGIN + col * col_w, 10, bold=bold)
+        flush()
+
+    def close(self):
+        self._object(self._pages_id, b"<< /Type /Pages /Kids [%s] /Count %d >>" % (
+            b" ".join(b"%d 0 R" % page_id for page_id in self._page_ids), len(self._page_ids),
+        ))
+        self._object(self._catalog_id, b"<< /Type /Catalog /Pages %d 0 R >>" % self._pages_id)
+        xref_at = self._pos
+        count = self._next_id
+        self._write(b"xref\n0 %d\n0000000000 65535 f \n" % count)
+        for obj_id in range(1, count):
+            self._write(b"%010d 00000 n \n" % self._offsets[obj_id])
+        self._write(b"trailer\n<< /Size %d /Root %d 0 R >>\nstartxref\n%d\n%%%%EOF\n" % (
+            count, self._catalog_id, xref_at,
+        ))
+
+
+def write_plan_pdf(stream, title, pages, sections):
+    """Write a plan PDF: one page per `(label, image_bytes)` then the tables.
+
+    `pages` may be a generator so images are loaded one at a time.
+    """
+    writer = PdfWriter(stream)
+    for label, image_data in pages:
+        writer.add_image_page(image_data, title=f"{title} - {label}" if label else title)
+    if sections:
+        writer.add_table_pages(f"{title} - Specifications", sections)
+    writer.close()
+
+
+def export_plan_pdf(path, title, pages, sections):
+    """Build the PDF at `path` unless it already exists; returns `path`."""
+    if os.path.exists(path):
+        return path
+    directory = os.path.dirname(path)
+    os.makedirs(directory, exist_ok=True)
+    fd, tmp = tempfile.mkstemp(dir=directory, suffix=".part")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            write_plan_pdf(f, title, pages, sections)
+        os.replace(tmp, path)
+    except BaseException:
+        if os.path.exists(tmp):
+            os.remove(tmp)
+        raise
+    return path
@@ -0,0 +1,280 @@
+"""Disk-backed cache for generated plan images.
+
+Entries are keyed on a canonical hash of the plan specifications plus the
+image model, so submitting an identical form twice is served from local disk
+instead of going back to the image provider.
+
+PlanCache keeps its index in memory, for one process. SQLitePlanCache keeps
+the index in a SQLite file (WAL mode) next to the images, so several app
+processes sharing the directory see each other's entries and one size budget.
+"""
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+
+from storage_utils import write_atomic
+
+
+def _normalize(value):
+    # Canonical form: collapse whitespace, sort dict keys and string lists
+    if isinstance(value, str):
+        return " ".join(value.split())
+    if isinstance(value, dict):
+        return {str(k): _normalize(v) for k, v in sorted(value.items())}
+    if isinstance(value, (list, tuple, set)):
+        items = [_normalize(v) for v in value]
+        if all(isinstance(v, str) for v in items):
+            return sorted(items)
+        return items
+    return value
+
+
+def cache_key(specs, model):
+    """Return a stable hex digest for a spec dict and model name."""
+    payload = json.dumps(
+        {"model": model, "specs": _normalize(specs)},
+        sort_keys=True,
+        separators=(",", ":"),
+        ensure_ascii=False,
+        default=str,
+    )
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class PlanCache:
+    """Size-bounded LRU cache of image bytes stored on local disk.
+
+    `max_bytes` caps the total size of stored images; the least recently used
+    entries are evicted first. `ttl` (seconds) optionally expires entries
+    regardless of use.
+    """
+
+    def __init__(self, directory, max_bytes=512 * 1024 * 1024, ttl=None):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._lock = threading.Lock()
+        self._index = OrderedDict()  # key -> size, least recently used first
+        self._total = 0
+        os.makedirs(directory, exist_ok=True)
+        self._load_index()
+
+    def _path(self, key):
+        return os.path.join(self.directory, key + ".img")
+
+    def _load_index(self):
+        entries = []
+        for name in os.listdir(self.directory):
+            if not name.endswith(".img"):
+                continue
+            try:
+                st = os.stat(os.path.join(self.directory, name))
+            except OSError:
+                continue
+            entries.append((st.st_mtime, name[:-4], st.st_size))
+        for _, key, size in sorted(entries):
+            self._index[key] = size
+            self._total += size
+
+    def _expired(self, path):
+        if self.ttl is None:
+            return False
+        try:
+            return time.time() - os.path.getmtime(path) > self.ttl
+        except OSError:
+            return True
+
+    def _remove(self, key):
+        size = self._index.pop(key, 0)
+        self._total -= size
+        try:
+            os.remove(self._path(key))
+        except OSError:
+            pass
+
+    def get(self, key):
+        """Return cached bytes for `key`, or None on a miss."""
+        with self._lock:
+            path = self._path(key)
+            if key not in self._index or self._expired(path):
+                self._remove(key)
+                self.misses += 1
+                return None
+            try:
+                with open(path, "rb") as f:
+                    data = f.read()
+            except OSError:
+                self._remove(key)
+                self.misses += 1
+                return None
+            self._index.move_to_end(key)
+            if self.ttl is None:
+                # Recency survives restarts through the file mtime
+                os.utime(path)
+            self.hits += 1
+            return data
+
+    def __contains__(self, key):
+        # Lookup that leaves recency and the hit/miss counters alone
+        with self._lock:
+            return key in self._index and not self._expired(self._path(key))
+
+    def put(self, key, data):
+        """Store `data` under `key`, evicting old entries to stay in budget."""
+        if len(data) > self.max_bytes:
+            return
+        with self._lock:
+            self._remove(key)
+            write_atomic(self._path(key), data)
+            self._index[key] = len(data)
+            self._total += len(data)
+            while self._total > self.max_bytes and self._index:
+                oldest = next(iter(self._index))
+                self._remove(oldest)
+                self.evictions += 1
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+                "evictions": self.evictions,
+                "entries": len(self._index),
+                "bytes": self._total,
+                "max_bytes": self.max_bytes,
+            }
+
+
+INDEX_SCHEMA = """
+CREATE TABLE IF NOT EXISTS entries (
+    key TEXT PRIMARY KEY,
+    size INTEGER NOT NULL,
+    created REAL NOT NULL,
+    used REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS entries_used ON entries(used);
+"""
+
+
+class SQLitePlanCache(PlanCache):
+    """PlanCache whose LRU index is shared through `index.db` in the cache directory.
+
+    Hit and miss counters are per process; entries and bytes are shared.
+    """
+
+    def __init__(self, directory, max_bytes=512 * 1024 * 1024, ttl=None):
+        self.db_path = os.path.join(directory, "index.db")
+        super().__init__(directory, max_bytes=max_bytes, ttl=ttl)
+
+    @contextmanager
+    def _connect(self):
+        db = sqlite3.connect(self.db_path, timeout=30)
+        try:
+            with db:
+                yield db
+        finally:
+            db.close()
+
+    def _load_index(self):
+        with self._connect() as db:
+            db.execute("PRAGMA journal_mode = WAL")
+            db.executescript(INDEX_SCHEMA)
+            if db.execute("SELECT COUNT(*) FROM entries").fetchone()[0]:
+                return
+            # Adopt images left by a PlanCache that used this directory before
+            for name in os.listdir(self.directory):
+                if name.endswith(".img"):
+                    try:
+                        st = os.stat(os.path.join(self.directory, name))
+                    except OSError:
+                        continue
+                    db.execute(
+                        "INSERT OR IGNORE INTO entries (key, size, created, used) VALUES (?, ?, ?, ?)",
+                        (name[:-4], st.st_size, st.st_mtime, st.st_mtime),
+                    )
+
+    def _delete(self, db, keys):
+        db.executemany("DELETE FROM entries WHERE key = ?", [(key,) for key in keys])
+        for key in keys:
+            try:
+                os.remove(self._path(key))
+            except OSError:
+                pass
+
+    def _count(self, hit):
+        with self._lock:
+            if hit:
+                self.hits += 1
+            else:
+                self.misses += 1
+
+    def get(self, key):
+        now = time.time()
+        with self._connect() as db:
+            row = db.execute("SELECT created FROM entries WHERE key = ?", (key,)).fetchone()
+            if row is None or (self.ttl is not None and now - row[0] > self.ttl):
+                if row is not None:
+                    self._delete(db, [key])
+                self._count(False)
+                return None
+            try:
+                with open(self._path(key), "rb") as f:
+                    data = f.read()
+            except OSError:
+                self._delete(db, [key])  # evicted by another process
+                self._count(False)
+                return None
+            db.execute("UPDATE entries SET used = ? WHERE key = ?", (now, key))
+        self._count(True)
+        return data
+
+    def __contains__(self, key):
+        with self._connect() as db:
+            row = db.execute("SELECT created FROM entries WHERE key = ?", (key,)).fetchone()
+        return row is not None and (self.ttl is None or time.time() - row[0] <= self.ttl)
+
+    def put(self, key, data):
+        if len(data) > self.max_bytes:
+            return
+        write_atomic(self._path(key), data)
+        now = time.time()
+        with self._connect() as db:
+            db.execute(
+                "INSERT OR REPLACE INTO entries (key, size, created, used) VALUES (?, ?, ?, ?)",
+                (key, len(data), now, now),
+            )
+            total = db.execute("SELECT COALESCE(SUM(size), 0) FROM entries").fetchone()[0]
+            evicted = []
+            for old, size in db.execute("SELECT key, size FROM entries WHERE key != ? ORDER BY used", (key,)):
+                if total <= self.max_bytes:
+                    break
+                evicted.append(old)
+                total -= size
+            self._delete(db, evicted)
+        with self._lock:
+            self.evictions += len(evicted)
+
+    def stats(self):
+        with self._connect() as db:
+            entries, total = db.execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM entries").fetchone()
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+                "evictions": self.evictions,
+                "entries": entries,
+                "bytes": total,
+                "max_bytes": self.max_bytes,
+            }
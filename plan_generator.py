@@ -0,0 +1,569 @@
+"""House plan specification, prompt building and image generation.
+
+Everything here is importable without starting Streamlit, so the same
+pipeline can be driven from the UI, batch jobs or benchmarks.
+"""
+import asyncio
+import itertools
+import logging
+import threading
+from dataclasses import asdict, dataclass, fields, replace
+
+import requests
+
+from image_utils import IMAGE_POOL, image_mime, optimize_image
+from metrics import CACHE_LOOKUPS, GENERATIONS, IMAGE_BYTES, spec_labels, timed
+from plan_cache import cache_key
+
+IMAGE_MODEL = "flux"  # or "g4f/image" or preferred image model
+IMAGE_MODELS = (IMAGE_MODEL, "sdxl-turbo", "sd-3.5-large")  # failover order for the provider router
+DOWNLOAD_TIMEOUT = 60  # seconds
+CHUNK_SIZE = 64 * 1024
+HTTP_POOL_SIZE = 32
+MAX_IMAGE_BYTES = 25 * 1024 * 1024  # larger responses are rejected instead of buffered
+PREVIEW_RESOLUTION = "Draft"
+# Pixel size requested per resolution, for providers that accept width/height
+IMAGE_SIZES = {PREVIEW_RESOLUTION: (512, 512)}
+VARIANT_AXES = ("render_style", "color_scheme", "layout_preference", "house_style")
+MAX_VARIANTS = 12
+# Image inputs (cache_specs keys) an image-to-image edit can change while keeping the layout
+EDITABLE_SPECS = frozenset({"house_style", "render_style", "furniture_detail", "color_scheme"})
+REUSE, EDIT, GENERATE = "reuse", "edit", "generate"
+EDIT_TIMEOUT_SHARE = 0.25  # of generate_timeout, so a hung edit leaves time for the fallback generate
+
+log = logging.getLogger("house_plans.generator")
+
+
+@dataclass(frozen=True)
+class PlanSpec:
+    """Every form field that describes a house plan request."""
+
+    city: str = "Chennai"
+    length: int = 50
+    width: int = 30
+    num_floors: int = 1
+    bedrooms: int = 3
+    bathrooms: int = 2
+    kitchen: bool = True
+    living_room: bool = True
+    dining_room: bool = True
+    office: bool = False
+    laundry: bool = True
+    pantry: bool = False
+    mudroom: bool = False
+    basement: bool = False
+    house_style: str = "Modern"
+    custom_style: str = ""
+    layout_preference: str = "Open Floor Plan"
+    accessibility_features: tuple = ()
+    garage: str = "None"
+    outdoor_spaces: tuple = ("Patio",)
+    features: str = "walk-in closet, pantry, large windows"
+    special_instructions: str = ""
+    render_style: str = "Blueprint (2D)"
+    furniture_detail: int = 2
+    color_scheme: str = "Blueprint (Blue/White)"
+    resolution: str = "High"
+    floor: int = 0  # 0 = the whole house, otherwise a single floor (1 = ground)
+    room_dimensions: tuple = ()  # per floor "Room W' x D', ..." from a searched layout
+
+    @classmethod
+    def from_dict(cls, data):
+        """Build a spec from a plain dict, ignoring unknown keys."""
+        known = {f.name: f for f in fields(cls)}
+        values = {}
+        for name, value in data.items():
+            if name not in known:
+                continue
+            if isinstance(known[name].default, tuple) and not isinstance(value, tuple):
+                if isinstance(value, str):
+                    value = [v.strip() for v in value.split(",") if v.strip()]
+                value = tuple(value or ())
+            elif isinstance(known[name].default, bool) and isinstance(value, str):
+                value = value.strip().lower() in ("1", "true", "yes", "y")
+            elif isinstance(known[name].default, int) and not isinstance(known[name].default, bool):
+                value = int(value)
+            values[name] = value
+        return cls(**values)
+
+    def to_dict(self):
+        data = asdict(self)
+        for name, value in data.items():
+            if isinstance(value, tuple):
+                data[name] = list(value)
+        return data
+
+    @property
+    def style(self):
+        return self.custom_style if self.house_style == "Custom" else self.house_style
+
+    def rooms(self, floor=None):
+        """(name, count) for each room on `floor` (default: this spec's floor, 0 = whole house).
+
+        count is None for single rooms. The prompt and the local layouts both
+        build their room lists from this.
+        """
+        floor = self.floor if floor is None else floor
+        rooms = []
+        if floor <= 1:
+            for enabled, name in [
+                (self.kitchen, "Kitchen"), (self.living_room, "Living Room"), (self.dining_room, "Dining Room"),
+                (self.office, "Home Office"), (self.laundry, "Laundry Room"), (self.pantry, "Pantry"),
+                (self.mudroom, "Mudroom"),
+            ]:
+                if enabled:
+                    rooms.append((name, None))
+            if self.garage != "None":
+                rooms.append((f"{self.garage} Garage", None))
+        if floor and self.num_floors > 1:
+            rooms.append(("Staircase", None))
+
+        bedrooms, bathrooms = floor_counts(self, floor) if floor else (self.bedrooms, self.bathrooms)
+        if bedrooms or not floor:
+            rooms.append(("Bedroom", bedrooms))
+        if bathrooms or not floor:
+            rooms.append(("Bathroom", bathrooms))
+        return rooms
+
+    def cache_specs(self):
+        """The subset of fields that influences the generated image."""
+        specs = {
+            "length": self.length,
+            "width": self.width,
+            "num_floors": self.num_floors,
+            "selected_rooms": selected_rooms(self),
+            "house_style": self.style,
+            "layout_preference": self.layout_preference,
+            "render_style": self.render_style,
+            "furniture_detail": self.furniture_detail,
+            "color_scheme": self.color_scheme,
+            "resolution": self.resolution,
+            "special_instructions": self.special_instructions,
+        }
+        if self.floor:
+            specs["floor"] = self.floor
+        if self.room_dimensions:
+            specs["room_dimensions"] = self.floor_dimensions()
+        return specs
+
+    def floor_dimensions(self):
+        """Searched room dimensions for this spec's floor, or for every floor."""
+        if not self.room_dimensions:
+            return ""
+        if self.floor:
+            return self.room_dimensions[self.floor - 1] if self.floor <= len(self.room_dimensions) else ""
+        if len(self.room_dimensions) == 1:
+            return self.room_dimensions[0]
+        return "; ".join(f"{floor_label(n)}: {rooms}" for n, rooms in enumerate(self.room_dimensions, 1))
+
+    def cache_key(self, model=IMAGE_MODEL):
+        return cache_key(self.cache_specs(), model)
+
+    def summary(self):
+        """Short spec summary stored alongside saved plans."""
+        return {
+            "dimensions": f"{self.length}' x {self.width}'",
+            "floors": self.num_floors,
+            "bedrooms": self.bedrooms,
+            "bathrooms": self.bathrooms,
+            "style": self.style,
+            "render_style": self.render_style,
+            "layout": self.layout_preference,
+            "features": ", ".join(selected_rooms(self)),
+            "city": self.city,
+        }
+
+
+@dataclass
+class GeneratedPlan:
+    spec: PlanSpec
+    prompt: str
+    image_data: bytes
+    image_url: str = None
+    cached: bool = False
+    model: str = None
+    source_bytes: int = None  # size as downloaded, before optimize_image
+
+
+@dataclass(frozen=True)
+class EditReference:
+    """A prior plan image to edit (image-to-image) instead of generating from scratch."""
+
+    image: bytes
+    spec: PlanSpec
+
+
+FLOOR_LABELS = {1: "Ground Floor", 2: "First Floor", 3: "Second Floor"}
+UPPER_OUTDOOR_SPACES = ("Balcony", "Deck")
+
+
+def floor_label(floor):
+    return FLOOR_LABELS.get(floor, f"Floor {floor}")
+
+
+def floor_share(count, floor, num_floors):
+    # Ground floor gets an even share rounded down, upper floors split the rest
+    ground = count // num_floors
+    if floor == 1:
+        return ground
+    upper = num_floors - 1
+    rest = count - ground
+    return rest // upper + (1 if floor - 2 < rest % upper else 0)
+
+
+def floor_counts(spec, floor):
+    """(bedrooms, bathrooms) placed on `floor` of a multi-floor spec."""
+    n = spec.num_floors
+    bedrooms = floor_share(spec.bedrooms, floor, n)
+    bathrooms = max(floor_share(spec.bathrooms, floor, n), 1 if spec.bathrooms >= n else 0)
+    return bedrooms, bathrooms
+
+
+def floor_specs(spec):
+    """Split a multi-floor spec into one spec per floor."""
+    if spec.num_floors <= 1:
+        return [spec]
+    return [replace(spec, floor=floor) for floor in range(1, spec.num_floors + 1)]
+
+
+def selected_rooms(spec):
+    """List every space the plan (or spec.floor) must include, in prompt order.
+
+    The free-text features go on every floor, since the form doesn't say
+    which floor they belong to; accessibility features go on the ground floor.
+    """
+    floor = spec.floor
+    rooms = [
+        name.lower() if count is None else f"{count} {name.lower()}{'' if count == 1 else 's'}"
+        for name, count in spec.rooms()
+    ]
+    if spec.basement and floor <= 1:
+        rooms.append("basement access" if floor else "basement")
+
+    # Balconies and decks go upstairs, the other outdoor spaces on the ground floor
+    for space in spec.outdoor_spaces:
+        if not floor or (floor == 1) != (space in UPPER_OUTDOOR_SPACES):
+            rooms.append(space.lower())
+
+    if spec.features.strip():
+        rooms.extend([f.strip() for f in spec.features.split(",")])
+    if floor <= 1:
+        for feature in spec.accessibility_features:
+            rooms.append(feature.lower())
+    return rooms
+
+
+def preview_spec(spec):
+    """The cheap draft version of `spec`, used to check a design before the full render."""
+    return replace(spec, resolution=PREVIEW_RESOLUTION, furniture_detail=0)
+
+
+def variant_specs(spec, axes, limit=MAX_VARIANTS):
+    """Cross product of `spec` over `axes` ({field: [values]}), at most `limit` specs.
+
+    Only fields in VARIANT_AXES are varied; axes with no values keep the
+    spec's own value.
+    """
+    names = [name for name in VARIANT_AXES if axes.get(name)]
+    combos = itertools.product(*(axes[name] for name in names))
+    return [replace(spec, **dict(zip(names, values))) for values in itertools.islice(combos, limit)]
+
+
+def variant_label(spec, names):
+    return " · ".join(str(getattr(spec, name)) for name in names) or spec.render_style
+
+
+def spec_diff(old, new):
+    """`{field: (old, new)}` for every PlanSpec field that differs."""
+    before, after = old.to_dict(), new.to_dict()
+    return {name: (before[name], value) for name, value in after.items() if before[name] != value}
+
+
+def regeneration_steps(old_spec, old_per_floor, new_spec, per_floor):
+    """Plan regenerating a saved plan of `old_spec` as `new_spec`.
+
+    Returns `(part, action, old_page)` for each part (floor) of the new plan,
+    where `old_page` indexes the saved plan's pages. A part whose image inputs
+    haven't changed is REUSEd, one where only EDITABLE_SPECS changed is EDITed
+    from the old page, and anything else (or a floor with no old page) is
+    GENERATEd from scratch.
+    """
+    old_parts = floor_specs(old_spec) if old_per_floor else [old_spec]
+    by_floor = {part.floor: (n, part.cache_specs()) for n, part in enumerate(old_parts)}
+    steps = []
+    for part in floor_specs(new_spec) if per_floor else [new_spec]:
+        if part.floor not in by_floor:
+            steps.append((part, GENERATE, None))
+            continue
+        n, before = by_floor[part.floor]
+        after = part.cache_specs()
+        changed = {name for name in before.keys() | after.keys() if before.get(name) != after.get(name)}
+        if not changed:
+            steps.append((part, REUSE, n))
+        elif changed <= EDITABLE_SPECS:
+            steps.append((part, EDIT, n))
+        else:
+            steps.append((part, GENERATE, None))
+    return steps
+
+
+def edit_prompt(reference, spec):
+    """Prompt for editing `reference.spec`'s image into `spec` while keeping its layout."""
+    before, after = reference.spec.cache_specs(), spec.cache_specs()
+    changes = "; ".join(
+        f"{name.replace('_', ' ')} from {before.get(name)} to {after.get(name)}"
+        for name in sorted(EDITABLE_SPECS) if before.get(name) != after.get(name)
+    )
+    return (
+        "Edit this house floor plan. Keep its layout, walls, rooms and dimension annotations exactly "
+        f"as they are and only change the {changes}.\n\n" + build_prompt(spec)
+    )
+
+
+def image_options(spec):
+    """Extra keyword arguments for images.generate (size hints for drafts)."""
+    size = IMAGE_SIZES.get(spec.resolution)
+    return {"width": size[0], "height": size[1]} if size else {}
+
+
+def build_prompt(spec):
+    """Build the image generation prompt for a spec."""
+    if spec.floor:
+        subject = f"the {floor_label(spec.floor).lower()} of a {spec.style.lower()} house with {spec.num_floors} floors"
+        spaces = f"Include all these spaces on this floor: {', '.join(selected_rooms(spec))}"
+        floor_note = f"Title the plan **{floor_label(spec.floor)}** and show only this floor"
+    else:
+        subject = f"a {spec.style.lower()} house with {spec.num_floors} floor(s)"
+        spaces = f"Include all these spaces: {', '.join(selected_rooms(spec))}"
+        floor_note = "Each floor should be clearly labeled if multiple floors"
+    if spec.floor_dimensions():
+        spaces += f"\n            - Use these room dimensions from an optimized layout (north at the top): {spec.floor_dimensions()}"
+    if spec.resolution == PREVIEW_RESOLUTION:
+        quality = "This is a **quick low-resolution draft**: keep lines and labels simple"
+    else:
+        quality = f"Maintain **{spec.resolution.lower()} resolution and clarity**"
+    return f"""
+            Generate a high-quality {spec.render_style.lower()} of {subject} and the following specifications:
+            - Total house size: {spec.length} feet long and {spec.width} feet wide
+            - {spaces}
+            - Layout style: {spec.layout_preference}
+
+            Rendering Requirements:
+            - Show **room names clearly labeled inside each room**
+            - Include **room-by-room dimensions** written inside each room
+            - Display **total house dimensions** on the outer boundary (length and width)
+            - Add **window and door placements** with appropriate symbols
+            - Show **walls and partitions** clearly with solid lines
+            - Include furniture at detail level {spec.furniture_detail}/3
+            - Use a **{spec.color_scheme}** color scheme
+            - {quality}
+            - Use **dimension annotations** in feet (ft)
+            - {floor_note}
+
+            {spec.special_instructions if spec.special_instructions else ""}
+
+            Make it easy to understand for architects and homeowners alike.
+            """
+
+
+def generate_plan(spec, client, model=IMAGE_MODEL, cache=None, timeout=DOWNLOAD_TIMEOUT):
+    """Generate (or fetch from `cache`) the plan image for `spec`."""
+    labels = spec_labels(spec, model)
+    with timed("prompt", **labels):
+        prompt = build_prompt(spec)
+    key = spec.cache_key(model)
+    if cache is not None:
+        img_data = cache.get(key)
+        CACHE_LOOKUPS.inc(result="miss" if img_data is None else "hit")
+        if img_data is not None:
+            GENERATIONS.inc(outcome="cached", **labels)
+            return GeneratedPlan(spec, prompt, img_data, cached=True)
+
+    try:
+        with timed("generate", **labels):
+            response = client.images.generate(
+                model=model,
+                prompt=prompt,
+                response_format="url",
+                **image_options(spec)
+            )
+        image_url = response.data[0].url
+        with timed("download", **labels):
+            img_data = download_image(image_url, timeout=timeout)
+    except Exception:
+        GENERATIONS.inc(outcome="error", **labels)
+        raise
+    GENERATIONS.inc(outcome="ok", **labels)
+    source_bytes = len(img_data)
+    with timed("optimize", **labels):
+        img_data = optimize_download(img_data)
+
+    if cache is not None:
+        cache.put(key, img_data)
+    return GeneratedPlan(spec, prompt, img_data, image_url=image_url, model=model, source_bytes=source_bytes)
+
+
+async def generate_plan_async(spec, client, session, model=IMAGE_MODEL, cache=None,
+                              timeout=DOWNLOAD_TIMEOUT, generate_timeout=None, router=None, reference=None):
+    """Async variant of generate_plan using a g4f AsyncClient and an aiohttp session.
+
+    With a ProviderRouter the image is raced across its models and cached
+    under `model` regardless of which one answered first. With an
+    EditReference each model is first asked to edit the reference image
+    (`images.create_variation`, within EDIT_TIMEOUT_SHARE of
+    `generate_timeout`); models that can't fall back to generating.
+    """
+    with timed("prompt", **spec_labels(spec, model)):
+        prompt = build_prompt(spec)
+    key = spec.cache_key(model)
+    if cache is not None:
+        img_data = await asyncio.to_thread(cache.get, key)
+        CACHE_LOOKUPS.inc(result="miss" if img_data is None else "hit")
+        if img_data is not None:
+            GENERATIONS.inc(outcome="cached", **spec_labels(spec, model))
+            return GeneratedPlan(spec, prompt, img_data, cached=True)
+
+    edit_timeout = generate_timeout * EDIT_TIMEOUT_SHARE if generate_timeout else None
+
+    async def edit(candidate, labels):
+        try:
+            with timed("edit", **labels):
+                response = await asyncio.wait_for(
+                    client.images.create_variation(
+                        image=reference.image, model=candidate, prompt=edit_prompt(reference, spec),
+                        response_format="url", **image_options(spec),
+                    ),
+                    edit_timeout,
+                )
+            if response.data[0].url:
+                return response
+            reason = "no image returned"
+        except asyncio.CancelledError:
+            raise
+        except asyncio.TimeoutError:
+            reason = f"no answer within {edit_timeout:g}s"
+        except Exception as e:
+            reason = f"{type(e).__name__}: {e}"
+        log.info("Edit with %s failed (%s); generating from scratch", candidate, reason)
+        GENERATIONS.inc(outcome="edit_failed", **labels)
+        return None
+
+    async def attempt(candidate):
+        labels = spec_labels(spec, candidate)
+        try:
+            response = await edit(candidate, labels) if reference is not None else None
+            if response is None:
+                with timed("generate", **labels):
+                    response = await asyncio.wait_for(
+                        client.images.generate(model=candidate, prompt=prompt, response_format="url", **image_options(spec)),
+                        generate_timeout,
+                    )
+            image_url = response.data[0].url
+            if not image_url:
+                raise ValueError(f"{candidate} returned no image")
+            with timed("download", **labels):
+                img_data = await download_image_async(session, image_url, timeout=timeout)
+        except asyncio.CancelledError:
+            GENERATIONS.inc(outcome="cancelled", **labels)
+            raise
+        except Exception:
+            GENERATIONS.inc(outcome="error", **labels)
+            raise
+        GENERATIONS.inc(outcome="ok", **labels)
+        return image_url, img_data
+
+    if router is not None:
+        used, (image_url, img_data) = await router.run(attempt)
+    else:
+        used = model
+        image_url, img_data = await attempt(model)
+    # Only the winning download is optimized, on the image pool so the loop stays free
+    source_bytes = len(img_data)
+    with timed("optimize", **spec_labels(spec, used)):
+        img_data = await asyncio.get_running_loop().run_in_executor(IMAGE_POOL, optimize_download, img_data)
+
+    if cache is not None:
+        await asyncio.to_thread(cache.put, key, img_data)
+    return GeneratedPlan(spec, prompt, img_data, image_url=image_url, model=used, source_bytes=source_bytes)
+
+
+def optimize_download(data):
+    """Re-encode a downloaded image (see image_utils.optimize_image) and count the bytes saved."""
+    optimized, _ = optimize_image(data)
+    IMAGE_BYTES.inc(len(data), stage="source")
+    IMAGE_BYTES.inc(len(optimized), stage="optimized")
+    return optimized
+
+
+def _check_headers(headers, max_bytes):
+    # Reject before reading the body when the headers already say it's wrong
+    content_type = (headers.get("Content-Type") or "").split(";")[0].strip().lower()
+    if content_type and not content_type.startswith("image/") and content_type != "application/octet-stream":
+        raise ValueError(f"expected an image, got {content_type}")
+    length = headers.get("Content-Length")
+    if length and length.isdigit() and int(length) > max_bytes:
+        raise ValueError(f"image is {int(length)} bytes, over the {max_bytes} byte limit")
+
+
+def _check_size(size, max_bytes):
+    if size > max_bytes:
+        raise ValueError(f"image exceeds the {max_bytes} byte limit")
+
+
+def _checked_image(data):
+    if image_mime(data) is None:
+        raise ValueError("response is not a JPEG, PNG, WebP or GIF image")
+    return data
+
+
+def download_image(url, timeout=DOWNLOAD_TIMEOUT, max_bytes=MAX_IMAGE_BYTES):
+    """Stream an image over the shared keep-alive session.
+
+    Raises ValueError if the response isn't an image or is over `max_bytes`.
+    """
+    with http_session().get(url, timeout=timeout, stream=True) as response:
+        response.raise_for_status()
+        _check_headers(response.headers, max_bytes)
+        # Streamed so an oversized body is cut off once it passes the limit
+        chunks, size = [], 0
+        for chunk in response.iter_content(CHUNK_SIZE):
+            size += len(chunk)
+            _check_size(size, max_bytes)
+            chunks.append(chunk)
+    return _checked_image(b"".join(chunks))
+
+
+async def download_image_async(session, url, timeout=DOWNLOAD_TIMEOUT, max_bytes=MAX_IMAGE_BYTES):
+    import aiohttp
+
+    async with session.get(url, timeout=aiohttp.ClientTimeout(total=timeout)) as response:
+        response.raise_for_status()
+        _check_headers(response.headers, max_bytes)
+        chunks, size = [], 0
+        async for chunk in response.content.iter_chunked(CHUNK_SIZE):
+            size += len(chunk)
+            _check_size(size, max_bytes)
+            chunks.append(chunk)
+    return _checked_image(b"".join(chunks))
+
+
+_http = None
+_http_lock = threading.Lock()
+
+
+def http_session():
+    """Return the process-wide requests session used for image downloads.
+
+    Reusing one pooled session keeps connections to the image host alive,
+    so consecutive downloads skip the TCP/TLS handshake.
+    """
+    global _http
+    if _http is None:
+        with _http_lock:
+            if _http is None:
+                session = requests.Session()
+                adapter = requests.adapters.HTTPAdapter(pool_connections=8, pool_maxsize=HTTP_POOL_SIZE)
+                session.mount("http://", adapter)
+                session.mount("https://", adapter)
+                _http = session
+    return _http
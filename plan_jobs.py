@@ -0,0 +1,371 @@
+"""Background generation jobs.
+
+JobManager runs full plan generations on worker threads, so they outlive
+Streamlit reruns and don't hold the script thread. A session submits a
+spec with its owner token, then polls the owner's jobs. The worker saves the
+finished plan to the plan store itself, so the result is kept even if the
+session has moved on to another tab.
+
+A job can name a saved plan to regenerate from. Floors whose image inputs
+haven't changed are then copied from it, and floors where only the look
+changed are edited from its images instead of generated from scratch.
+
+Jobs wait in a queue. MemoryJobQueue serves one process. SQLiteJobQueue
+keeps jobs in a shared SQLite file: any app process can claim them, and any
+process can report their status.
+"""
+import json
+import sqlite3
+import threading
+import time
+import uuid
+from abc import ABC, abstractmethod
+from collections import OrderedDict, deque
+from contextlib import contextmanager
+from dataclasses import dataclass, field, replace
+from datetime import datetime
+
+from async_generator import wait_all
+from metrics import spec_labels, timed
+from plan_generator import (
+    EDIT, GENERATE, REUSE, EditReference, PlanSpec, floor_label, floor_specs, regeneration_steps,
+)
+from storage_utils import immediate_transaction, open_wal
+
+QUEUED, RUNNING, DONE, FAILED = "queued", "running", "done", "failed"
+MAX_FINISHED_JOBS = 1000  # older finished jobs are forgotten; their plans stay saved
+FINISHED_JOB_TTL = 24 * 3600  # seconds a finished job stays in the shared queue
+POLL_INTERVAL = 0.5  # seconds between shared-queue checks while idle
+
+
+@dataclass
+class Job:
+    id: str
+    spec: object
+    per_floor: bool = False
+    owner: str = None
+    status: str = QUEUED
+    plan_id: str = None
+    error: str = None
+    position: int = 0  # place in the admission queue while queued
+    eta: float = 0.0   # seconds until admission while queued
+    submitted: float = field(default_factory=time.time)
+    finished: float = None
+    dismissed: bool = False
+    base_plan: str = None  # saved plan this job regenerates from
+
+    @property
+    def done(self):
+        return self.status in (DONE, FAILED)
+
+
+class JobQueue(ABC):
+    """Interface implemented by job queue backends."""
+
+    @abstractmethod
+    def put(self, job, thumbnail=None):
+        """Queue `job`, with the thumbnail its plan will be saved with."""
+
+    @abstractmethod
+    def claim(self, timeout):
+        """Take the oldest unclaimed job for this worker; returns `(job, thumbnail)` or None."""
+
+    @abstractmethod
+    def update(self, job):
+        """Persist `job`'s status fields."""
+
+    @abstractmethod
+    def get(self, job_id):
+        """The job, or None if it is unknown or has been forgotten."""
+
+    @abstractmethod
+    def owned(self, owner):
+        """`owner`'s jobs that haven't been dismissed, oldest first."""
+
+    @abstractmethod
+    def dismiss(self, job_id):
+        """Hide a job from `owned`."""
+
+
+class MemoryJobQueue(JobQueue):
+    """Jobs in this process's memory; workers wait on a condition instead of polling."""
+
+    def __init__(self):
+        self._jobs = OrderedDict()
+        self._pending = deque()
+        self._ready = threading.Condition()
+
+    def put(self, job, thumbnail=None):
+        with self._ready:
+            self._jobs[job.id] = job
+            self._pending.append((job, thumbnail))
+            self._prune()
+            self._ready.notify()
+
+    def _prune(self):
+        finished = [job_id for job_id, job in self._jobs.items() if job.done]
+        for job_id in finished[:max(0, len(finished) - MAX_FINISHED_JOBS)]:
+            del self._jobs[job_id]
+
+    def claim(self, timeout):
+        with self._ready:
+            if not self._ready.wait_for(lambda: self._pending, timeout):
+                return None
+            return self._pending.popleft()
+
+    def update(self, job):
+        pass  # workers change the shared Job object in place
+
+    def get(self, job_id):
+        with self._ready:
+            return self._jobs.get(job_id)
+
+    def owned(self, owner):
+        with self._ready:
+            return [job for job in self._jobs.values() if job.owner == owner and not job.dismissed]
+
+    def dismiss(self, job_id):
+        with self._ready:
+            if job_id in self._jobs:
+                self._jobs[job_id].dismissed = True
+
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id TEXT PRIMARY KEY,
+    owner TEXT,
+    spec TEXT NOT NULL,
+    per_floor INTEGER NOT NULL,
+    status TEXT NOT NULL,
+    plan_id TEXT,
+    error TEXT,
+    position INTEGER NOT NULL DEFAULT 0,
+    eta REAL NOT NULL DEFAULT 0,
+    submitted REAL NOT NULL,
+    finished REAL,
+    updated REAL NOT NULL,
+    claimed INTEGER NOT NULL DEFAULT 0,
+    dismissed INTEGER NOT NULL DEFAULT 0,
+    thumbnail BLOB,
+    base_plan TEXT
+);
+CREATE INDEX IF NOT EXISTS jobs_pending ON jobs(claimed, status, submitted);
+CREATE INDEX IF NOT EXISTS jobs_owner ON jobs(owner, submitted);
+"""
+
+
+class SQLiteJobQueue(JobQueue):
+    """Jobs in a SQLite file (WAL mode) shared by every app process using it.
+
+    A claimed job whose worker hasn't reported for `stale_after` seconds
+    (e.g. its process died) is released to be claimed again.
+    """
+
+    def __init__(self, path, stale_after=600):
+        self.path = path
+        self.stale_after = stale_after
+        db = open_wal(path)
+        try:
+            db.executescript(SCHEMA)
+            if "base_plan" not in {row[1] for row in db.execute("PRAGMA table_info(jobs)")}:
+                db.execute("ALTER TABLE jobs ADD COLUMN base_plan TEXT")
+        finally:
+            db.close()
+
+    def _transaction(self):
+        # The write lock serializes claims across processes
+        return immediate_transaction(self.path)
+
+    @contextmanager
+    def _read(self):
+        db = sqlite3.connect(self.path, timeout=30)
+        db.row_factory = sqlite3.Row
+        try:
+            yield db
+        finally:
+            db.close()
+
+    def _job(self, row):
+        return Job(
+            id=row["id"],
+            spec=PlanSpec.from_dict(json.loads(row["spec"])),
+            per_floor=bool(row["per_floor"]),
+            owner=row["owner"],
+            status=row["status"],
+            plan_id=row["plan_id"],
+            error=row["error"],
+            position=row["position"],
+            eta=row["eta"],
+            submitted=row["submitted"],
+            finished=row["finished"],
+            dismissed=bool(row["dismissed"]),
+            base_plan=row["base_plan"],
+        )
+
+    def put(self, job, thumbnail=None):
+        now = time.time()
+        with self._transaction() as db:
+            db.execute("DELETE FROM jobs WHERE finished < ?", (now - FINISHED_JOB_TTL,))
+            db.execute(
+                "INSERT INTO jobs (id, owner, spec, per_floor, status, submitted, updated, thumbnail, base_plan)"
+                " VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (job.id, job.owner, json.dumps(job.spec.to_dict()), int(job.per_floor), job.status,
+                 job.submitted, now, thumbnail, job.base_plan),
+            )
+
+    def claim(self, timeout):
+        deadline = time.monotonic() + (timeout or 0)
+        while True:
+            now = time.time()
+            with self._transaction() as db:
+                db.execute(
+                    "UPDATE jobs SET claimed = 0, status = ? WHERE claimed = 1 AND status IN (?, ?) AND updated < ?",
+                    (QUEUED, QUEUED, RUNNING, now - self.stale_after),
+                )
+                row = db.execute(
+                    "SELECT * FROM jobs WHERE claimed = 0 AND status = ? ORDER BY submitted LIMIT 1", (QUEUED,)
+                ).fetchone()
+                if row is not None:
+                    db.execute("UPDATE jobs SET claimed = 1, updated = ? WHERE id = ?", (now, row["id"]))
+                    return self._job(row), row["thumbnail"]
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                return None
+            time.sleep(min(POLL_INTERVAL, remaining))
+
+    def update(self, job):
+        with self._transaction() as db:
+            db.execute(
+                "UPDATE jobs SET status = ?, plan_id = ?, error = ?, position = ?, eta = ?, finished = ?,"
+                " updated = ?, thumbnail = CASE WHEN ? IN (?, ?) THEN NULL ELSE thumbnail END WHERE id = ?",
+                (job.status, job.plan_id, job.error, job.position, job.eta, job.finished, time.time(),
+                 job.status, DONE, FAILED, job.id),
+            )
+
+    def get(self, job_id):
+        with self._read() as db:
+            row = db.execute("SELECT * FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        return self._job(row) if row is not None else None
+
+    def owned(self, owner):
+        with self._read() as db:
+            rows = db.execute(
+                "SELECT * FROM jobs WHERE owner = ? AND dismissed = 0 ORDER BY submitted", (owner,)
+            ).fetchall()
+        return [self._job(row) for row in rows]
+
+    def dismiss(self, job_id):
+        with self._transaction() as db:
+            db.execute("UPDATE jobs SET dismissed = 1 WHERE id = ?", (job_id,))
+
+
+class JobManager:
+    def __init__(self, generator, store, admission=None, workers=8, timeout=None, queue=None):
+        self.generator = generator
+        self.store = store
+        self.admission = admission
+        self.timeout = timeout
+        self.queue = queue if queue is not None else MemoryJobQueue()
+        for n in range(workers):
+            threading.Thread(target=self._work, name=f"plan-job-{n}", daemon=True).start()
+
+    def submit(self, spec, per_floor=False, thumbnail=None, owner=None, base_plan=None):
+        """Queue a full generation of `spec`, reusing what it can of saved plan `base_plan`; returns the job ID."""
+        job = Job(uuid.uuid4().hex, spec, per_floor, owner, base_plan=base_plan)
+        self.queue.put(job, thumbnail)
+        return job.id
+
+    def get(self, job_id):
+        return self.queue.get(job_id)
+
+    def jobs_for(self, owner):
+        return self.queue.owned(owner)
+
+    def dismiss(self, job_id):
+        self.queue.dismiss(job_id)
+
+    def _work(self):
+        while True:
+            claimed = self.queue.claim(timeout=POLL_INTERVAL * 10)
+            if claimed is not None:
+                self._run(*claimed)
+
+    def _steps(self, job):
+        # Without a usable base plan every part is generated from scratch
+        base = self.store.get(job.base_plan) if job.base_plan else None
+        if base is None or not base["spec"]:
+            return [(part, GENERATE, None) for part in (floor_specs(job.spec) if job.per_floor else [job.spec])], None
+        old_per_floor = base["pages"][0]["label"] is not None
+        steps = regeneration_steps(PlanSpec.from_dict(base["spec"]), old_per_floor, job.spec, job.per_floor)
+        return steps, base
+
+    def _wait_for_admission(self, job, steps):
+        cache = self.generator.cache
+        # An edit that falls back to generating makes two provider calls, so it is charged for both
+        misses = sum(
+            2 if action == EDIT else 1 for part, action, _ in steps
+            if action != REUSE and (cache is None or part.cache_key(self.generator.model) not in cache)
+        )
+
+        def on_wait(position, eta):
+            if (position, round(eta)) != (job.position, round(job.eta)):
+                job.position, job.eta = position, eta
+                self.queue.update(job)
+
+        # A raced request costs one token per model it is sent to
+        router = self.generator.router
+        calls = router.calls_per_request if router is not None else 1
+        self.admission.admit(misses * calls, timeout=self.timeout, on_wait=on_wait)
+
+    def _run(self, job, thumbnail):
+        try:
+            steps, base = self._steps(job)
+            # A part whose base image has gone missing is generated again
+            images = {
+                n: self.store.load_image(base["pages"][old_page]["image_hash"])
+                for n, (_, action, old_page) in enumerate(steps) if action != GENERATE
+            }
+            steps = [
+                (part, GENERATE, None) if n in images and images[n] is None else (part, action, old_page)
+                for n, (part, action, old_page) in enumerate(steps)
+            ]
+            if self.admission is not None:
+                self._wait_for_admission(job, steps)
+            job.status, job.position, job.eta = RUNNING, 0, 0.0
+            self.queue.update(job)
+
+            # Fan out one request per floor that can't be copied and wait for all of them together
+            futures = {}
+            for n, (part, action, old_page) in enumerate(steps):
+                if action == EDIT:
+                    old_spec = replace(PlanSpec.from_dict(base["spec"]), floor=part.floor)
+                    futures[n] = self.generator.submit(part, reference=EditReference(images[n], old_spec))
+                elif action == GENERATE:
+                    futures[n] = self.generator.submit(part)
+            results = dict(zip(futures, wait_all(futures.values(), self.timeout)))
+
+            pages, model = [], ""
+            for n, (part, action, old_page) in enumerate(steps):
+                label = floor_label(part.floor) if job.per_floor else None
+                if action == REUSE:
+                    page = base["pages"][old_page]
+                    pages.append((label, images[n], page["source_bytes"]))
+                else:
+                    result = results[n]
+                    model = model or result.model or ""
+                    pages.append((label, result.image_data, result.source_bytes))
+            with timed("persist", **spec_labels(job.spec, model)):
+                job.plan_id = self.store.save(
+                    job.spec.summary(), pages,
+                    timestamp=datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+                    thumbnail=thumbnail,
+                    owner=job.owner,
+                    spec=job.spec.to_dict(),
+                )
+            job.status = DONE
+        except Exception as e:
+            job.error = f"{type(e).__name__}: {e}"
+            job.status = FAILED
+        finally:
+            job.finished = time.time()
+            self.queue.update(job)
@@ -0,0 +1,302 @@
+"""Persistent storage for saved house plans.
+
+Plan metadata lives in SQLite and images live in a content-addressed blob
+directory, so identical images are stored once and sessions only need to
+keep plan IDs in memory. Each plan records its owner's token. Several app
+processes can then point at one store directory (the database runs in WAL
+mode) and list the same user's plans. Large page images also get a
+display-sized copy, which the UI shows in place of the original.
+"""
+import hashlib
+import json
+import logging
+import os
+import sqlite3
+import uuid
+from abc import ABC, abstractmethod
+from contextlib import contextmanager
+from datetime import datetime
+
+from image_utils import IMAGE_POOL, display_variant, image_mime, make_thumbnail
+from storage_utils import write_atomic
+
+log = logging.getLogger("house_plans.store")
+
+
+class BlobStore:
+    """Files named by the SHA-256 of their content."""
+
+    def __init__(self, directory):
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+
+    def path(self, digest):
+        return os.path.join(self.directory, digest[:2], digest)
+
+    def put(self, data):
+        digest = hashlib.sha256(data).hexdigest()
+        path = self.path(digest)
+        if not os.path.exists(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            write_atomic(path, data)
+        return digest
+
+    def get(self, digest):
+        with open(self.path(digest), "rb") as f:
+            return f.read()
+
+    def delete(self, digest):
+        try:
+            os.remove(self.path(digest))
+        except OSError:
+            pass
+
+
+class PlanRepository(ABC):
+    """Interface implemented by plan storage backends.
+
+    A plan is a dict with `id`, `timestamp`, `specs` (a short summary),
+    `spec` (every PlanSpec field as a dict, or None for older plans),
+    `thumbnail_hash` and `pages`, plus the `owner` token of whoever created
+    it. Each page is `{"label", "image_hash", "display_hash", "mime",
+    "source_bytes"}`: `display_hash` is None when the original is small
+    enough to show, and `source_bytes` is the image's size before
+    optimization, if known.
+    Image bytes are only read through `load_image`, or served straight from
+    the local file at `image_path` without loading them.
+    """
+
+    @abstractmethod
+    def save(self, specs, pages, timestamp=None, thumbnail=None, owner=None, spec=None):
+        """Store a plan; `pages` holds `(label, image_bytes[, source_bytes])`. Returns its ID.
+
+        A thumbnail is made from the first page unless one is passed in.
+        """
+
+    @abstractmethod
+    def get(self, plan_id):
+        """The plan dict, or None if there is no such plan."""
+
+    @abstractmethod
+    def plan_ids(self, owner):
+        """IDs of `owner`'s plans, newest first."""
+
+    def get_many(self, plan_ids):
+        return [plan for plan in (self.get(plan_id) for plan_id in plan_ids) if plan]
+
+    @abstractmethod
+    def load_image(self, image_hash):
+        """Bytes of a stored image or thumbnail, or None if they have gone missing."""
+
+    @abstractmethod
+    def image_path(self, image_hash):
+        """Local file holding a stored image, for serving it without loading it."""
+
+    @abstractmethod
+    def export_path(self, plan_id, extension):
+        """Local path where derived files for a plan (e.g. PDF exports) are cached."""
+
+    @abstractmethod
+    def delete(self, plan_id):
+        """Remove a plan, its exports and any blobs no other plan uses."""
+
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS plans (
+    id TEXT PRIMARY KEY,
+    timestamp TEXT NOT NULL,
+    specs TEXT NOT NULL,
+    thumbnail_hash TEXT,
+    owner TEXT,
+    spec TEXT
+);
+CREATE TABLE IF NOT EXISTS plan_pages (
+    plan_id TEXT NOT NULL REFERENCES plans(id) ON DELETE CASCADE,
+    page INTEGER NOT NULL,
+    label TEXT,
+    image_hash TEXT NOT NULL,
+    display_hash TEXT,
+    mime TEXT,
+    source_bytes INTEGER,
+    PRIMARY KEY (plan_id, page)
+);
+CREATE INDEX IF NOT EXISTS plan_pages_image ON plan_pages(image_hash);
+"""
+PAGE_COLUMNS = ("label", "image_hash", "display_hash", "mime", "source_bytes")
+
+
+def _thumbnail(pages):
+    try:
+        return make_thumbnail(pages[0][1])
+    except Exception:
+        return None  # not an image Pillow can read; the UI falls back to the full image
+
+
+def _prepare_page(page):
+    label, data = page[0], page[1]
+    source_bytes = page[2] if len(page) > 2 else None
+    try:
+        display = display_variant(data)
+    except Exception:
+        display = None
+    return label, data, display, image_mime(data), source_bytes
+
+
+class SQLitePlanStore(PlanRepository):
+    """Default backend: `plans.db` plus a `blobs/` directory under `directory`."""
+
+    def __init__(self, directory):
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+        self.db_path = os.path.join(directory, "plans.db")
+        self.blobs = BlobStore(os.path.join(directory, "blobs"))
+        with self._connect() as db:
+            # Readers don't block the writer, so several processes can share the file
+            db.execute("PRAGMA journal_mode = WAL")
+            db.executescript(SCHEMA)
+            self._migrate(db)
+
+    def _migrate(self, db):
+        columns = {row["name"] for row in db.execute("PRAGMA table_info(plans)")}
+        if "thumbnail_hash" not in columns:
+            db.execute("ALTER TABLE plans ADD COLUMN thumbnail_hash TEXT")
+        if "owner" not in columns:
+            db.execute("ALTER TABLE plans ADD COLUMN owner TEXT")
+        if "spec" not in columns:
+            db.execute("ALTER TABLE plans ADD COLUMN spec TEXT")
+        page_columns = {row["name"] for row in db.execute("PRAGMA table_info(plan_pages)")}
+        for column, kind in (("display_hash", "TEXT"), ("mime", "TEXT"), ("source_bytes", "INTEGER")):
+            if column not in page_columns:
+                db.execute(f"ALTER TABLE plan_pages ADD COLUMN {column} {kind}")
+        db.execute("CREATE INDEX IF NOT EXISTS plan_pages_display ON plan_pages(display_hash)")
+        db.execute("CREATE INDEX IF NOT EXISTS plans_thumbnail ON plans(thumbnail_hash)")
+        db.execute("CREATE INDEX IF NOT EXISTS plans_owner ON plans(owner, timestamp)")
+
+    @contextmanager
+    def _connect(self, immediate=False):
+        # A short-lived connection per call keeps the store safe to share
+        # between Streamlit's session threads
+        db = sqlite3.connect(self.db_path, timeout=30)
+        db.row_factory = sqlite3.Row
+        db.execute("PRAGMA foreign_keys = ON")
+        try:
+            with db:
+                if immediate:
+                    # Take the write lock up front; blob files change under it (see delete)
+                    db.execute("BEGIN IMMEDIATE")
+                yield db
+        finally:
+            db.close()
+
+    def save(self, specs, pages, timestamp=None, thumbnail=None, owner=None, spec=None):
+        plan_id = uuid.uuid4().hex
+        timestamp = timestamp or datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+        # Resize every page and the thumbnail on the image pool at once
+        thumbnail_future = IMAGE_POOL.submit(_thumbnail, pages) if thumbnail is None else None
+        prepared = list(IMAGE_POOL.map(_prepare_page, pages))
+        if thumbnail_future is not None:
+            thumbnail = thumbnail_future.result()
+        with self._connect(immediate=True) as db:
+            # Blob files are written under the write lock, so a concurrent
+            # delete can't remove one between the write and the rows that use it
+            rows = [
+                (plan_id, n, label, self.blobs.put(data), display and self.blobs.put(display), mime, source_bytes)
+                for n, (label, data, display, mime, source_bytes) in enumerate(prepared)
+            ]
+            thumbnail_hash = self.blobs.put(thumbnail) if thumbnail else None
+            db.execute(
+                "INSERT INTO plans (id, timestamp, specs, thumbnail_hash, owner, spec) VALUES (?, ?, ?, ?, ?, ?)",
+                (plan_id, timestamp, json.dumps(specs), thumbnail_hash, owner, json.dumps(spec) if spec else None),
+            )
+            db.executemany(
+                "INSERT INTO plan_pages (plan_id, page, label, image_hash, display_hash, mime, source_bytes)"
+                " VALUES (?, ?, ?, ?, ?, ?, ?)",
+                rows,
+            )
+        return plan_id
+
+    def _pages(self, db, plan_id):
+        rows = db.execute(
+            f"SELECT {', '.join(PAGE_COLUMNS)} FROM plan_pages WHERE plan_id = ? ORDER BY page", (plan_id,)
+        )
+        return [{name: row[name] for name in PAGE_COLUMNS} for row in rows]
+
+    def _plan(self, row, pages):
+        return {
+            "id": row["id"],
+            "timestamp": row["timestamp"],
+            "specs": json.loads(row["specs"]),
+            "thumbnail_hash": row["thumbnail_hash"],
+            "owner": row["owner"],
+            "spec": json.loads(row["spec"]) if row["spec"] else None,
+            "pages": pages,
+        }
+
+    def get(self, plan_id):
+        with self._connect() as db:
+            row = db.execute("SELECT * FROM plans WHERE id = ?", (plan_id,)).fetchone()
+            if row is None:
+                return None
+            return self._plan(row, self._pages(db, plan_id))
+
+    def plan_ids(self, owner):
+        with self._connect() as db:
+            rows = db.execute(
+                "SELECT id FROM plans WHERE owner = ? ORDER BY timestamp DESC, rowid DESC", (owner,)
+            )
+            return [row["id"] for row in rows]
+
+    def get_many(self, plan_ids):
+        # Two queries for the whole page of plans instead of two per plan
+        plan_ids = list(plan_ids)
+        if not plan_ids:
+            return []
+        marks = ",".join("?" * len(plan_ids))
+        with self._connect() as db:
+            rows = {row["id"]: row for row in db.execute(f"SELECT * FROM plans WHERE id IN ({marks})", plan_ids)}
+            pages = {}
+            for page in db.execute(
+                f"SELECT plan_id, {', '.join(PAGE_COLUMNS)} FROM plan_pages WHERE plan_id IN ({marks}) ORDER BY page",
+                plan_ids,
+            ):
+                pages.setdefault(page["plan_id"], []).append({name: page[name] for name in PAGE_COLUMNS})
+        return [self._plan(rows[plan_id], pages.get(plan_id, [])) for plan_id in plan_ids if plan_id in rows]
+
+    def load_image(self, image_hash):
+        try:
+            return self.blobs.get(image_hash)
+        except FileNotFoundError:
+            log.warning("Blob %s is missing from %s", image_hash, self.blobs.directory)
+            return None
+
+    def image_path(self, image_hash):
+        return self.blobs.path(image_hash)
+
+    def export_path(self, plan_id, extension):
+        return os.path.join(self.directory, "exports", f"{plan_id}.{extension}")
+
+    def delete(self, plan_id):
+        with self._connect(immediate=True) as db:
+            hashes = {
+                digest for page in self._pages(db, plan_id)
+                for digest in (page["image_hash"], page["display_hash"]) if digest
+            }
+            row = db.execute("SELECT thumbnail_hash FROM plans WHERE id = ?", (plan_id,)).fetchone()
+            if row is not None and row["thumbnail_hash"]:
+                hashes.add(row["thumbnail_hash"])
+            db.execute("DELETE FROM plans WHERE id = ?", (plan_id,))
+            # Drop blobs no other plan still points at
+            orphans = [
+                digest for digest in hashes
+                if db.execute("SELECT 1 FROM plan_pages WHERE image_hash = ? LIMIT 1", (digest,)).fetchone() is None
+                and db.execute("SELECT 1 FROM plan_pages WHERE display_hash = ? LIMIT 1", (digest,)).fetchone() is None
+                and db.execute("SELECT 1 FROM plans WHERE thumbnail_hash = ? LIMIT 1", (digest,)).fetchone() is None
+            ]
+            # Removed before the lock is released, so no save can start using them meanwhile
+            for digest in orphans:
+                self.blobs.delete(digest)
+        exports = os.path.join(self.directory, "exports")
+        if os.path.isdir(exports):
+            for name in os.listdir(exports):
+                if name.startswith(plan_id + "."):
+                    os.remove(os.path.join(exports, name))
@@ -0,0 +1,139 @@
+"""Racing and failover across image models.
+
+ProviderRouter hands each request to the healthiest models first. Up to
+`race` models are asked at the same time and the first valid result wins;
+the slower requests are cancelled. When a model fails or times out the next
+one in line takes its slot, so a dead provider costs one failed attempt
+instead of a stalled request. Rolling per-model latency and error
+statistics decide the order for the next request.
+"""
+import asyncio
+import threading
+import time
+from collections import deque
+
+WINDOW = 50  # recent attempts remembered per model
+MAX_ERROR_RATE = 0.5  # models failing more often than this go to the back of the line
+
+
+class ProviderStats:
+    """Rolling latency and error record for one model."""
+
+    def __init__(self, window=WINDOW):
+        self.latencies = deque(maxlen=window)  # seconds, successful attempts only
+        self.outcomes = deque(maxlen=window)   # True for success, False for error/timeout
+        self.wins = 0
+        self.cancelled = 0
+
+    def record(self, ok, seconds):
+        self.outcomes.append(ok)
+        if ok:
+            self.latencies.append(seconds)
+
+    @property
+    def error_rate(self):
+        return self.outcomes.count(False) / len(self.outcomes) if self.outcomes else 0.0
+
+    def latency(self, quantile=0.5):
+        if not self.latencies:
+            return None
+        ordered = sorted(self.latencies)
+        return ordered[min(int(quantile * len(ordered)), len(ordered) - 1)]
+
+
+class ProviderRouter:
+    def __init__(self, models, race=2, window=WINDOW, timeout=None):
+        if not models:
+            raise ValueError("at least one model is required")
+        self.models = list(models)
+        self.race = max(1, race)
+        self.timeout = timeout  # seconds per attempt; a model that takes longer counts as failed
+        self._stats = {model: ProviderStats(window) for model in self.models}
+        self._lock = threading.Lock()
+
+    @property
+    def primary(self):
+        return self.models[0]
+
+    @property
+    def calls_per_request(self):
+        """Provider calls one request starts at once; rate limits should charge this many."""
+        return min(self.race, len(self.models))
+
+    def ranked(self):
+        """Models in the order they should be tried.
+
+        Healthy models come first, fastest median latency first; models
+        without measurements follow in configured priority order.
+        """
+        with self._lock:
+            def rank(model):
+                stats = self._stats[model]
+                p50 = stats.latency()
+                return (stats.error_rate > MAX_ERROR_RATE, p50 is None, p50 or 0.0, self.models.index(model))
+            return sorted(self.models, key=rank)
+
+    async def _attempt(self, model, attempt):
+        started = time.perf_counter()
+        try:
+            try:
+                result = await asyncio.wait_for(attempt(model), self.timeout)
+            except asyncio.TimeoutError:
+                raise TimeoutError(f"{model} did not answer within {self.timeout:g}s") from None
+        except asyncio.CancelledError:
+            with self._lock:
+                self._stats[model].cancelled += 1
+            raise
+        except Exception:
+            with self._lock:
+                self._stats[model].record(False, time.perf_counter() - started)
+            raise
+        with self._lock:
+            self._stats[model].record(True, time.perf_counter() - started)
+        return result
+
+    async def run(self, attempt):
+        """Race `attempt(model)` across models; returns `(model, result)`.
+
+        `attempt` is an async callable that raises on failure. Attempts
+        running longer than `timeout` are cancelled and count as failures.
+        Raises RuntimeError once every model has failed.
+        """
+        waiting = self.ranked()
+        running = {}
+        errors = []
+        try:
+            while waiting or running:
+                while waiting and len(running) < self.race:
+                    model = waiting.pop(0)
+                    running[asyncio.ensure_future(self._attempt(model, attempt))] = model
+                done, _ = await asyncio.wait(running, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    model = running.pop(task)
+                    if task.exception() is None:
+                        with self._lock:
+                            self._stats[model].wins += 1
+                        return model, task.result()
+                    errors.append((model, task.exception()))
+        finally:
+            for task in running:
+                task.cancel()
+        summary = "; ".join(f"{model}: {type(e).__name__}: {e}" for model, e in errors)
+        raise RuntimeError(f"All image models failed ({summary})") from errors[-1][1]
+
+    def stats(self):
+        """Per-model snapshot, in the order the next request will use."""
+        order = self.ranked()
+        with self._lock:
+            return [
+                {
+                    "model": model,
+                    "attempts": len(self._stats[model].outcomes),
+                    "error_rate": self._stats[model].error_rate,
+                    "p50": self._stats[model].latency(0.5),
+                    "p95": self._stats[model].latency(0.95),
+                    "wins": self._stats[model].wins,
+                    "cancelled": self._stats[model].cancelled,
+                }
+                for model in order
+            ]
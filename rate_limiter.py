@@ -0,0 +1,169 @@
+"""Token-bucket rate limiting with a FIFO admission queue.
+
+Requests to the image provider take tokens from a bucket that refills at
+`rate` tokens per second up to `burst`. Callers wait in arrival order; only
+the head of the queue may take tokens, so a large request is not starved
+by a stream of small ones. While waiting, `on_wait(position, eta)` is
+called so the UI can show the caller's place in line.
+
+AdmissionQueue limits one process. SQLiteAdmissionQueue keeps the bucket
+and the queue in a SQLite file so several app processes on one machine
+share a single limit.
+"""
+import threading
+import time
+from collections import OrderedDict
+
+from storage_utils import immediate_transaction, open_wal
+
+POLL_INTERVAL = 0.25  # seconds between queue checks while waiting
+STALE_AFTER = 30  # seconds; tickets of crashed processes are dropped after this
+
+
+class AdmissionQueue:
+    def __init__(self, rate, burst=1, poll=POLL_INTERVAL):
+        if rate <= 0:
+            raise ValueError("rate must be positive")
+        self.rate = rate
+        self.burst = max(1, burst)
+        self.poll = poll
+        self.admitted = 0
+        self.waited = 0.0  # total seconds spent queuing by admitted callers
+        self._tokens = float(self.burst)
+        self._updated = time.monotonic()
+        self._queue = OrderedDict()  # ticket -> cost, in arrival order
+        self._next_ticket = 0
+        self._lock = threading.Lock()
+
+    def _refill(self):
+        now = time.monotonic()
+        self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def _enter(self, cost):
+        with self._lock:
+            ticket = self._next_ticket
+            self._next_ticket += 1
+            self._queue[ticket] = cost
+            return ticket
+
+    def _leave(self, ticket):
+        with self._lock:
+            self._queue.pop(ticket, None)
+
+    def _try(self, ticket, cost):
+        """Take tokens if `ticket` is at the head; returns (admitted, position, eta)."""
+        with self._lock:
+            self._refill()
+            if next(iter(self._queue)) == ticket and self._tokens >= min(cost, self.burst):
+                self._tokens -= cost
+                del self._queue[ticket]
+                return True, 0, 0.0
+            position = needed = 0
+            for other, other_cost in self._queue.items():
+                position += 1
+                needed += other_cost
+                if other == ticket:
+                    break
+            return False, position, max(0.0, needed - self._tokens) / self.rate
+
+    def admit(self, cost=1, timeout=None, on_wait=None):
+        """Block until `cost` tokens are granted; returns the seconds waited.
+
+        Raises TimeoutError if that takes longer than `timeout`. A request
+        larger than the burst size goes ahead once the bucket is full and
+        leaves it in debt, which delays the callers behind it.
+        """
+        if cost <= 0:
+            return 0.0
+        started = time.monotonic()
+        ticket = self._enter(cost)
+        try:
+            while True:
+                admitted, position, eta = self._try(ticket, cost)
+                waited = time.monotonic() - started
+                if admitted:
+                    with self._lock:
+                        self.admitted += 1
+                        self.waited += waited
+                    return waited
+                if timeout is not None and waited >= timeout:
+                    raise TimeoutError(f"Still #{position} in the generation queue after {timeout:.0f}s")
+                if on_wait is not None:
+                    on_wait(position, eta)
+                time.sleep(max(0.01, min(self.poll, eta)))
+        finally:
+            self._leave(ticket)
+
+    def stats(self):
+        with self._lock:
+            return {
+                "waiting": len(self._queue),
+                "admitted": self.admitted,
+                "avg_wait": self.waited / self.admitted if self.admitted else 0.0,
+            }
+
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS bucket (
+    id INTEGER PRIMARY KEY CHECK (id = 1),
+    tokens REAL NOT NULL,
+    updated REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS tickets (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    cost REAL NOT NULL,
+    seen REAL NOT NULL
+);
+"""
+
+
+class SQLiteAdmissionQueue(AdmissionQueue):
+    """AdmissionQueue whose bucket and queue live in a shared SQLite file."""
+
+    def __init__(self, path, rate, burst=1, poll=POLL_INTERVAL):
+        super().__init__(rate, burst, poll)
+        self.path = path
+        # WAL like the other shared databases, so processes don't serialize on reads
+        db = open_wal(path)
+        try:
+            db.executescript(SCHEMA)
+        finally:
+            db.close()
+        with self._transaction() as db:
+            db.execute("INSERT OR IGNORE INTO bucket (id, tokens, updated) VALUES (1, ?, ?)", (self.burst, time.time()))
+
+    def _transaction(self):
+        return immediate_transaction(self.path)
+
+    def _enter(self, cost):
+        with self._transaction() as db:
+            return db.execute("INSERT INTO tickets (cost, seen) VALUES (?, ?)", (cost, time.time())).lastrowid
+
+    def _leave(self, ticket):
+        with self._transaction() as db:
+            db.execute("DELETE FROM tickets WHERE id = ?", (ticket,))
+
+    def _try(self, ticket, cost):
+        now = time.time()
+        with self._transaction() as db:
+            db.execute("DELETE FROM tickets WHERE seen < ?", (now - STALE_AFTER,))
+            db.execute("UPDATE tickets SET seen = ? WHERE id = ?", (now, ticket))
+            tokens, updated = db.execute("SELECT tokens, updated FROM bucket WHERE id = 1").fetchone()
+            tokens = min(self.burst, tokens + max(0.0, now - updated) * self.rate)
+            head = db.execute("SELECT MIN(id) FROM tickets").fetchone()[0]
+            if head == ticket and tokens >= min(cost, self.burst):
+                db.execute("UPDATE bucket SET tokens = ?, updated = ? WHERE id = 1", (tokens - cost, now))
+                db.execute("DELETE FROM tickets WHERE id = ?", (ticket,))
+                return True, 0, 0.0
+            db.execute("UPDATE bucket SET tokens = ?, updated = ? WHERE id = 1", (tokens, now))
+            position, needed = db.execute(
+                "SELECT COUNT(*), COALESCE(SUM(cost), 0) FROM tickets WHERE id <= ?", (ticket,)
+            ).fetchone()
+            return False, position, max(0.0, needed - tokens) / self.rate
+
+    def stats(self):
+        stats = super().stats()
+        with self._transaction() as db:
+            stats["waiting"] = db.execute("SELECT COUNT(*) FROM tickets").fetchone()[0]
+        return stats
@@ -0,0 +1,59 @@
+"""File and SQLite helpers shared by the on-disk stores.
+
+The plan cache, plan store, job queue and admission queue can all be shared
+by several app processes, so their writes go through the same two
+primitives. Files are replaced atomically, and write transactions take
+SQLite's write lock up front.
+"""
+import os
+import sqlite3
+import tempfile
+from contextlib import contextmanager
+
+
+def write_atomic(path, data):
+    """Write `data` to `path` through a temporary file, so readers never see a partial file."""
+    directory = os.path.dirname(path) or "."
+    fd, tmp = tempfile.mkstemp(dir=directory, suffix=".tmp")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            f.write(data)
+        os.replace(tmp, path)
+    except BaseException:
+        if os.path.exists(tmp):
+            os.remove(tmp)
+        raise
+
+
+def open_wal(path):
+    """Connection to the SQLite file at `path`, switched to WAL mode.
+
+    Readers then don't block the writer, so several processes can share the file.
+    """
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    db = sqlite3.connect(path, timeout=30)
+    db.execute("PRAGMA journal_mode = WAL")
+    return db
+
+
+@contextmanager
+def immediate_transaction(path):
+    """Short-lived connection to `path` holding the write lock (BEGIN IMMEDIATE) until commit.
+
+    Concurrent writers in other processes queue up on the lock instead of
+    failing halfway through a read-modify-write.
+    """
+    db = sqlite3.connect(path, timeout=30, isolation_level=None)
+    db.row_factory = sqlite3.Row
+    try:
+        db.execute("BEGIN IMMEDIATE")
+        yield db
+        db.execute("COMMIT")
+    except BaseException:
+        if db.in_transaction:
+            db.execute("ROLLBACK")
+        raise
+    finally:
+        db.close()
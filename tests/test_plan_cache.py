@@ -0,0 +1,26 @@
+from dataclasses import replace
+
+from plan_cache import cache_key
+from plan_generator import PlanSpec
+
+
+def test_cache_key_ignores_whitespace_and_ordering():
+    a = {"house_style": "Modern", "selected_rooms": ["kitchen", "2 bedrooms"], "special_instructions": "big  windows "}
+    b = {"special_instructions": " big windows", "selected_rooms": ["2 bedrooms", "kitchen"], "house_style": "Modern"}
+    assert cache_key(a, "flux") == cache_key(b, "flux")
+
+
+def test_cache_key_depends_on_values_and_model():
+    specs = {"length": 50, "selected_rooms": ["kitchen"]}
+    assert cache_key(specs, "flux") != cache_key(specs, "sdxl-turbo")
+    assert cache_key(specs, "flux") != cache_key({**specs, "length": 60}, "flux")
+    assert cache_key(specs, "flux") != cache_key({**specs, "selected_rooms": ["kitchen", "pantry"]}, "flux")
+
+
+def test_spec_cache_key_only_covers_image_inputs():
+    spec = PlanSpec()
+    # The city only affects cost tables, not the image
+    assert spec.cache_key() == replace(spec, city="Madurai").cache_key()
+    assert spec.cache_key() == replace(spec, features=" walk-in closet,pantry ,  large windows").cache_key()
+    assert spec.cache_key() != replace(spec, bedrooms=4).cache_key()
+    assert spec.cache_key() != replace(spec, floor=1).cache_key()
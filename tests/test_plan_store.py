@@ -0,0 +1,86 @@
+import os
+from io import BytesIO
+
+import pytest
+from PIL import Image
+
+from plan_store import SQLitePlanStore
+
+
+def png(color, size=(64, 48)):
+    buffer = BytesIO()
+    Image.new("RGB", size, color).save(buffer, "PNG")
+    return buffer.getvalue()
+
+
+@pytest.fixture
+def store(tmp_path):
+    return SQLitePlanStore(str(tmp_path / "store"))
+
+
+def test_save_and_get_round_trip(store):
+    spec = {"bedrooms": 3, "city": "Chennai"}
+    plan_id = store.save({"style": "Modern"}, [("Ground Floor", png("red"), 1234)], owner="alice", spec=spec)
+
+    plan = store.get(plan_id)
+    assert plan["specs"] == {"style": "Modern"}
+    assert plan["spec"] == spec
+    assert plan["owner"] == "alice"
+    assert plan["thumbnail_hash"] is not None
+    [page] = plan["pages"]
+    assert page["label"] == "Ground Floor"
+    assert page["mime"] == "image/png"
+    assert page["source_bytes"] == 1234
+    assert store.load_image(page["image_hash"]) == png("red")
+    assert store.get("no-such-plan") is None
+
+
+def test_get_many_keeps_requested_order_and_skips_unknown_ids(store):
+    first = store.save({"n": 1}, [(None, png("red"))])
+    second = store.save({"n": 2}, [("Ground Floor", png("green")), ("First Floor", png("blue"))])
+
+    plans = store.get_many([second, "missing", first])
+    assert [plan["id"] for plan in plans] == [second, first]
+    assert [page["label"] for page in plans[0]["pages"]] == ["Ground Floor", "First Floor"]
+    assert store.get_many([]) == []
+
+
+def test_plan_ids_lists_an_owners_plans_newest_first(store):
+    old = store.save({}, [(None, png("red"))], timestamp="2024-01-01 10:00:00", owner="alice")
+    new = store.save({}, [(None, png("green"))], timestamp="2024-01-02 10:00:00", owner="alice")
+    store.save({}, [(None, png("blue"))], owner="bob")
+    assert store.plan_ids("alice") == [new, old]
+
+
+def test_delete_keeps_blobs_another_plan_shares(store):
+    shared, own = png("red"), png("green")
+    first = store.save({}, [(None, shared)])
+    second = store.save({}, [(None, shared), (None, own)])
+    own_hash = store.get(second)["pages"][1]["image_hash"]
+
+    store.delete(first)
+    assert store.get(first) is None
+    shared_hash = store.get(second)["pages"][0]["image_hash"]
+    assert store.load_image(shared_hash) == shared
+
+    store.delete(second)
+    assert not os.path.exists(store.image_path(shared_hash))
+    assert not os.path.exists(store.image_path(own_hash))
+
+
+def test_delete_removes_exports(store):
+    plan_id = store.save({}, [(None, png("red"))])
+    path = store.export_path(plan_id, "pdf")
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "wb") as f:
+        f.write(b"%PDF")
+
+    store.delete(plan_id)
+    assert not os.path.exists(path)
+
+
+def test_missing_blob_loads_as_none(store):
+    plan_id = store.save({}, [(None, png("red"))])
+    image_hash = store.get(plan_id)["pages"][0]["image_hash"]
+    os.remove(store.image_path(image_hash))
+    assert store.load_image(image_hash) is None
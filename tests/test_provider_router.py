@@ -0,0 +1,32 @@
+import asyncio
+import time
+
+import pytest
+
+from provider_router import ProviderRouter
+
+
+async def stub_attempt(model):
+    # "hang" never answers; every other model answers at once
+    if model == "hang":
+        await asyncio.Event().wait()
+    return f"{model} image"
+
+
+def test_hanging_model_fails_over_after_timeout():
+    router = ProviderRouter(["hang", "ok"], race=1, timeout=0.2)
+    started = time.monotonic()
+    model, result = asyncio.run(router.run(stub_attempt))
+    assert (model, result) == ("ok", "ok image")
+    assert time.monotonic() - started < 2
+
+    stats = {s["model"]: s for s in router.stats()}
+    assert stats["hang"]["attempts"] == 1
+    assert stats["hang"]["error_rate"] == 1.0
+    assert router.ranked() == ["ok", "hang"]
+
+
+def test_every_model_hanging_raises():
+    router = ProviderRouter(["hang"], race=1, timeout=0.1)
+    with pytest.raises(RuntimeError, match="did not answer within"):
+        asyncio.run(router.run(stub_attempt))
@@ -0,0 +1,51 @@
+import threading
+import time
+
+import pytest
+
+from rate_limiter import AdmissionQueue, SQLiteAdmissionQueue
+
+
+@pytest.fixture(params=["memory", "sqlite"])
+def make_queue(request, tmp_path):
+    def make(rate, burst):
+        if request.param == "sqlite":
+            return SQLiteAdmissionQueue(str(tmp_path / "rate_limit.db"), rate, burst, poll=0.01)
+        return AdmissionQueue(rate, burst, poll=0.01)
+    return make
+
+
+def test_burst_is_admitted_without_waiting(make_queue):
+    queue = make_queue(rate=1, burst=3)
+    assert queue.admit(3) < 0.1
+
+
+def test_callers_are_admitted_in_arrival_order(make_queue):
+    queue = make_queue(rate=5, burst=2)
+    queue.admit(2)  # empty the bucket
+    order, positions = [], []
+
+    def admit(name, cost, on_wait=None):
+        queue.admit(cost, timeout=5, on_wait=on_wait)
+        order.append(name)
+
+    big = threading.Thread(target=admit, args=("big", 2))
+    big.start()
+    time.sleep(0.05)
+    # The small request could be paid for first, but must not jump the queue
+    small = threading.Thread(target=admit, args=("small", 1, lambda position, eta: positions.append(position)))
+    small.start()
+    big.join()
+    small.join()
+
+    assert order == ["big", "small"]
+    assert positions and positions[0] == 2
+
+
+def test_admit_times_out_while_queued(make_queue):
+    queue = make_queue(rate=0.5, burst=1)
+    queue.admit(1)
+    with pytest.raises(TimeoutError):
+        queue.admit(1, timeout=0.1)
+    # The timed-out caller left the queue, so it doesn't hold up the next one
+    assert queue.admit(0) == 0.0
@@ -0,0 +1,46 @@
+from dataclasses import replace
+
+from plan_generator import EDIT, GENERATE, REUSE, PlanSpec, regeneration_steps
+
+
+def actions(steps):
+    return [(part.floor, action, old_page) for part, action, old_page in steps]
+
+
+def test_unchanged_image_inputs_are_reused():
+    old = PlanSpec(city="Chennai")
+    steps = regeneration_steps(old, False, replace(old, city="Madurai"), False)
+    assert actions(steps) == [(0, REUSE, 0)]
+    assert steps[0][0].city == "Madurai"
+
+
+def test_editable_changes_are_edited():
+    old = PlanSpec()
+    new = replace(old, color_scheme="Grayscale", house_style="Traditional")
+    assert actions(regeneration_steps(old, False, new, False)) == [(0, EDIT, 0)]
+
+
+def test_layout_changes_are_generated():
+    old = PlanSpec()
+    assert actions(regeneration_steps(old, False, replace(old, bedrooms=4), False)) == [(0, GENERATE, None)]
+    # An editable change alongside a layout change still needs a fresh image
+    new = replace(old, bedrooms=4, color_scheme="Grayscale")
+    assert actions(regeneration_steps(old, False, new, False)) == [(0, GENERATE, None)]
+
+
+def test_per_floor_plans_are_classified_floor_by_floor():
+    # 3 -> 4 bedrooms over two floors adds one to the ground floor only
+    old = PlanSpec(num_floors=2, bedrooms=3, bathrooms=2)
+    steps = regeneration_steps(old, True, replace(old, bedrooms=4), True)
+    assert actions(steps) == [(1, GENERATE, None), (2, REUSE, 1)]
+
+    steps = regeneration_steps(old, True, replace(old, color_scheme="Grayscale"), True)
+    assert actions(steps) == [(1, EDIT, 0), (2, EDIT, 1)]
+
+
+def test_floors_without_an_old_page_are_generated():
+    old = PlanSpec(num_floors=2)
+    # A whole-house image has no per-floor pages to reuse
+    assert actions(regeneration_steps(old, False, old, True)) == [(1, GENERATE, None), (2, GENERATE, None)]
+    # Nor does a per-floor plan have a whole-house page
+    assert actions(regeneration_steps(old, True, old, False)) == [(0, GENERATE, None)]